@@ -0,0 +1,78 @@
+"""NEAR account ID extraction and validation.
+
+Valid IDs are 2-64 characters of lowercase letters, digits and the separators `_`, `-` and `.`, where
+separators never start or end the ID or sit next to each other. That covers named accounts and
+sub-accounts (`alice.near`, `app.alice.near`), 64-character hex implicit accounts and `0x`-prefixed
+Ethereum-style implicit accounts.
+"""
+import re
+
+MIN_ACCOUNT_ID_LENGTH = 2
+MAX_ACCOUNT_ID_LENGTH = 64
+
+ACCOUNT_ID = re.compile(r"^(?:[a-z\d]+[-_])*[a-z\d]+(?:\.(?:[a-z\d]+[-_])*[a-z\d]+)*$")
+IMPLICIT_ACCOUNT_ID = re.compile(r"^(?:[0-9a-f]{64}|0x[0-9a-f]{40})$")
+
+# Candidates in a message, in priority order. Boundaries keep a match from starting or ending mid-ID.
+NAMED_ACCOUNT = re.compile(r"(?<![\w.-])((?:[a-z\d_-]+\.)+near)(?![\w-])", re.IGNORECASE)
+IMPLICIT_ACCOUNT = re.compile(r"(?<![\w.-])([0-9a-f]{64}|0x[0-9a-f]{40})(?![\w.-])", re.IGNORECASE)
+KEYWORD_ACCOUNTS = (
+    re.compile(r"account[:\s]+([a-z\d_.-]+)", re.IGNORECASE),
+    re.compile(r"(?:analyze|check|assess|evaluate|for)[:\s]+([a-z\d_.-]+)", re.IGNORECASE),
+)
+
+
+class InvalidAccountIdError(ValueError):
+    pass
+
+
+def is_implicit_account_id(account_id):
+    return IMPLICIT_ACCOUNT_ID.match(account_id) is not None
+
+
+def is_valid_account_id(account_id):
+    """True if account_id follows the NEAR account ID rules"""
+    return (isinstance(account_id, str)
+            and MIN_ACCOUNT_ID_LENGTH <= len(account_id) <= MAX_ACCOUNT_ID_LENGTH
+            and ACCOUNT_ID.match(account_id) is not None)
+
+
+def validate_account_id(account_id):
+    """Return account_id, or raise InvalidAccountIdError before it reaches the network"""
+    if not is_valid_account_id(account_id):
+        raise InvalidAccountIdError(f"Invalid NEAR account ID: {account_id!r}")
+    return account_id
+
+
+def normalize_candidate(candidate):
+    # Trailing sentence punctuation is not part of the ID, and IDs are always lowercase
+    return candidate.rstrip(".-_").lower()
+
+
+def extract_account_ids(message, limit=None):
+    """Return the distinct valid account IDs mentioned in a message, in priority order.
+
+    Named `.near` accounts (including sub-accounts) and implicit accounts are found anywhere. IDs
+    introduced by phrases such as "account: x" or "check x" are only accepted when they contain a
+    dot or are implicit, so ordinary words after "for" or "check" are not mistaken for accounts.
+    """
+    found = []
+    for pattern in (NAMED_ACCOUNT, IMPLICIT_ACCOUNT):
+        for match in pattern.finditer(message):
+            account_id = normalize_candidate(match.group(1))
+            if account_id not in found and is_valid_account_id(account_id):
+                found.append(account_id)
+    for pattern in KEYWORD_ACCOUNTS:
+        for match in pattern.finditer(message):
+            account_id = normalize_candidate(match.group(1))
+            if account_id in found or not is_valid_account_id(account_id):
+                continue
+            if "." in account_id or is_implicit_account_id(account_id):
+                found.append(account_id)
+    return found[:limit] if limit else found
+
+
+def extract_account_id(message):
+    """Extract the first NEAR account ID from a message, or None"""
+    account_ids = extract_account_ids(message, limit=1)
+    return account_ids[0] if account_ids else None
@@ -1,119 +1,165 @@
 import asyncio
-import re
-import traceback
-from nearai.agents.environment import Environment
+import os
+from typing import TYPE_CHECKING
+from account_ids import extract_account_ids
+from log import get_logger
+from metrics import registry, span, timed
+import rendering
+from tx_sync import TX_INTERACTIVE_BACKFILL_PAGES
 from utils import AiUtils
 
+if TYPE_CHECKING:
+    from nearai.agents.environment import Environment
+
+logger = get_logger("agent")
+
+# Send the recommendation as soon as it is ready and stream transaction rows after it
+STREAM_REPLIES = os.environ.get("DEFISHIELD_STREAM_REPLIES", "1") == "1"
+# How many recent transactions to list in the reply
+RECENT_TRANSACTIONS = int(os.environ.get("DEFISHIELD_RECENT_TRANSACTIONS", "5"))
+# How many of the accounts mentioned in one message are analyzed
+MAX_ACCOUNTS_PER_MESSAGE = int(os.environ.get("DEFISHIELD_MAX_ACCOUNTS", "3"))
+# Reply format: markdown for chat, or text/json for other consumers (see rendering.py)
+OUTPUT_FORMAT = os.environ.get("DEFISHIELD_OUTPUT_FORMAT", "markdown")
+
 # Initialize utility helper with environment and agent references
 utils = None
 
-async def agent(env: Environment):
+async def agent(env: "Environment"):
     global utils
-    print("Starting agent execution")
+    logger.debug("Starting agent execution")
     if utils is None:
-        print("Initializing AiUtils")
+        logger.debug("Initializing AiUtils")
         utils = AiUtils(env, agent)
     
+    try:
+        await handle_message(env)
+    finally:
+        # Release pooled connections before the event loop shuts down
+        await utils.close()
+        logger.debug("Metrics snapshot: %s", registry.snapshot())
+
+
+async def handle_message(env, fmt=None):
+    """Reply to the last user message with the shared `utils`, leaving it open for the next message"""
+    fmt = fmt or OUTPUT_FORMAT
     # Get the user's message
     user_message = env.get_last_message()["content"]
-    print(f"User message: {user_message}")
+    logger.debug("User message: %s", user_message)
     
-    # Check if the message contains an account ID (looking for .near or valid account ID format)
-    account_id = extract_account_id(user_message)
-    print(f"Extracted account_id: {account_id}")
+    # Find the valid NEAR account IDs in the message; invalid ones never reach the network
+    account_ids = extract_account_ids(user_message, limit=MAX_ACCOUNTS_PER_MESSAGE)
+    logger.debug("Extracted account_ids: %s", account_ids)
     
-    if not account_id:
+    if not account_ids:
         # If no account ID is found, ask the user to provide one
-        print("No account ID found, asking user to provide one")
+        logger.info("No account ID found, asking user to provide one")
         env.add_reply("To provide a staking recommendation, I need your NEAR account ID. Please provide a valid account ID (e.g., 'example.near').")
         return
     
+    for account_id in account_ids:
+        await analyze_account(env, account_id, fmt)
+
+
+async def analyze_account(env, account_id, fmt=None):
+    fmt = fmt or OUTPUT_FORMAT
     # Let the user know we're analyzing their account
-    print(f"Starting analysis for account: {account_id}")
+    logger.info("Starting analysis for account: %s", account_id)
     env.add_reply(f"Analyzing account {account_id}...\n\nRetrieving balance and recent transactions...")
     
     try:
-        # Get account balance
-        print("Fetching account balance")
-        balance = await utils.get_account_balance(account_id)
-        print(f"Account balance: {balance} NEAR")
-        
-        # Get recent transactions (last 5)
-        print("Fetching recent transactions")
-        transactions = utils.get_account_transactions(account_id, limit=5)
-        print(f"Found {len(transactions)} transactions")
-        
-        if len(transactions) == 0:
-            print("WARNING: No transactions found")
+        if STREAM_REPLIES:
+            await reply_streaming(env, account_id, fmt)
         else:
-            print(f"First transaction hash: {transactions[0].get('transaction_hash', 'Unknown')}")
-        
-        # Analyze transaction patterns
-        print("Analyzing transaction patterns")
-        transaction_analysis = utils.analyze_transactions(transactions)
-        print(f"Transaction analysis: {transaction_analysis}")
-        
-        # Make staking recommendation based on analysis
-        print("Generating staking recommendation")
-        recommendation = utils.make_staking_recommendation(balance, transaction_analysis)
-        print(f"Recommendation: {recommendation}")
-        
-        # Format transactions for display
-        print("Formatting transactions as markdown")
-        tx_markdown = utils.format_transactions_as_markdown(transactions)
-        print("Transactions formatted successfully")
-        
-        # Format the recommendation as markdown
-        print("Formatting recommendation as markdown")
-        recommendation_markdown = utils.format_recommendation_as_markdown(account_id, balance, recommendation)
-        print("Recommendation formatted successfully")
-        
-        # Add recent transactions section
-        print("Building full response")
-        full_response = recommendation_markdown + "\n\n## Recent Transactions" + tx_markdown
-        print("Full response built successfully")
-        
-        # Reply to the user with the recommendation
-        print("Sending reply to user")
-        env.add_reply(full_response)
-        print("Reply sent successfully")
+            await reply_full(env, account_id, fmt)
         
     except Exception as e:
-        print(f"ERROR: Exception occurred: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Error analyzing account %s", account_id)
         # Handle any errors that might occur during processing
         env.add_reply(f"Error analyzing account {account_id}: {str(e)}\n\nPlease verify the account ID and try again.")
 
 
-def extract_account_id(message):
-    """Extract NEAR account ID from user message"""
-    print(f"Extracting account ID from: {message}")
+async def analyze_and_recommend(account_id, balance, staking=None, fmt="markdown"):
+    # Analyze transaction patterns over the full synced history
+    logger.debug("Analyzing transaction patterns")
+    with span("analyze_transactions"):
+        transaction_analysis = await utils.analyze_account(account_id)
+    logger.debug("Transaction analysis: %s", transaction_analysis)
+    
+    # Make staking recommendation based on analysis
+    logger.debug("Generating staking recommendation")
+    with span("make_staking_recommendation"):
+        recommendation = utils.make_staking_recommendation(balance, transaction_analysis, staking)
+    logger.info("Recommendation for %s: %s", account_id, recommendation.get("recommendation"))
+    
+    # Render the recommendation (markdown unless another format was asked for)
+    with span("render_recommendation"):
+        return utils.render_recommendation(account_id, balance, recommendation, fmt)
+
+
+async def get_staking_positions(account_id):
+    """Staking positions for the recommendation, or None if the pools could not be queried"""
+    try:
+        return await utils.get_staking_positions(account_id)
+    except Exception as e:
+        logger.warning("Failed to aggregate staking positions for %s: %s", account_id, e)
+        return None
+
+
+async def reply_full(env, account_id, fmt="markdown"):
+    """Build the whole response, then send it as a single reply"""
+    # Fetch balance, recent transactions, FTs and staking data concurrently
+    logger.debug("Fetching account balance, transactions, tokens and staking data")
+    with span("fetch_overview"):
+        overview = await utils.fetch_account_overview(account_id, limit=RECENT_TRANSACTIONS,
+                                                      backfill_pages=TX_INTERACTIVE_BACKFILL_PAGES)
+    balance = overview["balance"]
+    transactions = overview["transactions"]
+    logger.info("Account %s balance: %s NEAR, %d recent transactions", account_id, balance, len(transactions))
+    
+    if len(transactions) == 0:
+        logger.warning("No transactions found for %s", account_id)
+    
+    recommendation_text = await analyze_and_recommend(account_id, balance, overview["staking"], fmt)
     
-    # Look for .near accounts
-    near_pattern = r'([a-zA-Z0-9_-]+\.near)'
-    near_match = re.search(near_pattern, message)
-    if near_match:
-        print(f"Found .near account: {near_match.group(1)}")
-        return near_match.group(1)
+    # Render transactions for display
+    with span("render_transactions"):
+        tx_text = utils.render_transactions(transactions, fmt)
     
-    # Look for account IDs that might be mentioned explicitly
-    account_pattern = r'account[:\s]+([a-zA-Z0-9_.-]+)'
-    account_match = re.search(account_pattern, message, re.IGNORECASE)
-    if account_match:
-        print(f"Found explicitly mentioned account: {account_match.group(1)}")
-        return account_match.group(1)
+    # Add recent transactions section
+    full_response = recommendation_text + rendering.get_renderer(fmt).SECTION + tx_text
+    
+    # Reply to the user with the recommendation
+    env.add_reply(full_response)
+    logger.debug("Reply sent (%d chars)", len(full_response))
+
+
+async def reply_streaming(env, account_id, fmt="markdown"):
+    """Reply with the recommendation as soon as it is ready, then stream transaction rows in chunks"""
+    # Only the balance, synced history and staking positions gate the recommendation
+    with span("fetch_overview"):
+        balance, sync_stats, staking = await asyncio.gather(
+            timed("balance_fetch", utils.get_account_balance(account_id)),
+            timed("txn_sync", utils.sync_account_transactions(account_id, backfill_pages=TX_INTERACTIVE_BACKFILL_PAGES)),
+            timed("staking_positions_fetch", get_staking_positions(account_id))
+        )
+    logger.info("Account %s balance: %s NEAR, %d synced transactions", account_id, balance, sync_stats["total"])
     
-    # Look for phrases like "analyze xyz" or "check xyz"
-    analyze_pattern = r'(?:analyze|check|assess|evaluate|for)[:\s]+([a-zA-Z0-9_.-]+)'
-    analyze_match = re.search(analyze_pattern, message, re.IGNORECASE)
-    if analyze_match:
-        print(f"Found account in analyze pattern: {analyze_match.group(1)}")
-        return analyze_match.group(1)
+    env.add_reply(await analyze_and_recommend(account_id, balance, staking, fmt))
     
-    print("No account ID pattern matched")
-    return None
+    renderer = rendering.get_renderer(fmt)
+    header = renderer.SECTION.lstrip("\n")
+    streamed = False
+    with span("stream_transactions"):
+        async for chunk in utils.stream_transactions_markdown(account_id, limit=RECENT_TRANSACTIONS, fmt=fmt):
+            env.add_reply(header + chunk if not streamed else chunk)
+            streamed = True
+    if not streamed:
+        logger.warning("No transactions found for %s", account_id)
+        if header or renderer.NO_TRANSACTIONS:
+            env.add_reply(header + renderer.NO_TRANSACTIONS)
 
 
-print("Script loaded, running agent")
-# Run the agent asynchronously
-asyncio.run(agent(env))
\ No newline at end of file
+# Run the agent asynchronously when executed by the NEAR AI runtime, which injects `env`
+if "env" in globals():
+    asyncio.run(agent(env))
\ No newline at end of file
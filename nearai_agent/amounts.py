@@ -0,0 +1,209 @@
+"""Exact fixed-point token amounts backed by Python ints.
+
+NEAR balances are yocto (10^-24) integers and FT balances are integers in the token's smallest unit,
+so everything here works on raw ints with divmod and cached powers of ten. No floats are used on
+the way in, and no global Decimal context is touched.
+"""
+from decimal import Decimal, InvalidOperation
+from fractions import Fraction
+
+NEAR_DECIMALS = 24
+DEFAULT_PLACES = 6
+
+POW10 = [10 ** i for i in range(80)]
+
+
+def parse_raw(value):
+    """Parse an API amount (int, digit string, float or exponent string) into an exact raw int"""
+    if isinstance(value, int):
+        return value
+    if value is None or value == "":
+        return 0
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    try:
+        # Floats and strings such as "1e+24" arrive from some JSON payloads; go through their repr
+        return int(Decimal(repr(value) if isinstance(value, float) else value))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Invalid amount: {value!r}")
+
+
+def format_units(raw, decimals, places=DEFAULT_PLACES, trim=True):
+    """Format a raw integer amount with `decimals` implied decimals, truncated to `places` digits"""
+    sign = "-" if raw < 0 else ""
+    whole, fraction = divmod(-raw if sign else raw, POW10[decimals])
+    if places < decimals:
+        fraction //= POW10[decimals - places]
+    else:
+        fraction *= POW10[places - decimals]
+    fraction_str = f"{fraction:0{places}d}" if places else ""
+    if trim:
+        fraction_str = fraction_str.rstrip("0")
+    return f"{sign}{whole}.{fraction_str}" if fraction_str else f"{sign}{whole}"
+
+
+def format_batch(raws, decimals, places=DEFAULT_PLACES, trim=True):
+    """Format many raw amounts that share the same decimals"""
+    unit = POW10[decimals]
+    shift = POW10[decimals - places] if places < decimals else None
+    scale = POW10[places - decimals] if places >= decimals else None
+    result = []
+    for raw in raws:
+        raw = parse_raw(raw)
+        if raw < 0:
+            result.append(format_units(raw, decimals, places, trim))
+            continue
+        whole, fraction = divmod(raw, unit)
+        fraction = fraction // shift if shift else fraction * scale
+        fraction_str = f"{fraction:0{places}d}" if places else ""
+        if trim:
+            fraction_str = fraction_str.rstrip("0")
+        result.append(f"{whole}.{fraction_str}" if fraction_str else str(whole))
+    return result
+
+
+def format_near(yocto, places=DEFAULT_PLACES):
+    return format_units(parse_raw(yocto), NEAR_DECIMALS, places)
+
+
+def to_raw(number, decimals):
+    """Convert a human-unit number (int, float, str, Amount) to raw units"""
+    if isinstance(number, Amount):
+        return number.raw * POW10[decimals] // POW10[number.decimals]
+    if isinstance(number, int):
+        return number * POW10[decimals]
+    return int(Decimal(repr(number) if isinstance(number, float) else number) * POW10[decimals])
+
+
+class Amount(object):
+    """Immutable fixed-point amount; defaults to NEAR (24 decimals).
+
+    Compares and does arithmetic with plain numbers in human units, so threshold code such as
+    `balance < 1` or `round(balance * 0.7, 2)` stays exact. Arithmetic reads a float as the decimal
+    it prints as; comparisons use its exact binary value, as int, float and Decimal do among
+    themselves, so an Amount equals and hashes like the numbers it equals. Strings never compare equal.
+    """
+
+    __slots__ = ("raw", "decimals")
+
+    def __init__(self, raw=0, decimals=NEAR_DECIMALS):
+        object.__setattr__(self, "raw", parse_raw(raw))
+        object.__setattr__(self, "decimals", decimals)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Amount is immutable")
+
+    @classmethod
+    def from_units(cls, number, decimals=NEAR_DECIMALS):
+        return cls(to_raw(number, decimals), decimals)
+
+    def _other_raw(self, other):
+        if isinstance(other, Amount):
+            if other.decimals != self.decimals:
+                return to_raw(other, self.decimals)
+            return other.raw
+        if isinstance(other, (int, float, str, Decimal)):
+            try:
+                return to_raw(other, self.decimals)
+            except (InvalidOperation, TypeError, ValueError, OverflowError):
+                # Not a number (e.g. "abc", NaN): compares unequal rather than raising
+                return None
+        return None
+
+    def __add__(self, other):
+        other_raw = self._other_raw(other)
+        return NotImplemented if other_raw is None else Amount(self.raw + other_raw, self.decimals)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        other_raw = self._other_raw(other)
+        return NotImplemented if other_raw is None else Amount(self.raw - other_raw, self.decimals)
+
+    def __rsub__(self, other):
+        other_raw = self._other_raw(other)
+        return NotImplemented if other_raw is None else Amount(other_raw - self.raw, self.decimals)
+
+    def __mul__(self, factor):
+        if isinstance(factor, Amount):
+            return NotImplemented
+        ratio = Fraction(repr(factor)) if isinstance(factor, float) else Fraction(factor)
+        return Amount(self.raw * ratio.numerator // ratio.denominator, self.decimals)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Amount(-self.raw, self.decimals)
+
+    def __round__(self, ndigits=0):
+        """Round down to `ndigits` decimal places, keeping the amount exact"""
+        step = POW10[max(self.decimals - (ndigits or 0), 0)]
+        return Amount(self.raw // step * step, self.decimals)
+
+    def _compare(self, other):
+        """-1, 0 or 1 comparing exact values, like Python's own numbers; None for non-numbers"""
+        if isinstance(other, Amount) and other.decimals == self.decimals:
+            other_raw = other.raw
+        elif isinstance(other, int):
+            other_raw = other * POW10[self.decimals]
+        elif isinstance(other, (Amount, float, Decimal, Fraction)):
+            # Floats by their binary value, not their repr, so equal values also hash equal
+            if isinstance(other, Amount):
+                other_value = Fraction(other.raw, POW10[other.decimals])
+            elif other != other:
+                return None
+            elif other in (float("inf"), float("-inf")) or (isinstance(other, Decimal) and other.is_infinite()):
+                return -1 if other > 0 else 1
+            else:
+                other_value = Fraction(other)
+            value = Fraction(self.raw, POW10[self.decimals])
+            return (value > other_value) - (value < other_value)
+        else:
+            return None
+        return (self.raw > other_raw) - (self.raw < other_raw)
+
+    def __eq__(self, other):
+        result = self._compare(other)
+        return NotImplemented if result is None else result == 0
+
+    def __lt__(self, other):
+        result = self._compare(other)
+        return NotImplemented if result is None else result < 0
+
+    def __le__(self, other):
+        result = self._compare(other)
+        return NotImplemented if result is None else result <= 0
+
+    def __gt__(self, other):
+        result = self._compare(other)
+        return NotImplemented if result is None else result > 0
+
+    def __ge__(self, other):
+        result = self._compare(other)
+        return NotImplemented if result is None else result >= 0
+
+    def __hash__(self):
+        # The exact value in human units, so an Amount hashes like the numbers and other Amounts it equals
+        return hash(Fraction(self.raw, POW10[self.decimals]))
+
+    def __bool__(self):
+        return self.raw != 0
+
+    def __float__(self):
+        return self.raw / POW10[self.decimals]
+
+    def format(self, places=DEFAULT_PLACES, trim=True):
+        return format_units(self.raw, self.decimals, places, trim)
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return f"Amount({self.format(self.decimals)}, decimals={self.decimals})"
+
+
+def json_default(value):
+    """json.dumps default hook: amounts serialize as exact decimal strings"""
+    if isinstance(value, Amount):
+        return value.format(value.decimals)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
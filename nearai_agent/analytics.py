@@ -0,0 +1,192 @@
+import time
+
+import numpy as np
+
+from amounts import parse_raw
+
+ACTION_KINDS = (
+    "TRANSFER",
+    "FUNCTION_CALL",
+    "STAKE",
+    "ADD_KEY",
+    "DELETE_KEY",
+    "CREATE_ACCOUNT",
+    "DEPLOY_CONTRACT",
+    "DELETE_ACCOUNT",
+    "unknown",
+)
+ACTION_CODES = {kind: code for code, kind in enumerate(ACTION_KINDS)}
+
+NS_PER_SECOND = 10**9
+YOCTO_PER_NEAR = 10**24
+# Deposits are stored as three base-10^12 int64 limbs so sums stay exact without Python ints per row
+YOCTO_LIMB = 10**12
+
+ACTIVITY_WINDOWS = {
+    "1d": 24 * 60 * 60,
+    "7d": 7 * 24 * 60 * 60,
+    "30d": 30 * 24 * 60 * 60,
+    "90d": 90 * 24 * 60 * 60,
+}
+
+INFLOW = 1
+OUTFLOW = -1
+
+
+def split_yocto(amount):
+    """Split a yocto amount into (high, middle, low) base-10^12 limbs"""
+    high, rest = divmod(int(amount), YOCTO_LIMB * YOCTO_LIMB)
+    middle, low = divmod(rest, YOCTO_LIMB)
+    return high, middle, low
+
+
+def join_yocto(limbs):
+    """Recombine summed limbs into an exact yocto integer"""
+    high, middle, low = (int(limb) for limb in limbs)
+    return (high * YOCTO_LIMB + middle) * YOCTO_LIMB + low
+
+
+def get_action_deposit(action):
+    deposit = action.get("deposit")
+    if deposit is None:
+        args = action.get("args")
+        if isinstance(args, dict):
+            deposit = args.get("deposit")
+    try:
+        return parse_raw(deposit)
+    except (TypeError, ValueError):
+        return 0
+
+
+class TransactionColumns(object):
+    """Columnar view of a transaction list: one row per transaction and one row per action"""
+
+    def __init__(self, timestamps, directions, action_tx, action_codes, deposits):
+        self.timestamps = timestamps
+        self.directions = directions
+        self.action_tx = action_tx
+        self.action_codes = action_codes
+        self.deposits = deposits
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def sort_by_time(self):
+        """The same columns with transactions in timestamp order and actions grouped in that order"""
+        order = np.argsort(self.timestamps, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        action_tx = rank[self.action_tx]
+        action_order = np.argsort(action_tx, kind="stable")
+        return TransactionColumns(self.timestamps[order], self.directions[order], action_tx[action_order],
+                                  self.action_codes[action_order], self.deposits[action_order])
+
+    def prefix(self, count):
+        """Views of the first `count` transactions and their actions; the columns must be sorted by time"""
+        actions_end = int(np.searchsorted(self.action_tx, count, side="left"))
+        return TransactionColumns(self.timestamps[:count], self.directions[:count], self.action_tx[:actions_end],
+                                  self.action_codes[:actions_end], self.deposits[:actions_end])
+
+    def deposits_near(self):
+        """Per-action deposits in float NEAR; the high limb counts whole NEAR"""
+        limbs = self.deposits.astype(np.float64)
+        return limbs[:, 0] + limbs[:, 1] / YOCTO_LIMB + limbs[:, 2] / YOCTO_PER_NEAR
+
+    @classmethod
+    def from_transactions(cls, transactions, account_id=None):
+        timestamps = []
+        directions = []
+        action_tx = []
+        action_codes = []
+        deposits = []
+        unknown = ACTION_CODES["unknown"]
+
+        for i, tx in enumerate(transactions):
+            timestamps.append(int(tx.get("block_timestamp", 0) or 0))
+            if account_id is None:
+                directions.append(0)
+            elif tx.get("signer_account_id", tx.get("predecessor_account_id")) == account_id:
+                directions.append(OUTFLOW)
+            elif tx.get("receiver_account_id") == account_id:
+                directions.append(INFLOW)
+            else:
+                directions.append(0)
+
+            for action in tx.get("actions") or []:
+                action_tx.append(i)
+                action_codes.append(ACTION_CODES.get(action.get("action", "unknown"), unknown))
+                deposits.append(split_yocto(get_action_deposit(action)))
+
+        return cls(
+            np.asarray(timestamps, dtype=np.int64),
+            np.asarray(directions, dtype=np.int8),
+            np.asarray(action_tx, dtype=np.int64),
+            np.asarray(action_codes, dtype=np.int8),
+            np.asarray(deposits, dtype=np.int64).reshape(-1, 3),
+        )
+
+
+def sum_deposits(deposits, mask):
+    return join_yocto(deposits[mask].sum(axis=0)) if mask.any() else 0
+
+
+def compute_transaction_stats(columns, now_ns=None):
+    """Compute histograms, inter-arrival statistics, activity windows and flow totals in batch"""
+    if now_ns is None:
+        now_ns = time.time_ns()
+    n = len(columns)
+
+    histogram = np.bincount(columns.action_codes, minlength=len(ACTION_KINDS))
+    action_histogram = {kind: int(count) for kind, count in zip(ACTION_KINDS, histogram) if count}
+
+    timestamps = np.sort(columns.timestamps)
+    windows = {}
+    for name, seconds in ACTIVITY_WINDOWS.items():
+        windows[name] = int(n - np.searchsorted(timestamps, now_ns - seconds * NS_PER_SECOND, side="left"))
+
+    inter_arrival = None
+    peak_7d = int(n > 0)
+    if n >= 2:
+        gaps = np.diff(timestamps) / NS_PER_SECOND
+        inter_arrival = {
+            "mean_s": float(gaps.mean()),
+            "median_s": float(np.median(gaps)),
+            "p90_s": float(np.percentile(gaps, 90)),
+            "std_s": float(gaps.std()),
+        }
+        # Busiest 7-day stretch: for each tx, how many txs start within the next 7 days
+        window_ns = ACTIVITY_WINDOWS["7d"] * NS_PER_SECOND
+        ends = np.searchsorted(timestamps, timestamps + window_ns, side="left")
+        peak_7d = int((ends - np.arange(n)).max())
+
+    action_directions = columns.directions[columns.action_tx] if len(columns.action_tx) else columns.action_tx
+    action_timestamps = columns.timestamps[columns.action_tx] if len(columns.action_tx) else columns.action_tx
+    inflow_mask = action_directions == INFLOW
+    outflow_mask = action_directions == OUTFLOW
+    recent_mask = action_timestamps >= now_ns - ACTIVITY_WINDOWS["30d"] * NS_PER_SECOND
+
+    inflow_yocto = sum_deposits(columns.deposits, inflow_mask)
+    outflow_yocto = sum_deposits(columns.deposits, outflow_mask)
+    outflow_30d_yocto = sum_deposits(columns.deposits, outflow_mask & recent_mask)
+
+    return {
+        "count": n,
+        "action_count": int(len(columns.action_codes)),
+        "action_histogram": action_histogram,
+        "first_timestamp": int(timestamps[0]) if n else None,
+        "last_timestamp": int(timestamps[-1]) if n else None,
+        "inter_arrival": inter_arrival,
+        "windows": windows,
+        "peak_7d": peak_7d,
+        "inflow_yocto": inflow_yocto,
+        "outflow_yocto": outflow_yocto,
+        "outflow_30d_yocto": outflow_30d_yocto,
+        "inflow_near": inflow_yocto / YOCTO_PER_NEAR,
+        "outflow_near": outflow_yocto / YOCTO_PER_NEAR,
+        "outflow_30d_near": outflow_30d_yocto / YOCTO_PER_NEAR,
+    }
+
+
+def analyze(transactions, account_id=None, now_ns=None):
+    """Load transactions into columns and compute their statistics"""
+    return compute_transaction_stats(TransactionColumns.from_transactions(transactions, account_id), now_ns)
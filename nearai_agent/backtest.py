@@ -0,0 +1,330 @@
+"""Offline backtest of the staking recommender over recorded transaction archives.
+
+Usage:
+    python backtest.py archive.jsonl --step-days 7 --workers 8
+    python backtest.py archive.parquet --accounts accounts.txt --balances balances.jsonl
+    python backtest.py archive.jsonl --threshold partial_fraction=0.6 -o report.json
+
+The archive holds NearBlocks-style transactions (block_timestamp, signer_account_id,
+receiver_account_id, actions), one JSON object per line or one row per transaction in Parquet
+(needs pyarrow). It is read in chunks and spilled to per-account-hash partition files, so each
+account's history ends up in exactly one partition. A process pool then replays every partition:
+for each account, analyze_transactions and the recommendation rules are re-run at sliding points in
+time (every --step-days), each seeing only the history up to that point.
+
+Balances are reconstructed from deposits: backwards from a current balance (--balances JSONL of
+{"account_id", "balance"} in yoctoNEAR) or forwards from --initial-balance NEAR. Gas fees and staking
+rewards are not modelled. The report counts recommendations by rule, month and activity level, how
+often an account's recommendation changed, and how often a recommended stake would have left less
+liquid NEAR than the account spent over the next 30 days. Memory is bounded by the largest partition.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from analytics import ACTIVITY_WINDOWS, NS_PER_SECOND, OUTFLOW, INFLOW, TransactionColumns, compute_transaction_stats
+from log import get_logger
+from recommendation import FeatureFrame, RecommendationEngine, load_rules_config
+from utils import classify_activity
+
+logger = get_logger("backtest")
+
+BACKTEST_CHUNK_ROWS = 10000
+BACKTEST_STEP_DAYS = 7
+BACKTEST_WORKERS = os.cpu_count() or 1
+# Partitions per worker; more partitions mean smaller ones and better load balance
+PARTITIONS_PER_WORKER = 4
+# How far ahead a recommendation's liquidity is checked against actual outflows
+OUTCOME_WINDOW_NS = ACTIVITY_WINDOWS["30d"] * NS_PER_SECOND
+# Only the fields the analysis reads are spilled to the partitions
+ACTION_FIELDS = ("action", "deposit", "args")
+
+
+def read_jsonl_chunks(path, chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Yield lists of up to chunk_rows transactions from a JSONL archive"""
+    chunk = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except ValueError as e:
+                logger.warning("Skipping line %d of %s: %s", line_number, path, e)
+                continue
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_parquet_chunks(path, chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Yield lists of up to chunk_rows transactions from a Parquet archive"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet archives requires pyarrow (pip install pyarrow)")
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+        chunk = batch.to_pylist()
+        for tx in chunk:
+            # Actions may be stored as a JSON string column rather than a list of structs
+            if isinstance(tx.get("actions"), str):
+                tx["actions"] = json.loads(tx["actions"])
+        yield chunk
+
+
+def read_chunks(path, chunk_rows=BACKTEST_CHUNK_ROWS):
+    if path.endswith(".parquet") or path.endswith(".pq"):
+        return read_parquet_chunks(path, chunk_rows)
+    return read_jsonl_chunks(path, chunk_rows)
+
+
+def get_partition(account_id, partitions):
+    # crc32 rather than hash(): it is stable across the worker processes
+    return zlib.crc32(account_id.encode()) % partitions
+
+
+def slim_transaction(tx):
+    return {
+        "block_timestamp": tx.get("block_timestamp"),
+        "signer_account_id": tx.get("signer_account_id", tx.get("predecessor_account_id")),
+        "receiver_account_id": tx.get("receiver_account_id"),
+        "actions": [{key: action[key] for key in ACTION_FIELDS if key in action} for action in tx.get("actions") or []]
+    }
+
+
+def partition_archive(path, directory, partitions, accounts=None, balances_path=None,
+                      chunk_rows=BACKTEST_CHUNK_ROWS):
+    """Spill the archive (and balances) into per-account partition files; returns (paths, rows, end_ns)"""
+    paths = [os.path.join(directory, f"partition-{i:04d}.jsonl") for i in range(partitions)]
+    files = [open(partition_path, "w") for partition_path in paths]
+    rows = 0
+    end_ns = 0
+    try:
+        for chunk in read_chunks(path, chunk_rows):
+            for tx in chunk:
+                slim = slim_transaction(tx)
+                line = json.dumps(slim, separators=(",", ":"))
+                end_ns = max(end_ns, int(slim["block_timestamp"] or 0))
+                # Each transaction belongs to the history of both its signer and its receiver
+                for account_id in {slim["signer_account_id"], slim["receiver_account_id"]}:
+                    if account_id and (accounts is None or account_id in accounts):
+                        files[get_partition(account_id, partitions)].write(f"[{json.dumps(account_id)},{line}]\n")
+                        rows += 1
+            logger.debug("Partitioned %d rows", rows)
+        if balances_path:
+            with open(balances_path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    account_id = entry["account_id"]
+                    if accounts is None or account_id in accounts:
+                        balance = json.dumps({"balance": str(entry["balance"])})
+                        files[get_partition(account_id, partitions)].write(f"[{json.dumps(account_id)},{balance}]\n")
+    finally:
+        for f in files:
+            f.close()
+    return paths, rows, end_ns
+
+
+class BacktestReport(object):
+    """Recommendation distributions; every field is a count, so reports from partitions merge by adding"""
+
+    def __init__(self):
+        self.accounts = 0
+        self.points = 0
+        self.transactions = 0
+        self.changes = 0
+        self.recommendations = {}
+        self.rules = {}
+        self.by_activity = {}
+        self.by_month = {}
+        # Points that suggested a stake and whose next 30 days are in the archive, and how many of
+        # those would have run short of liquid NEAR
+        self.stake_outcomes = 0
+        self.liquidity_shortfalls = 0
+
+    @staticmethod
+    def add(counts, key, value=1):
+        counts[key] = counts.get(key, 0) + value
+
+    def record(self, month, activity, rule, recommendation):
+        self.points += 1
+        self.add(self.recommendations, recommendation)
+        self.add(self.rules, rule)
+        self.add(self.by_activity.setdefault(activity, {}), recommendation)
+        self.add(self.by_month.setdefault(month, {}), recommendation)
+
+    def merge(self, other):
+        for key in ("accounts", "points", "transactions", "changes", "stake_outcomes", "liquidity_shortfalls"):
+            setattr(self, key, getattr(self, key) + other[key])
+        for key in ("recommendations", "rules"):
+            for name, count in other[key].items():
+                self.add(getattr(self, key), name, count)
+        for key in ("by_activity", "by_month"):
+            for group, counts in other[key].items():
+                merged = getattr(self, key).setdefault(group, {})
+                for name, count in counts.items():
+                    self.add(merged, name, count)
+        return self
+
+    def to_dict(self):
+        return {
+            "accounts": self.accounts,
+            "points": self.points,
+            "transactions": self.transactions,
+            "changes": self.changes,
+            "recommendations": self.recommendations,
+            "rules": self.rules,
+            "by_activity": self.by_activity,
+            "by_month": dict(sorted(self.by_month.items())),
+            "stake_outcomes": self.stake_outcomes,
+            "liquidity_shortfalls": self.liquidity_shortfalls,
+            "shortfall_rate": round(self.liquidity_shortfalls / self.stake_outcomes, 4) if self.stake_outcomes else None
+        }
+
+
+def get_points(first_ns, end_ns, step_ns):
+    """Evaluation times: multiples of step_ns from the account's first transaction to the archive end"""
+    points = np.arange(-(-first_ns // step_ns) * step_ns, end_ns + 1, step_ns, dtype=np.int64)
+    return points if len(points) else np.asarray([end_ns], dtype=np.int64)
+
+
+def backtest_account(engine, report, account_id, transactions, end_ns, step_ns, balance_yocto=None,
+                     initial_balance=0.0):
+    """Replay one account's history through analyze_transactions and the rules at each point in time"""
+    columns = TransactionColumns.from_transactions(transactions, account_id).sort_by_time()
+    points = get_points(int(columns.timestamps[0]), end_ns, step_ns)
+    counts = np.searchsorted(columns.timestamps, points, side="right")
+
+    # Net flow and outflow per action, accumulated in time order
+    action_timestamps = columns.timestamps[columns.action_tx]
+    directions = columns.directions[columns.action_tx]
+    deposits = columns.deposits_near()
+    net = np.concatenate(([0.0], np.cumsum(np.where(directions == INFLOW, deposits, 0.0) -
+                                           np.where(directions == OUTFLOW, deposits, 0.0))))
+    outflow = np.concatenate(([0.0], np.cumsum(np.where(directions == OUTFLOW, deposits, 0.0))))
+    actions_until = np.searchsorted(action_timestamps, points, side="right")
+    if balance_yocto is None:
+        balances = initial_balance + net[actions_until]
+    else:
+        balances = balance_yocto / 10**24 - (net[-1] - net[actions_until])
+    balances = np.maximum(balances, 0.0)
+
+    # Points start at the first transaction, so every prefix is non-empty
+    analyses = [classify_activity(compute_transaction_stats(columns.prefix(int(count)), now_ns=int(point)), int(point))
+                for point, count in zip(points, counts)]
+    choice, suggested = engine.evaluate_batch(FeatureFrame.from_analyses(balances, analyses))
+
+    report.accounts += 1
+    report.transactions += len(columns)
+    previous = None
+    for i, point in enumerate(points):
+        rule = engine.rules[choice[i]]
+        recommendation = rule.result["recommendation"]
+        month = time.strftime("%Y-%m", time.gmtime(int(point) // NS_PER_SECOND))
+        report.record(month, analyses[i]["activity_level"], rule.name, recommendation)
+        if previous is not None and recommendation != previous:
+            report.changes += 1
+        previous = recommendation
+        if suggested[i] > 0 and point + OUTCOME_WINDOW_NS <= end_ns:
+            future_end = np.searchsorted(action_timestamps, point + OUTCOME_WINDOW_NS, side="right")
+            future_outflow = outflow[future_end] - outflow[actions_until[i]]
+            report.stake_outcomes += 1
+            if future_outflow > balances[i] - suggested[i]:
+                report.liquidity_shortfalls += 1
+
+
+def backtest_partition(path, end_ns, step_ns, thresholds=None, rules_file=None, initial_balance=0.0):
+    """Backtest every account in one partition file; runs in a pool worker"""
+    base_thresholds, rules = load_rules_config(rules_file)
+    engine = RecommendationEngine(dict(base_thresholds, **(thresholds or {})), rules)
+    histories = {}
+    balances = {}
+    with open(path) as f:
+        for line in f:
+            account_id, record = json.loads(line)
+            if "balance" in record:
+                balances[account_id] = int(record["balance"])
+            else:
+                histories.setdefault(account_id, []).append(record)
+    report = BacktestReport()
+    for account_id, transactions in histories.items():
+        backtest_account(engine, report, account_id, transactions, end_ns, step_ns, balances.get(account_id),
+                         initial_balance)
+    return report.to_dict()
+
+
+def run_backtest(path, workers=BACKTEST_WORKERS, step_days=BACKTEST_STEP_DAYS, accounts=None, balances_path=None,
+                 thresholds=None, rules_file=None, initial_balance=0.0, partitions=None,
+                 chunk_rows=BACKTEST_CHUNK_ROWS):
+    started_at = time.monotonic()
+    partitions = partitions or workers * PARTITIONS_PER_WORKER
+    report = BacktestReport()
+    with tempfile.TemporaryDirectory(prefix="defishield-backtest-") as directory:
+        paths, rows, end_ns = partition_archive(path, directory, partitions, accounts, balances_path, chunk_rows)
+        logger.info("Partitioned %d account rows into %d partitions in %.1fs", rows, partitions,
+                    time.monotonic() - started_at)
+        step_ns = int(step_days * 24 * 60 * 60) * NS_PER_SECOND
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(backtest_partition, partition_path, end_ns, step_ns, thresholds, rules_file,
+                                   initial_balance) for partition_path in paths if os.path.getsize(partition_path)]
+            for future in as_completed(futures):
+                report.merge(future.result())
+    result = report.to_dict()
+    result["elapsed_s"] = round(time.monotonic() - started_at, 3)
+    return result
+
+
+def parse_threshold(value):
+    name, _, number = value.partition("=")
+    if not name or not number:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {value!r}")
+    return name, float(number)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest DefiShield staking recommendations over a transaction archive")
+    parser.add_argument("archive", help="JSONL or Parquet file of recorded transactions")
+    parser.add_argument("-o", "--output", help="write the report JSON here (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--step-days", type=float, default=BACKTEST_STEP_DAYS,
+                        help="days between evaluation points per account")
+    parser.add_argument("--accounts", help="only backtest the account IDs in this file, one per line")
+    parser.add_argument("--balances", help="JSONL of current balances to reconstruct past balances from")
+    parser.add_argument("--initial-balance", type=float, default=0.0,
+                        help="NEAR held before the archive starts, for accounts without --balances")
+    parser.add_argument("--threshold", type=parse_threshold, action="append", default=[],
+                        help="override a rule threshold, e.g. partial_fraction=0.6 (repeatable)")
+    parser.add_argument("--rules-file", help="rules JSON (default: DEFISHIELD_RULES_FILE)")
+    parser.add_argument("--partitions", type=int, help=f"spill partitions (default: {PARTITIONS_PER_WORKER} per worker)")
+    parser.add_argument("--chunk-rows", type=int, default=BACKTEST_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    accounts = None
+    if args.accounts:
+        with open(args.accounts) as f:
+            accounts = {line.strip() for line in f if line.strip() and not line.startswith("#")}
+    report = run_backtest(args.archive, args.workers, args.step_days, accounts, args.balances, dict(args.threshold),
+                          args.rules_file, args.initial_balance, args.partitions, args.chunk_rows)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Batch staking analysis for many NEAR accounts.
+
+Usage:
+    python batch.py accounts.txt -o results.jsonl --concurrency 16
+    cat accounts.txt | python batch.py - > results.jsonl
+
+Input is one account ID per line (blank lines and lines starting with # are skipped). One JSON
+result is written per account as soon as it completes, and run statistics go to stderr.
+
+Each account costs only the calls its score needs (balance, transaction sync and on-chain staking
+positions), so runs stay within the NearBlocks rate limit. Accounts that complete together are
+scored in one vectorized rule-engine pass.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from account_ids import validate_account_id
+from amounts import json_default
+from log import get_logger
+from metrics import registry, timed
+from utils import AiUtils
+
+logger = get_logger("batch")
+
+BATCH_CONCURRENCY = 8
+# Older history pages to backfill per account; batch runs favour breadth over depth
+BATCH_BACKFILL_PAGES = 1
+PROGRESS_EVERY = 100
+
+
+def read_account_ids(stream):
+    """Yield account IDs from a text stream, one per line"""
+    for line in stream:
+        account_id = line.strip()
+        if account_id and not account_id.startswith("#"):
+            yield account_id
+
+
+class BatchStats(object):
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors = {}
+        self.latencies_ms = []
+
+    def record(self, result):
+        self.completed += 1
+        if result["ok"]:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.errors[result["error_type"]] = self.errors.get(result["error_type"], 0) + 1
+        self.latencies_ms.append(result["elapsed_ms"])
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started_at
+        latencies = sorted(self.latencies_ms)
+        return {
+            "completed": self.completed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsed_s": round(elapsed, 3),
+            "accounts_per_s": round(self.completed / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None
+        }
+
+
+async def fetch_account(utils, account_id, backfill_pages=BATCH_BACKFILL_PAGES):
+    """Fetch the balance, sync transactions and query staking positions; returns (balance, staking)"""
+    validate_account_id(account_id)
+    balance, sync_stats, staking = await asyncio.gather(
+        timed("balance_fetch", utils.get_account_balance(account_id)),
+        timed("txn_sync", utils.sync_account_transactions(account_id, backfill_pages=backfill_pages)),
+        timed("staking_positions_fetch", utils.get_staking_positions(account_id)),
+        return_exceptions=True
+    )
+    for result in (balance, sync_stats):
+        if isinstance(result, BaseException):
+            raise result
+    if isinstance(staking, BaseException):
+        logger.warning("Failed to aggregate staking positions for %s: %s", account_id, staking)
+        staking = None
+    return balance, staking
+
+
+async def analyze_account(utils, account_id, backfill_pages=BATCH_BACKFILL_PAGES):
+    """Fetch and analyze one account, returning a JSON-serializable result to be scored by score_results()"""
+    started_at = time.monotonic()
+    try:
+        balance, staking = await fetch_account(utils, account_id, backfill_pages)
+        analysis = await utils.analyze_account(account_id)
+        result = {
+            "account_id": account_id,
+            "ok": True,
+            "balance": balance,
+            "activity_level": analysis["activity_level"],
+            "recent_activity": analysis["recent_activity"],
+            "transaction_types": analysis["transaction_types"],
+            "stats": analysis["stats"],
+            "staking": staking,
+            "risk": analysis["risk"]
+        }
+    except Exception as e:
+        result = {"account_id": account_id, "ok": False, "error_type": type(e).__name__, "error": str(e)}
+    result["elapsed_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+    return result
+
+
+def score_results(utils, results):
+    """Add a recommendation to every successful result, scoring them all in one rule-engine pass"""
+    scored = [result for result in results if result["ok"]]
+    if scored:
+        # A result carries the analysis fields (activity, recent activity, stats, risk) the rules read
+        recommendations = utils.recommender.evaluate_many([result["balance"] for result in scored], scored,
+                                                          [result["staking"] for result in scored])
+        for result, recommendation in zip(scored, recommendations):
+            result["recommendation"] = recommendation
+    return results
+
+
+async def analyze_accounts(utils, account_ids, concurrency=BATCH_CONCURRENCY, backfill_pages=BATCH_BACKFILL_PAGES):
+    """Analyze accounts with bounded concurrency, yielding each result as soon as it completes.
+
+    account_ids may be any iterable (including a lazily read file); at most 2 * concurrency IDs
+    are buffered, so memory stays flat for arbitrarily long inputs. Each ID is read on a worker
+    thread, so slowly piped input never stalls fetches already in flight.
+    """
+    pending = asyncio.Queue(maxsize=concurrency * 2)
+    results = asyncio.Queue()
+
+    async def produce():
+        iterator = iter(account_ids)
+        try:
+            while True:
+                account_id = await asyncio.to_thread(next, iterator, None)
+                if account_id is None:
+                    break
+                await pending.put(account_id)
+        finally:
+            for _ in range(concurrency):
+                await pending.put(None)
+
+    async def work():
+        while True:
+            account_id = await pending.get()
+            if account_id is None:
+                await results.put(None)
+                return
+            await results.put(await analyze_account(utils, account_id, backfill_pages))
+
+    producer = asyncio.create_task(produce())
+    tasks = [producer] + [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        remaining = concurrency
+        while remaining:
+            completed = [await results.get()]
+            # Everything that finished while the last results were written is scored together
+            while not results.empty():
+                completed.append(results.get_nowait())
+            remaining -= completed.count(None)
+            for result in score_results(utils, [result for result in completed if result is not None]):
+                yield result
+        # Surface errors reading the input
+        producer.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def run_batch(input_stream, output_stream, concurrency=BATCH_CONCURRENCY, backfill_pages=BATCH_BACKFILL_PAGES):
+    utils = AiUtils(None, None)
+    stats = BatchStats()
+    try:
+        async for result in analyze_accounts(utils, read_account_ids(input_stream), concurrency, backfill_pages):
+            output_stream.write(json.dumps(result, default=json_default) + "\n")
+            output_stream.flush()
+            stats.record(result)
+            if stats.completed % PROGRESS_EVERY == 0:
+                print(json.dumps(stats.snapshot()), file=sys.stderr)
+    finally:
+        await utils.close()
+    return stats.snapshot()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score NEAR accounts for staking in batch, writing JSONL results")
+    parser.add_argument("input", help="file with one account ID per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--backfill-pages", type=int, default=BATCH_BACKFILL_PAGES,
+                        help="older transaction pages to sync per account")
+    parser.add_argument("--metrics", choices=["json", "prometheus"],
+                        help="also write stage/HTTP/cache metrics to stderr when done")
+    args = parser.parse_args(argv)
+
+    input_stream = sys.stdin if args.input == "-" else open(args.input)
+    output_stream = open(args.output, "w") if args.output else sys.stdout
+    try:
+        summary = asyncio.run(run_batch(input_stream, output_stream, args.concurrency, args.backfill_pages))
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+    print(json.dumps(summary), file=sys.stderr)
+    if args.metrics == "json":
+        print(json.dumps(registry.snapshot()), file=sys.stderr)
+    elif args.metrics == "prometheus":
+        sys.stderr.write(registry.to_prometheus())
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Offline stand-ins for the NearBlocks/FastNEAR/Ref APIs, the NEAR RPC and the NEAR AI environment.
+
+FixtureHttpClient serves the recorded responses in fixtures/ and generates deterministic
+synthetic transaction histories: an account named ``bench-<n>.near`` has exactly n transactions,
+served newest-first with NearBlocks-style cursors. FakeStakingRpc answers staking pool view calls.
+"""
+import asyncio
+import copy
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SYNTHETIC_ACCOUNT = re.compile(r"^bench-(\d+)\.near$")
+# Mean spacing between synthetic transactions
+MEAN_GAP_SECONDS = 6 * 60 * 60
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+def get_transaction_count(account_id):
+    match = SYNTHETIC_ACCOUNT.match(account_id)
+    return int(match.group(1)) if match else 5
+
+
+class SyntheticHistory(object):
+    """Deterministic transaction history built from the recorded txn fixture"""
+
+    ACTIONS = (
+        ("TRANSFER", None, 0.45),
+        ("FUNCTION_CALL", "ft_transfer_call", 0.35),
+        ("FUNCTION_CALL", "swap", 0.1),
+        ("STAKE", None, 0.05),
+        ("ADD_KEY", None, 0.05),
+    )
+
+    def __init__(self, account_id, count, now_ns=None, seed=0):
+        self.account_id = account_id
+        self.count = count
+        self.template = load_fixture("txn.json")
+        self.now_ns = now_ns or time.time_ns()
+        self.seed = seed
+        self._timestamps = None
+
+    def get_timestamps(self):
+        # Newest first, exponentially distributed gaps
+        if self._timestamps is None:
+            rng = random.Random(f"{self.seed}:{self.account_id}")
+            timestamps = []
+            current = self.now_ns - int(rng.expovariate(1 / MEAN_GAP_SECONDS) * 10**9)
+            for _ in range(self.count):
+                timestamps.append(current)
+                current -= int(rng.expovariate(1 / MEAN_GAP_SECONDS) * 10**9) + 1
+            self._timestamps = timestamps
+        return self._timestamps
+
+    def get_transaction(self, index):
+        rng = random.Random(f"{self.seed}:{self.account_id}:{index}")
+        tx = copy.deepcopy(self.template)
+        kind, method, _ = rng.choices(self.ACTIONS, weights=[a[2] for a in self.ACTIONS])[0]
+        deposit = str(rng.randrange(10**21, 50 * 10**24)) if kind == "TRANSFER" else "1"
+        outgoing = rng.random() < 0.6
+        counterparty = f"peer{rng.randrange(200)}.near"
+
+        tx["id"] = str(10**9 + self.count - index)
+        tx["transaction_hash"] = f"{rng.getrandbits(128):032x}"
+        tx["block_timestamp"] = str(self.get_timestamps()[index])
+        tx["signer_account_id"] = tx["predecessor_account_id"] = self.account_id if outgoing else counterparty
+        tx["receiver_account_id"] = counterparty if outgoing else self.account_id
+        tx["actions"] = [{
+            "action": kind,
+            "method": method,
+            "deposit": deposit,
+            "fee": tx["actions"][0]["fee"],
+            "args": {"method_name": method, "deposit": deposit} if method else {"deposit": deposit}
+        }]
+        tx["actions_agg"] = {"deposit": deposit}
+        return tx
+
+    def get_transactions(self, start=0, stop=None):
+        stop = self.count if stop is None else min(stop, self.count)
+        return [self.get_transaction(i) for i in range(start, stop)]
+
+
+class FixtureHttpClient(object):
+    """Drop-in replacement for http_client.HttpClient that never touches the network"""
+
+    def __init__(self, latency=0.0, now_ns=None):
+        self.latency = latency
+        self.now_ns = now_ns or time.time_ns()
+        self.calls = 0
+        self.histories = {}
+        self.fixtures = {name: load_fixture(name) for name in (
+            "account.json", "ft.json", "staking_info.json", "fastnear_staking.json", "ref_token_prices.json")}
+
+    def get_history(self, account_id):
+        if account_id not in self.histories:
+            self.histories[account_id] = SyntheticHistory(account_id, get_transaction_count(account_id), self.now_ns)
+        return self.histories[account_id]
+
+    async def get_json(self, url, params=None, deadline=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = params or {}
+
+        if "list-token-price" in url:
+            return copy.deepcopy(self.fixtures["ref_token_prices.json"])
+        if "api.fastnear.com" in url:
+            return copy.deepcopy(self.fixtures["fastnear_staking.json"])
+
+        match = re.search(r"/v1/account/([^/?]+)(?:/(\w+))?$", url)
+        if not match:
+            raise ValueError(f"No fixture for {url}")
+        account_id, endpoint = match.groups()
+        if endpoint is None:
+            return copy.deepcopy(self.fixtures["account.json"])
+        if endpoint == "ft":
+            return copy.deepcopy(self.fixtures["ft.json"])
+        if endpoint == "staking":
+            return copy.deepcopy(self.fixtures["staking_info.json"])
+        if endpoint == "txns":
+            history = self.get_history(account_id)
+            per_page = int(params.get("per_page", params.get("limit", 25)))
+            start = int(params.get("cursor") or 0)
+            txns = history.get_transactions(start, start + per_page)
+            cursor = str(start + per_page) if start + per_page < history.count else None
+            return {"cursor": cursor, "txns": txns}
+        raise ValueError(f"No fixture for {url}")
+
+    async def close(self):
+        pass
+
+
+class ViewResult(object):
+    def __init__(self, result):
+        self.result = result
+
+
+class FakeStakingRpc(object):
+    """Stand-in for py_near's Account.view_function against staking pool contracts.
+
+    Every pool charges `fee` and holds a deterministic stake for each account; `positions` may
+    override individual (pool_id, account_id) entries. Unknown methods raise like a failed view call.
+    """
+
+    def __init__(self, latency=0.0, fee=(5, 100), positions=None):
+        self.latency = latency
+        self.fee = fee
+        self.positions = positions or {}
+        self.calls = 0
+
+    def get_position(self, pool_id, account_id):
+        if (pool_id, account_id) in self.positions:
+            return self.positions[(pool_id, account_id)]
+        rng = random.Random(f"{pool_id}:{account_id}")
+        return {
+            "account_id": account_id,
+            "staked_balance": str(rng.randrange(10**24, 1000 * 10**24)),
+            "unstaked_balance": str(rng.choice((0, rng.randrange(10**24)))),
+            "can_withdraw": rng.random() < 0.5
+        }
+
+    async def view_function(self, contract_id, method_name, args, block_id=None, threshold=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method_name == "get_account":
+            return ViewResult(self.get_position(contract_id, args["account_id"]))
+        if method_name == "get_reward_fee_fraction":
+            return ViewResult({"numerator": self.fee[0], "denominator": self.fee[1]})
+        raise ValueError(f"{contract_id} has no view method {method_name}")
+
+
+class FakeEnvironment(object):
+    """Minimal subset of nearai.agents.environment.Environment used by the agent"""
+
+    def __init__(self, message, temp_path=None):
+        self.messages = [{"role": "user", "content": message}]
+        self.replies = []
+        self.temp_path = temp_path or tempfile.mkdtemp(prefix="defishield-bench-")
+        self.files = {}
+
+    def get_last_message(self):
+        return self.messages[-1]
+
+    def list_messages(self):
+        return list(self.messages)
+
+    def add_reply(self, message):
+        self.replies.append(message)
+
+    def get_agent_temp_path(self):
+        return self.temp_path
+
+    def list_files(self, path):
+        return list(self.files)
+
+    def read_file(self, filename):
+        # Like the NEAR AI environment, a missing file reads as None
+        return self.files.get(filename)
+
+    def write_file(self, filename, content):
+        self.files[filename] = content
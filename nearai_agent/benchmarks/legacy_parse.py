@@ -0,0 +1,33 @@
+"""The regex-based parse_response that response_parser replaced, kept to benchmark against"""
+import json
+import re
+
+
+def legacy_parse_response(response):
+    try:
+        parsed_response = json.loads(response)
+        return parsed_response
+
+    except Exception as err:
+        markdown_json_match = re.match(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
+        if markdown_json_match:
+            response = markdown_json_match.group(1)
+
+        else:
+            markdown_match = re.search(r'```(.*?)```', response, re.DOTALL)
+            if markdown_match:
+                response = markdown_match.group(1).replace('\n', '').strip()
+            else:
+                json_match = re.search(r'\{.*\}', response, re.DOTALL)
+                if json_match:
+                    response = json_match.group(0).replace('\n', '').strip()
+        try:
+            parsed_response = json.loads(response)
+            return parsed_response
+        except json.JSONDecodeError:
+            try:
+                response = response.replace(";", "")
+                parsed_response = json.loads(response)
+                return parsed_response
+            except json.JSONDecodeError:
+                return {"message": "JSON decode error"}
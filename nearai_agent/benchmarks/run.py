@@ -0,0 +1,283 @@
+"""Offline performance benchmarks for the DefiShield agent.
+
+Replays the recorded API fixtures through FixtureHttpClient (no network) and measures
+analyze_transactions, format_transactions_as_markdown, parse_response and the full agent()
+pipeline over synthetic accounts of 5 to 100k transactions. The serve scenario measures requests
+per second through the long-lived server, which keeps one AiUtils and its caches across
+messages. The recommend scenario scores that many synthetic accounts at once through the rule
+engine. The parse_* scenarios run the response parser, and the regex parser it replaced
+(legacy), over typical and pathological model replies.
+
+Usage:
+    python benchmarks/run.py                          # all scenarios, default sizes
+    python benchmarks/run.py --sizes 5,1000 --only analyze,format
+    python benchmarks/run.py -o results/HEAD.json --compare results/main.json
+
+Each result reports throughput, p50/p99 latency and peak traced memory. Output files carry the
+git commit and Python version so runs can be compared across commits with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_transport import FakeEnvironment, FakeStakingRpc, FixtureHttpClient, SyntheticHistory  # noqa: E402
+
+DEFAULT_SIZES = (5, 100, 1000, 10000, 100000)
+SCENARIOS = ("analyze", "format", "parse", "parse_legacy", "parse_worst", "parse_worst_legacy", "recommend", "agent",
+             "serve")
+# Each measurement repeats until this much time has passed (or MAX_ITERATIONS runs)
+TIME_BUDGET_S = 1.0
+MIN_ITERATIONS = 3
+MAX_ITERATIONS = 200
+# Simulated upstream round-trip for agent() runs
+AGENT_LATENCY_S = 0.02
+# Concurrent messages per serve measurement
+SERVE_BATCH = 32
+# The legacy parser is quadratic on pathological input; larger sizes would run for minutes
+LEGACY_WORST_MAX_SIZE = 10000
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def measure(func, items=1):
+    """Call func repeatedly and return timing statistics; items is the work units per call"""
+    timings = []
+    started_at = time.perf_counter()
+    while len(timings) < MIN_ITERATIONS or (
+            len(timings) < MAX_ITERATIONS and time.perf_counter() - started_at < TIME_BUDGET_S):
+        call_started_at = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - call_started_at)
+
+    # Peak memory is measured on a separate call, since tracing slows everything down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": len(timings),
+        "items_per_s": round(items * len(timings) / total, 2) if total else None,
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "peak_kb": round(peak / 1024, 1)
+    }
+
+
+def make_utils(env=None, http=None, staking_rpc=None):
+    from utils import AiUtils
+    return AiUtils(env or FakeEnvironment("bench"), None, http=http or FixtureHttpClient(),
+                   staking_rpc=staking_rpc or FakeStakingRpc())
+
+
+def bench_analyze(utils, size):
+    transactions = SyntheticHistory("bench.near", size).get_transactions()
+    return measure(lambda: utils.analyze_transactions(transactions, account_id="bench.near"), size)
+
+
+def bench_format(utils, size):
+    transactions = SyntheticHistory("bench.near", size).get_transactions()
+    return measure(lambda: utils.format_transactions_as_markdown(transactions), size)
+
+
+def make_llm_output(size):
+    """A typical chatty model reply: prose, then a fenced JSON block with `size` entries"""
+    body = json.dumps({"action": "stake", "amount": "10", "items": [{"i": i, "note": "x" * 16} for i in range(size)]},
+                      indent=2)
+    return f"Sure! Here is the result you asked for.\n\n```json\n{body}\n```\n\nLet me know if you need more."
+
+
+def make_worst_llm_output(size):
+    """A runaway reply: prose, an unclosed fence, `size` unbalanced braces, then an unterminated
+    string of `size` escaped quotes"""
+    return "Thinking about it... ```json\n" + "{\"a\": " * size + '"' + '\\"' * size
+
+
+def bench_parse(utils, size, make_output=make_llm_output, legacy=False):
+    from legacy_parse import legacy_parse_response
+
+    response = make_output(size)
+    parse = legacy_parse_response if legacy else utils.parse_response
+    return measure(lambda: parse(response), len(response))
+
+
+def bench_recommend(utils, size):
+    """Vectorized rule evaluation over `size` accounts with random balances and activity"""
+    import random
+    from recommendation import ACTIVITY_LEVELS, FeatureFrame
+
+    rng = random.Random(size)
+    balances = [rng.randrange(10**27) for _ in range(size)]
+    analyses = [{
+        "activity_level": rng.choice(ACTIVITY_LEVELS),
+        "recent_activity": rng.random() < 0.5,
+        "stats": {"outflow_30d_yocto": rng.randrange(10**26)}
+    } for _ in range(size)]
+    frame = FeatureFrame.from_analyses([balance / 10**24 for balance in balances], analyses)
+    return measure(lambda: utils.recommender.evaluate_batch(frame), size)
+
+
+def bench_agent(size, latency=AGENT_LATENCY_S):
+    """Run agent() end to end: once against an empty data dir (cold), then again warm"""
+    import agent as agent_module
+    from cache import response_cache
+
+    account_id = f"bench-{size}.near"
+    env = FakeEnvironment(f"Should I stake? My account is {account_id}")
+    http = FixtureHttpClient(latency=latency)
+    staking_rpc = FakeStakingRpc(latency=latency)
+
+    def run():
+        # A fresh AiUtils per run, as NEAR AI builds one per message
+        utils = agent_module.utils = make_utils(env, http, staking_rpc)
+        try:
+            asyncio.run(agent_module.agent(env))
+        finally:
+            # agent() only releases the HTTP pool; close the index connections this run opened so long
+            # runs do not measure leaked descriptors
+            utils.tx_sync.index.close()
+
+    # Cold: fresh data dir, empty in-memory cache
+    if response_cache.store is not None:
+        response_cache.store.close()
+    response_cache.store = None
+    response_cache.invalidate()
+    started_at = time.perf_counter()
+    run()
+    cold_ms = (time.perf_counter() - started_at) * 1000
+    cold_calls = http.calls
+
+    http.calls = 0
+    result = measure(run)
+    result.update({"cold_ms": round(cold_ms, 3), "cold_http_calls": cold_calls,
+                   "warm_http_calls": http.calls // (result["iterations"] + 1)})
+    return result
+
+
+def bench_serve(size, latency=AGENT_LATENCY_S, batch=SERVE_BATCH):
+    """Answer `batch` concurrent messages through one AgentServer on one event loop, as a worker does"""
+    import agent as agent_module
+    from server import AgentServer
+
+    http = FixtureHttpClient(latency=latency)
+    utils = make_utils(FakeEnvironment("bench"), http, FakeStakingRpc(latency=latency))
+    server = AgentServer(utils=utils)
+    message = f"Should I stake? My account is bench-{size}.near"
+    loop = asyncio.new_event_loop()
+
+    async def run_batch():
+        results = await asyncio.gather(*(server.handle(message, i) for i in range(batch)))
+        assert all(result["ok"] for result in results)
+
+    try:
+        loop.run_until_complete(run_batch())
+        http.calls = 0
+        result = measure(lambda: loop.run_until_complete(run_batch()), batch)
+        result["http_calls_per_request"] = round(http.calls / ((result["iterations"] + 1) * batch), 3)
+        loop.run_until_complete(server.close())
+    finally:
+        loop.close()
+        agent_module.utils = None
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\n{'scenario':<10}{'size':>8}{'p50 ms':>12}{'base p50':>12}{'change':>10}")
+    for r in results:
+        base = baseline.get((r["scenario"], r["size"]))
+        if not base:
+            continue
+        change = (r["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+        print(f"{r['scenario']:<10}{r['size']:>8}{r['p50_ms']:>12.3f}{base['p50_ms']:>12.3f}{change:>+9.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline DefiShield benchmarks over recorded fixtures")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated transaction counts")
+    parser.add_argument("--only", default=",".join(SCENARIOS), help="comma separated scenarios to run")
+    parser.add_argument("-o", "--output", help="write results JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to compare p50 latency against")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = [name for name in args.only.split(",") if name]
+
+    # Benchmarks should measure the code, not log I/O
+    import log
+    log.configure(level="ERROR")
+
+    utils = make_utils()
+    results = []
+    for scenario in scenarios:
+        for size in sizes:
+            if scenario == "analyze":
+                result = bench_analyze(utils, size)
+            elif scenario == "format":
+                result = bench_format(utils, size)
+            elif scenario == "parse":
+                result = bench_parse(utils, size)
+            elif scenario == "parse_legacy":
+                result = bench_parse(utils, size, legacy=True)
+            elif scenario == "parse_worst":
+                result = bench_parse(utils, size, make_worst_llm_output)
+            elif scenario == "parse_worst_legacy":
+                if size > LEGACY_WORST_MAX_SIZE:
+                    continue
+                result = bench_parse(utils, size, make_worst_llm_output, legacy=True)
+            elif scenario == "recommend":
+                result = bench_recommend(utils, size)
+            elif scenario == "agent":
+                result = bench_agent(size)
+            elif scenario == "serve":
+                result = bench_serve(size)
+            else:
+                parser.error(f"unknown scenario {scenario}")
+            result = dict({"scenario": scenario, "size": size}, **result)
+            results.append(result)
+            print(json.dumps(result))
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time())
+        },
+        "results": results
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import asyncio
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from log import get_logger
+from metrics import CACHE_LOOKUPS
+
+logger = get_logger("cache")
+
+CACHE_MAX_ENTRIES = 2048
+
+# Per-endpoint freshness: (url pattern, ttl seconds, stale-while-revalidate window seconds).
+# The first matching pattern wins; URLs that match nothing are not cached.
+ENDPOINT_TTLS = [
+    (re.compile(r"api\.ref\.finance/list-token-price"), 300, 3600),
+    (re.compile(r"/v1/account/[^/]+/txns"), 30, 0),
+    (re.compile(r"/v1/account/[^/]+/ft"), 120, 0),
+    (re.compile(r"/v1/account/[^/]+/staking"), 300, 0),
+    (re.compile(r"/v1/account/[^/]+/balance"), 30, 0),
+    (re.compile(r"/v1/account/[^/?]+$"), 30, 0),
+    # Staking pool view calls (see staking.py): reward fees rarely change, balances move every epoch
+    (re.compile(r"^near-view://[^/]+/get_reward_fee_fraction$"), 60 * 60, 0),
+    (re.compile(r"^near-view://[^/]+/get_account$"), 60, 0),
+]
+
+
+# Account-specific endpoints, for per-account stale windows
+ACCOUNT_URL = re.compile(r"/v1/account/([^/?]+)")
+
+
+def make_cache_key(url, params=None):
+    """Build a stable cache key from a URL and its query parameters"""
+    if not params:
+        return url
+    return f"{url}?{urlencode(sorted(params.items()))}"
+
+
+class ResponseCache(object):
+    """Bounded in-process response cache with per-endpoint TTLs, LRU eviction and stale-while-revalidate"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_rules=None, store=None):
+        self.max_entries = max_entries
+        self.ttl_rules = ENDPOINT_TTLS if ttl_rules is None else ttl_rules
+        # Optional persistent second tier (see disk_cache.DiskCache)
+        self.store = store
+        # key -> (value, expires_at, stale_until), least recently used first
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._refreshing = {}
+        # account_id -> minimum stale-while-revalidate window for that account's endpoints
+        self.account_stale = {}
+
+    def attach_store(self, store):
+        self.store = store
+
+    def get_policy(self, url):
+        for pattern, ttl, stale_ttl in self.ttl_rules:
+            if pattern.search(url):
+                if ttl and self.account_stale:
+                    match = ACCOUNT_URL.search(url)
+                    if match:
+                        stale_ttl = max(stale_ttl, self.account_stale.get(match.group(1), 0))
+                return ttl, stale_ttl
+        return 0, 0
+
+    def set_account_stale(self, account_id, seconds):
+        """Serve an account's cached responses stale for up to `seconds` while they refresh in the background"""
+        if seconds:
+            self.account_stale[account_id] = seconds
+        else:
+            self.account_stale.pop(account_id, None)
+
+    def get(self, key, allow_stale=False):
+        """Return the cached value for a key, or None if it is missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, stale_until = entry
+        now = time.monotonic()
+        if now < expires_at or (allow_stale and now < stale_until):
+            self.entries.move_to_end(key)
+            return value
+        return None
+
+    def set(self, key, value, ttl, stale_ttl=0):
+        now = time.monotonic()
+        self._put(key, (value, now + ttl, now + ttl + stale_ttl))
+        if self.store is not None:
+            wall_now = time.time()
+            try:
+                self.store.set(key, value, wall_now + ttl, wall_now + ttl + stale_ttl)
+            except sqlite3.Error as e:
+                logger.warning("Disk cache write failed for %s: %s", key, e)
+
+    def _put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _load_from_store(self, key):
+        """Promote a persisted entry into memory, translating wall-clock expiry to monotonic time"""
+        try:
+            row = self.store.get(key)
+        except sqlite3.Error as e:
+            logger.warning("Disk cache read failed for %s: %s", key, e)
+            return None
+        if row is None:
+            return None
+        value, expires_at, stale_until = row
+        offset = time.monotonic() - time.time()
+        entry = (value, expires_at + offset, stale_until + offset)
+        self._put(key, entry)
+        self.disk_hits += 1
+        CACHE_LOOKUPS.inc(result="disk")
+        return entry
+
+    def invalidate(self, key=None):
+        """Drop one key, or the whole cache when no key is given"""
+        if key is None:
+            self.entries.clear()
+            if self.store is not None:
+                self.store.clear()
+        else:
+            self.entries.pop(key, None)
+            if self.store is not None:
+                self.store.delete(key)
+
+    async def get_or_fetch(self, url, params, fetch):
+        """Serve a URL from cache, calling the fetch coroutine function on a miss"""
+        ttl, stale_ttl = self.get_policy(url)
+        if not ttl:
+            CACHE_LOOKUPS.inc(result="bypass")
+            return await fetch()
+
+        key = make_cache_key(url, params)
+        entry = self.entries.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load_from_store(key)
+        if entry is not None:
+            value, expires_at, stale_until = entry
+            now = time.monotonic()
+            if now < expires_at:
+                self.hits += 1
+                CACHE_LOOKUPS.inc(result="hit")
+                self.entries.move_to_end(key)
+                return value
+            if now < stale_until:
+                # Serve the stale copy immediately and refresh it in the background
+                self.stale_hits += 1
+                CACHE_LOOKUPS.inc(result="stale")
+                self.entries.move_to_end(key)
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, ttl, stale_ttl, fetch))
+                return value
+
+        self.misses += 1
+        CACHE_LOOKUPS.inc(result="miss")
+        value = await fetch()
+        self.set(key, value, ttl, stale_ttl)
+        return value
+
+    async def _refresh(self, key, ttl, stale_ttl, fetch):
+        try:
+            self.set(key, await fetch(), ttl, stale_ttl)
+        except Exception as e:
+            logger.warning("Background refresh failed for %s: %s", key, e)
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def drain(self):
+        """Wait for in-flight background refreshes to finish"""
+        if self._refreshing:
+            await asyncio.gather(*list(self._refreshing.values()), return_exceptions=True)
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0
+        }
+
+
+# Shared by every AiUtils instance in the process
+response_cache = ResponseCache()
@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+import time
+
+DISK_CACHE_FILE = "response_cache.sqlite3"
+DISK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# After exceeding the cap, evict least recently used rows down to this fraction of it
+DISK_CACHE_EVICT_TO = 0.8
+
+
+class DiskCache(object):
+    """SQLite-backed response store that survives agent restarts.
+
+    Rows carry wall-clock expiry metadata and are written inside transactions, so a crash
+    mid-write never leaves a partial entry behind. Total payload size is capped with LRU eviction.
+    """
+
+    def __init__(self, path, max_bytes=DISK_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, stale_until REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def get(self, key):
+        """Return (value, expires_at, stale_until) for a key, or None if it is missing or fully expired"""
+        row = self.conn.execute(
+            "SELECT value, expires_at, stale_until FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, stale_until = row
+        now = time.time()
+        if now >= stale_until:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self.conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires_at, stale_until
+
+    def set(self, key, value, expires_at, stale_until):
+        payload = json.dumps(value, separators=(",", ":"))
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, stale_until, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, payload, len(payload), expires_at, stale_until, time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM entries WHERE stale_until <= ?", (time.time(),))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * DISK_CACHE_EVICT_TO
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+            evicted.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM entries")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,243 @@
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from log import get_logger
+from metrics import HTTP_REQUESTS, HTTP_SECONDS
+
+logger = get_logger("http")
+
+# Connection pool sizing: total sockets and sockets per upstream host
+HTTP_CONNECTION_LIMIT = 50
+HTTP_CONNECTION_LIMIT_PER_HOST = 8
+HTTP_KEEPALIVE_TIMEOUT = 30
+
+# Per-attempt timeout and overall deadline (including retries and backoff) in seconds
+HTTP_ATTEMPT_TIMEOUT = 10
+HTTP_REQUEST_DEADLINE = 30
+
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_BASE = 0.5
+HTTP_BACKOFF_MAX = 8.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Token bucket settings per host: sustained requests per second and burst size
+DEFAULT_HOST_POLICY = {"rate": 10.0, "burst": 20}
+HOST_POLICIES = {
+    "api.nearblocks.io": {"rate": 2.0, "burst": 5},
+    "api.fastnear.com": {"rate": 10.0, "burst": 20},
+    "api.ref.finance": {"rate": 5.0, "burst": 5},
+}
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30.0
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """Raised when a host's circuit breaker is open and requests are short-circuited"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"Circuit open for {host}, retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def check(self, host):
+        """Raise CircuitOpenError if a request to the host would be short-circuited, without changing state"""
+        if self.state == self.CLOSED:
+            return
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == self.OPEN and elapsed < self.reset_timeout or (
+                self.state == self.HALF_OPEN and self._probe_in_flight):
+            raise CircuitOpenError(host, max(0.0, self.reset_timeout - elapsed))
+
+    def before_request(self, host):
+        """Raise CircuitOpenError unless a request to the host may proceed; True if it is the half-open probe.
+
+        The caller must record the probe's outcome or call release_probe(), whatever happens to it.
+        """
+        if self.state == self.CLOSED:
+            return False
+        elapsed = time.monotonic() - self.opened_at
+        if self.state == self.OPEN and elapsed >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            # Let a single probe through; everyone else waits for its outcome
+            self._probe_in_flight = True
+            return True
+        raise CircuitOpenError(host, max(0.0, self.reset_timeout - elapsed))
+
+    def release_probe(self):
+        """Free the probe slot of a probe that ended without an outcome (cancelled or failed locally)"""
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class HttpClient(object):
+    """Pooled async HTTP client with per-host rate limiting, retries and circuit breaking"""
+
+    def __init__(self, host_policies=None, max_retries=HTTP_MAX_RETRIES, attempt_timeout=HTTP_ATTEMPT_TIMEOUT,
+                 deadline=HTTP_REQUEST_DEADLINE):
+        self.host_policies = dict(HOST_POLICIES, **(host_policies or {}))
+        self.max_retries = max_retries
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.buckets = {}
+        self.breakers = {}
+        self._session = None
+        self._session_loop = None
+
+    async def get_session(self):
+        """Return the pooled aiohttp session, creating it for the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=HTTP_CONNECTION_LIMIT,
+                                             limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+                                             keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+            # Buckets hold an asyncio.Lock bound to the previous loop
+            self.buckets = {}
+        return self._session
+
+    async def close(self):
+        """Close the pooled session and its connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+    def get_bucket(self, host):
+        if host not in self.buckets:
+            policy = self.host_policies.get(host, DEFAULT_HOST_POLICY)
+            self.buckets[host] = TokenBucket(policy["rate"], policy["burst"])
+        return self.buckets[host]
+
+    def get_breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker()
+        return self.breakers[host]
+
+    def get_backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, never shorter than a server supplied Retry-After"""
+        delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def get_json(self, url, params=None, deadline=None):
+        """GET a URL and decode its JSON body, retrying 429/5xx and connection errors until the deadline"""
+        host = urlsplit(url).hostname
+        session = await self.get_session()
+        bucket = self.get_bucket(host)
+        breaker = self.get_breaker(host)
+        loop = asyncio.get_running_loop()
+        deadline_at = loop.time() + (deadline or self.deadline)
+
+        attempt = 0
+        while True:
+            # Fail fast while the circuit is open, but only take the half-open probe slot once a token is held,
+            # so waiting for the token can never strand the slot
+            try:
+                breaker.check(host)
+                await asyncio.wait_for(bucket.acquire(), max(0.0, deadline_at - loop.time()))
+                remaining = deadline_at - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"Deadline exceeded for {url}")
+                probing = breaker.before_request(host)
+            except CircuitOpenError:
+                HTTP_REQUESTS.inc(host=host, status="circuit_open")
+                raise
+
+            retry_after = None
+            started_at = time.perf_counter()
+            try:
+                timeout = aiohttp.ClientTimeout(total=min(self.attempt_timeout, remaining))
+                async with session.get(url, params=params, timeout=timeout) as response:
+                    HTTP_REQUESTS.inc(host=host, status=str(response.status))
+                    HTTP_SECONDS.observe(time.perf_counter() - started_at, host=host)
+                    if response.status not in RETRY_STATUSES:
+                        # 4xx responses are the caller's problem, not the host's
+                        breaker.record_success()
+                        response.raise_for_status()
+                        return await response.json(content_type=None)
+
+                    breaker.record_failure()
+                    if attempt >= self.max_retries:
+                        response.raise_for_status()
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                HTTP_REQUESTS.inc(host=host, status=type(e).__name__)
+                HTTP_SECONDS.observe(time.perf_counter() - started_at, host=host)
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+            except BaseException:
+                # Cancelled, or failed before the host answered: let the next request probe instead
+                if probing:
+                    breaker.release_probe()
+                raise
+
+            delay = self.get_backoff(attempt, retry_after)
+            if loop.time() + delay >= deadline_at:
+                raise asyncio.TimeoutError(f"Deadline exceeded for {url} after {attempt + 1} attempts")
+            logger.info("Retrying %s in %.2fs (attempt %d/%d)", url, delay, attempt + 1, self.max_retries)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,87 @@
+"""Leveled, structured logging for the agent.
+
+Thin layer over the standard logging module. Messages use %-style arguments so formatting only
+happens when a record is actually emitted, and hot loops should hoist
+``logger.isEnabledFor(logging.DEBUG)`` out of the loop so disabled debug output costs one branch.
+
+Configured from the environment:
+    DEFISHIELD_LOG_LEVEL    DEBUG, INFO (default), WARNING, ERROR
+    DEFISHIELD_LOG_FORMAT   text (default) or json
+    DEFISHIELD_LOG_SAMPLE   fraction of DEBUG records to keep, e.g. 0.01 (default 1.0)
+"""
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+LOGGER_NAME = "defishield"
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any `extra` fields passed to the log call"""
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records at or below a level; higher levels always pass"""
+
+    def __init__(self, rate, level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.level = level
+
+    def filter(self, record):
+        return record.levelno > self.level or random.random() < self.rate
+
+
+def configure(level=None, fmt=None, sample_rate=None, stream=None):
+    """(Re)configure the package logger; arguments default to the DEFISHIELD_LOG_* environment"""
+    level = (level or os.environ.get("DEFISHIELD_LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.environ.get("DEFISHIELD_LOG_FORMAT", "text")).lower()
+    if sample_rate is None:
+        sample_rate = float(os.environ.get("DEFISHIELD_LOG_SAMPLE", "1.0"))
+
+    # Logs go to stderr so stdout stays free for replies and JSONL output
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+        formatter.converter = time.gmtime
+        handler.setFormatter(formatter)
+    if sample_rate < 1.0:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for old_handler in list(logger.handlers):
+        logger.removeHandler(old_handler)
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+    return logger
+
+
+def get_logger(name):
+    """Return a child of the package logger, configuring it on first use"""
+    root = logging.getLogger(LOGGER_NAME)
+    if not root.handlers:
+        configure()
+    return root.getChild(name)
@@ -0,0 +1,173 @@
+"""In-process metrics: counters, latency histograms and per-stage timing spans.
+
+Everything is recorded in the shared ``registry`` and can be exported as a JSON snapshot
+(``registry.snapshot()``) or Prometheus text exposition (``registry.to_prometheus()``).
+"""
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter(object):
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(label_key(labels), 0)
+
+    def snapshot(self):
+        return [{"labels": dict(key), "value": value} for key, value in self.values.items()]
+
+    def to_prometheus(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram(object):
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # label key -> [bucket counts..., +Inf count], sum, count
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+        series[2] += 1
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile by linear interpolation within the matching bucket"""
+        series = self.series.get(label_key(labels))
+        if not series or not series[2]:
+            return None
+        return self._quantile(series, q)
+
+    def _quantile(self, series, q):
+        counts, _, total = series
+        rank = q * total
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+    def snapshot(self):
+        result = []
+        for key, series in self.series.items():
+            counts, total_sum, count = series
+            result.append({
+                "labels": dict(key),
+                "count": count,
+                "sum": round(total_sum, 6),
+                "mean": round(total_sum / count, 6) if count else None,
+                "p50": round(self._quantile(series, 0.5), 6),
+                "p99": round(self._quantile(series, 0.99), 6)
+            })
+        return result
+
+    def to_prometheus(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total_sum, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {total_sum}")
+            lines.append(f"{self.name}_count{format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help_text):
+        if name not in self.metrics:
+            self.metrics[name] = Counter(name, help_text)
+        return self.metrics[name]
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, help_text, buckets)
+        return self.metrics[name]
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def to_prometheus(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.to_prometheus())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self.metrics.values():
+            if isinstance(metric, Counter):
+                metric.values.clear()
+            else:
+                metric.series.clear()
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram("defishield_stage_seconds", "Time spent in each agent pipeline stage")
+STAGE_ERRORS = registry.counter("defishield_stage_errors_total", "Pipeline stages that raised")
+HTTP_REQUESTS = registry.counter("defishield_http_requests_total", "HTTP attempts by host and status")
+HTTP_SECONDS = registry.histogram("defishield_http_request_seconds", "HTTP attempt latency by host")
+CACHE_LOOKUPS = registry.counter("defishield_cache_lookups_total", "Response cache lookups by result")
+COALESCED_CALLS = registry.counter("defishield_coalesced_calls_total", "Single-flight calls by kind, leader or shared")
+RISK_FLAGS = registry.counter("defishield_risk_flags_total", "Unusual transactions flagged while syncing, by kind")
+
+
+@contextmanager
+def span(stage):
+    """Time a block of code as a pipeline stage"""
+    started_at = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started_at, stage=stage)
+
+
+async def timed(stage, awaitable):
+    """Await a coroutine, recording its duration as a pipeline stage"""
+    with span(stage):
+        return await awaitable
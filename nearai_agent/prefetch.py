@@ -0,0 +1,155 @@
+"""Background prefetch for watched accounts.
+
+Usage:
+    python prefetch.py watch alice.near bob.near
+    python prefetch.py list
+    python prefetch.py run                # keep watched accounts warm until interrupted
+    python prefetch.py run --once         # refresh whatever is due, then exit
+
+Each refresh fetches balance, transactions, tokens and staking data through the shared response
+cache and transaction index, so the agent answers watched accounts from cache. Accounts are
+refreshed on an adaptive interval (more often the more transactions they had in the last week),
+and refreshes are bounded in concurrency and rate so interactive queries keep most of the API
+budget. Set DEFISHIELD_DATA_DIR for both this and the agent: agent runs then read the same
+response cache and transaction index instead of their own temp path.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from http_client import TokenBucket
+from log import get_logger
+from utils import AiUtils
+from watchlist import Watchlist, adaptive_interval
+
+logger = get_logger("prefetch")
+
+PREFETCH_CONCURRENCY = 2
+# Account refreshes started per second; each refresh costs about five API calls
+PREFETCH_ACCOUNTS_PER_SECOND = 0.2
+# Older history pages to sync per refresh; interactive queries skip backfill for watched accounts
+PREFETCH_BACKFILL_PAGES = 20
+# Upper bound on sleeping between scheduling passes, so newly watched accounts are picked up
+PREFETCH_IDLE_SECONDS = 60
+ACTIVITY_WINDOW_SECONDS = 7 * 24 * 60 * 60
+
+
+class PrefetchScheduler(object):
+    def __init__(self, utils, watchlist, concurrency=PREFETCH_CONCURRENCY,
+                 accounts_per_second=PREFETCH_ACCOUNTS_PER_SECOND):
+        self.utils = utils
+        self.watchlist = watchlist
+        self.concurrency = concurrency
+        self.accounts_per_second = accounts_per_second
+        self._bucket = None
+        self.refreshed = 0
+        self.failed = 0
+
+    def get_activity(self, account_id):
+        """Transactions per day over the last week, from the local index"""
+        since = (time.time() - ACTIVITY_WINDOW_SECONDS) * 10**9
+        return len(self.utils.get_account_history(account_id, since=since)) / 7.0
+
+    async def refresh(self, account_id):
+        await self._bucket.acquire()
+        started_at = time.monotonic()
+        try:
+            # max_age=0: always run the delta sync, even though the account is watched
+            await self.utils.fetch_account_overview(account_id, backfill_pages=PREFETCH_BACKFILL_PAGES, max_age=0)
+        except Exception as e:
+            logger.warning("Prefetch failed for %s: %s", account_id, e)
+            self.watchlist.record_failure(account_id)
+            self.failed += 1
+            return False
+        interval = adaptive_interval(self.get_activity(account_id))
+        self.watchlist.record_refresh(account_id, interval)
+        self.refreshed += 1
+        logger.debug("Prefetched %s in %.3fs, next in %ds", account_id, time.monotonic() - started_at, interval)
+        return True
+
+    async def run_once(self):
+        """Refresh every due account with bounded concurrency; returns how many were refreshed"""
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.accounts_per_second, self.concurrency)
+        self.watchlist.reload()
+        due = self.watchlist.get_due()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(account_id):
+            async with semaphore:
+                return await self.refresh(account_id)
+
+        results = await asyncio.gather(*(bounded(account_id) for account_id in due))
+        # Land any stale-while-revalidate refreshes in the cache before publishing the new intervals
+        await self.utils.cache.drain()
+        if due:
+            self.watchlist.save()
+        self.watchlist.apply(self.utils.cache, self.utils.tx_sync)
+        return sum(results)
+
+    async def run_forever(self, stop=None):
+        while stop is None or not stop.is_set():
+            await self.run_once()
+            next_due = self.watchlist.get_next_due()
+            delay = PREFETCH_IDLE_SECONDS if next_due is None else max(0.0, next_due - time.time())
+            delay = min(delay, PREFETCH_IDLE_SECONDS)
+            if stop is None:
+                await asyncio.sleep(delay)
+            else:
+                try:
+                    await asyncio.wait_for(stop.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def run(once, concurrency):
+    utils = AiUtils(None, None)
+    scheduler = PrefetchScheduler(utils, utils.watchlist, concurrency=concurrency)
+    try:
+        if once:
+            await scheduler.run_once()
+        else:
+            await scheduler.run_forever()
+    finally:
+        await utils.close()
+    return {"refreshed": scheduler.refreshed, "failed": scheduler.failed, "watched": len(utils.watchlist)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep watched NEAR accounts warm in the DefiShield caches")
+    parser.add_argument("--data-dir", help="cache directory shared with the agent (default: DEFISHIELD_DATA_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    watch = commands.add_parser("watch", help="add accounts to the watchlist")
+    watch.add_argument("account_ids", nargs="+")
+    unwatch = commands.add_parser("unwatch", help="remove accounts from the watchlist")
+    unwatch.add_argument("account_ids", nargs="+")
+    commands.add_parser("list", help="print the watchlist as JSON")
+    run_parser = commands.add_parser("run", help="refresh watched accounts in the background")
+    run_parser.add_argument("--once", action="store_true", help="refresh due accounts once and exit")
+    run_parser.add_argument("-c", "--concurrency", type=int, default=PREFETCH_CONCURRENCY)
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        os.environ["DEFISHIELD_DATA_DIR"] = args.data_dir
+    if args.command == "run":
+        print(json.dumps(asyncio.run(run(args.once, args.concurrency))), file=sys.stderr)
+        return 0
+
+    watchlist = Watchlist(AiUtils.get_default_data_dir())
+    if args.command == "watch":
+        for account_id in args.account_ids:
+            watchlist.watch(account_id)
+        watchlist.save()
+    elif args.command == "unwatch":
+        for account_id in args.account_ids:
+            watchlist.unwatch(account_id)
+        watchlist.save()
+    print(json.dumps(watchlist.accounts, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""Rule-table staking recommendations.
+
+Rules are declarative: an ordered list where the first rule whose conditions all hold decides the
+recommendation. Conditions compare a feature with a number, a named threshold or a list of values:
+
+    {"name": "insufficient_balance", "when": [["balance", "<", "min_balance"]],
+     "recommendation": "not_recommended", "confidence": "high", "reason": "... {min_balance} NEAR ..."}
+
+Reasons may name thresholds in str.format fields, filled in when the rules compile; literal braces
+are written {{ and }}.
+
+Rules may stake a fraction of the balance (`"stake": {"fraction": "idle_fraction"}`), optionally
+keeping the last 30 days of outflows liquid (`"keep_liquid": true`); the resulting amount is the
+`stake_amount` feature for that rule's own conditions. `staked` and `unstaked` are the NEAR already
+held in staking pools (see staking.py), zero when unknown, and `staked_share` is the staked part of
+the balance plus stake. `risk` is the 0-1 streaming risk score of recent unusual transactions (see
+risk.py).
+
+Thresholds and rules can be replaced from a JSON file named by DEFISHIELD_RULES_FILE. Rules compile
+once; a single account is checked exactly on Amounts, and a whole batch of accounts is scored in
+float NEAR with a handful of NumPy array operations.
+"""
+import json
+import operator
+import os
+from fractions import Fraction
+
+import numpy as np
+
+from amounts import Amount
+from log import get_logger
+
+logger = get_logger("recommendation")
+
+ACTIVITY_LEVELS = ("inactive", "minimally active", "moderately active", "highly active")
+ACTIVITY_CODES = {level: code for code, level in enumerate(ACTIVITY_LEVELS)}
+YOCTO_PER_NEAR = 10**24
+# Features evaluate() holds as Amounts or Fractions rather than floats
+EXACT_FEATURES = ("balance", "outflow_30d", "staked", "unstaked", "staked_share", "stake_amount")
+
+DEFAULT_THRESHOLDS = {
+    # Minimum balance (NEAR) worth staking at all
+    "min_balance": 1,
+    # Highly active accounts only stake part of a balance above this
+    "partial_min_balance": 10,
+    "partial_fraction": 0.7,
+    "quiet_fraction": 0.9,
+    "idle_fraction": 0.95,
+    "default_fraction": 0.8,
+    # Risk score above which recent unusual activity should be reviewed before locking funds
+    "risk_high": 0.6,
+    # Share of balance plus stake already staked above which the rest is left liquid
+    "staked_share_high": 0.8,
+}
+
+DEFAULT_RULES = [
+    {
+        "name": "insufficient_balance",
+        "when": [["balance", "<", "min_balance"]],
+        "recommendation": "not_recommended",
+        "confidence": "high",
+        "reason": "Insufficient balance for staking. A minimum of {min_balance} NEAR is recommended."
+    },
+    {
+        "name": "unusual_activity",
+        "when": [["risk", ">=", "risk_high"]],
+        "recommendation": "not_recommended",
+        "confidence": "medium",
+        "reason": "Unusual recent activity was detected on this account, such as unusually large transfers or transfers to new recipients. Review these transactions before locking funds in staking."
+    },
+    {
+        "name": "mostly_staked",
+        "when": [["staked_share", ">=", "staked_share_high"]],
+        "recommendation": "not_recommended",
+        "confidence": "medium",
+        "reason": "Most of your NEAR is already staked. Keeping the remaining balance liquid leaves room for fees and transfers without unstaking."
+    },
+    {
+        "name": "active_partial_stake",
+        "when": [["activity", "==", "highly active"], ["recent", "==", True], ["balance", ">", "partial_min_balance"]],
+        "stake": {"fraction": "partial_fraction"},
+        "recommendation": "partial_stake",
+        "confidence": "medium",
+        "reason": "Your account is very active with recent transactions. Consider staking only a portion of your balance to maintain liquidity for continued activity."
+    },
+    {
+        "name": "active_keep_liquid",
+        "when": [["activity", "==", "highly active"], ["recent", "==", True]],
+        "recommendation": "not_recommended",
+        "confidence": "medium",
+        "reason": "Your account is very active with recent transactions, and your balance suggests you may need liquidity for continued activity."
+    },
+    {
+        "name": "quiet_history",
+        "when": [["activity", "in", ["moderately active", "minimally active"]], ["recent", "==", False]],
+        "stake": {"fraction": "quiet_fraction"},
+        "recommendation": "recommended",
+        "confidence": "high",
+        "reason": "Your account shows some historical activity but has been quiet recently. Staking would be a good way to earn rewards on your idle NEAR."
+    },
+    {
+        "name": "inactive",
+        "when": [["activity", "==", "inactive"]],
+        "stake": {"fraction": "idle_fraction"},
+        "recommendation": "highly_recommended",
+        "confidence": "high",
+        "reason": "Your account shows minimal activity, making it an excellent candidate for staking to earn rewards on your NEAR."
+    },
+    {
+        "name": "default",
+        "when": [],
+        "stake": {"fraction": "default_fraction"},
+        "recommendation": "recommended",
+        "confidence": "medium",
+        "reason": "Based on your balance and account activity, staking appears to be a reasonable option."
+    },
+]
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "in": lambda column, values: np.isin(column, values) if isinstance(column, np.ndarray) else column in values,
+}
+
+
+class RuleConfigError(ValueError):
+    pass
+
+
+def load_rules_config(path=None):
+    """Return (thresholds, rules): the defaults, overridden by a JSON config file if one is given"""
+    path = path or os.environ.get("DEFISHIELD_RULES_FILE")
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    rules = DEFAULT_RULES
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+        thresholds.update(config.get("thresholds", {}))
+        rules = config.get("rules", rules)
+        logger.info("Loaded recommendation rules from %s", path)
+    return thresholds, rules
+
+
+class FeatureFrame(object):
+    """Columns of per-account features the rules are evaluated over"""
+
+    def __init__(self, balance, activity, recent, outflow_30d, staked=None, unstaked=None, risk=None):
+        self.balance = np.asarray(balance, dtype=np.float64)
+        self.activity = np.asarray(activity, dtype=np.int8)
+        self.recent = np.asarray(recent, dtype=bool)
+        self.outflow_30d = np.asarray(outflow_30d, dtype=np.float64)
+        self.staked = np.zeros(len(self.balance)) if staked is None else np.asarray(staked, dtype=np.float64)
+        self.unstaked = np.zeros(len(self.balance)) if unstaked is None else np.asarray(unstaked, dtype=np.float64)
+        self.risk = np.zeros(len(self.balance)) if risk is None else np.asarray(risk, dtype=np.float64)
+        holdings = self.balance + self.staked
+        self.staked_share = np.divide(self.staked, holdings, out=np.zeros(len(self.balance)), where=holdings > 0)
+
+    def __len__(self):
+        return len(self.balance)
+
+    @classmethod
+    def from_analyses(cls, balances, analyses, stakings=None):
+        """Build a frame from NEAR balances, analyze_transactions() results and optional staking summaries"""
+        balance, activity, recent, outflow_30d, staked, unstaked, risk = [], [], [], [], [], [], []
+        for i, (account_balance, analysis) in enumerate(zip(balances, analyses)):
+            stats = analysis.get("stats") or {}
+            staking = (stakings[i] if stakings is not None else None) or {}
+            balance.append(float(account_balance))
+            activity.append(ACTIVITY_CODES.get(analysis.get("activity_level", "inactive"), 0))
+            recent.append(bool(analysis.get("recent_activity", False)))
+            outflow_30d.append(stats.get("outflow_30d_yocto", 0) / YOCTO_PER_NEAR)
+            staked.append(float(staking.get("total_staked", 0)))
+            unstaked.append(float(staking.get("total_unstaked", 0)))
+            risk.append((analysis.get("risk") or {}).get("score", 0.0))
+        return cls(balance, activity, recent, outflow_30d, staked, unstaked, risk)
+
+
+class CompiledRule(object):
+    __slots__ = ("index", "name", "conditions", "exact_conditions", "fraction", "keep_liquid", "result")
+
+    def __init__(self, index, rule, thresholds):
+        self.index = index
+        self.name = rule.get("name", f"rule_{index}")
+        self.conditions = [self.compile_condition(condition, thresholds) for condition in rule.get("when", [])]
+        # Exact amounts and ratios are compared with the decimal a float threshold was written as
+        self.exact_conditions = [
+            (feature, compare,
+             Fraction(repr(value)) if feature in EXACT_FEATURES and isinstance(value, float) else value)
+            for feature, compare, value in self.conditions
+        ]
+        stake = rule.get("stake")
+        self.fraction = self.resolve(stake["fraction"], thresholds) if stake else None
+        self.keep_liquid = bool(stake and stake.get("keep_liquid"))
+        self.result = {key: rule[key] for key in ("recommendation", "reason", "confidence") if key in rule}
+        if "recommendation" not in self.result:
+            raise RuleConfigError(f"Rule {self.name} has no recommendation")
+        if "reason" in self.result:
+            try:
+                self.result["reason"] = self.result["reason"].format_map(thresholds)
+            except (KeyError, IndexError, ValueError) as e:
+                raise RuleConfigError(f"Invalid reason in rule {self.name}: {e!r}")
+
+    def resolve(self, value, thresholds):
+        if isinstance(value, str) and value in thresholds:
+            return thresholds[value]
+        return value
+
+    def compile_condition(self, condition, thresholds):
+        try:
+            feature, op, value = condition
+            compare = OPERATORS[op]
+        except (KeyError, TypeError, ValueError):
+            raise RuleConfigError(f"Invalid condition {condition!r} in rule {self.name}")
+        if feature == "activity":
+            values = value if isinstance(value, list) else [value]
+            codes = [ACTIVITY_CODES[level] if isinstance(level, str) else level for level in values]
+            value = codes if isinstance(value, list) else codes[0]
+        elif feature not in ("balance", "recent", "outflow_30d", "staked", "unstaked", "staked_share", "risk",
+                             "stake_amount"):
+            raise RuleConfigError(f"Unknown feature {feature!r} in rule {self.name}")
+        else:
+            value = self.resolve(value, thresholds)
+        return feature, compare, value
+
+    def stake_amounts(self, frame):
+        amounts = frame.balance * self.fraction
+        if self.keep_liquid:
+            amounts = np.minimum(amounts, frame.balance - frame.outflow_30d)
+        return amounts
+
+    def stake_amount(self, features):
+        """Exact stake for one account's features (see RecommendationEngine.evaluate)"""
+        amount = features["balance"] * self.fraction
+        if self.keep_liquid:
+            amount = min(amount, features["balance"] - features["outflow_30d"])
+        return amount
+
+    def matches_one(self, features):
+        for feature, compare, value in self.exact_conditions:
+            column = self.stake_amount(features) if feature == "stake_amount" else features[feature]
+            if not compare(column, value):
+                return False
+        return True
+
+    def matches(self, frame):
+        mask = np.ones(len(frame), dtype=bool)
+        for feature, compare, value in self.conditions:
+            column = self.stake_amounts(frame) if feature == "stake_amount" else getattr(frame, feature)
+            mask &= compare(column, value)
+        return mask
+
+
+class RecommendationEngine(object):
+    """Ordered rule table compiled once; evaluates one account or a whole FeatureFrame"""
+
+    def __init__(self, thresholds=None, rules=None):
+        if thresholds is None or rules is None:
+            default_thresholds, default_rules = load_rules_config()
+            thresholds = default_thresholds if thresholds is None else dict(default_thresholds, **thresholds)
+            rules = default_rules if rules is None else rules
+        self.thresholds = thresholds
+        self.rules_config = rules
+        self.rules = [CompiledRule(i, rule, thresholds) for i, rule in enumerate(rules)]
+        if not self.rules or self.rules[-1].conditions:
+            raise RuleConfigError("The last rule must have no conditions so every account gets a recommendation")
+
+    def with_thresholds(self, **overrides):
+        """A new engine with the same rules and some thresholds changed, for what-if runs"""
+        return RecommendationEngine(dict(self.thresholds, **overrides), self.rules_config)
+
+    def evaluate_batch(self, frame):
+        """Return (rule index per account, suggested stake per account in NEAR, NaN when none)"""
+        n = len(frame)
+        decided = np.zeros(n, dtype=bool)
+        choice = np.zeros(n, dtype=np.int16)
+        suggested = np.full(n, np.nan)
+        for rule in self.rules:
+            mask = rule.matches(frame) & ~decided
+            choice[mask] = rule.index
+            if rule.fraction is not None:
+                suggested[mask] = np.floor(rule.stake_amounts(frame)[mask] * 100) / 100
+            decided |= mask
+            if decided.all():
+                break
+        return choice, suggested
+
+    def evaluate(self, balance, transaction_analysis, staking=None):
+        """Recommendation dict for one account; thresholds are compared exactly on Amounts"""
+        stats = transaction_analysis.get("stats") or {}
+        balance = balance if isinstance(balance, Amount) else Amount.from_units(balance)
+        staked = (staking or {}).get("total_staked", Amount(0))
+        holdings = balance + staked
+        features = {
+            "balance": balance,
+            "activity": ACTIVITY_CODES.get(transaction_analysis.get("activity_level", "inactive"), 0),
+            "recent": bool(transaction_analysis.get("recent_activity", False)),
+            "outflow_30d": Amount(stats.get("outflow_30d_yocto", 0)),
+            "staked": staked,
+            "unstaked": (staking or {}).get("total_unstaked", Amount(0)),
+            # Exact ratio, so a float threshold is compared without rounding
+            "staked_share": Fraction(staked.raw, holdings.raw) if holdings.raw > 0 else Fraction(0),
+            "risk": (transaction_analysis.get("risk") or {}).get("score", 0.0),
+        }
+        rule = next(rule for rule in self.rules if rule.matches_one(features))
+        suggested_amount = round(rule.stake_amount(features), 2) if rule.fraction is not None else None
+        return self.make_recommendation(rule, suggested_amount, staking, transaction_analysis.get("risk"))
+
+    def evaluate_many(self, balances, analyses, stakings=None):
+        """Recommendation dicts like evaluate() for many accounts, scored in one evaluate_batch() pass.
+
+        Features are compared in float NEAR, so an account within rounding of a threshold may land on
+        the other side of it than evaluate() would put it.
+        """
+        stakings = list(stakings) if stakings is not None else [None] * len(analyses)
+        choice, suggested = self.evaluate_batch(FeatureFrame.from_analyses(balances, analyses, stakings))
+        return [
+            self.make_recommendation(self.rules[index], None if np.isnan(amount) else Amount.from_units(f"{amount:.2f}"),
+                                     staking, analysis.get("risk"))
+            for index, amount, staking, analysis in zip(choice, suggested, stakings, analyses)
+        ]
+
+    def make_recommendation(self, rule, suggested_amount, staking, risk):
+        recommendation = dict(rule.result)
+        if suggested_amount is not None:
+            recommendation["suggested_amount"] = suggested_amount
+        if staking:
+            recommendation["staking"] = {
+                "total_staked": staking.get("total_staked", Amount(0)),
+                "total_unstaked": staking.get("total_unstaked", Amount(0)),
+                "pools": len(staking.get("pools", [])),
+                "weighted_fee": staking.get("weighted_fee")
+            }
+        # Only while flags still weigh on the score; flag_count is all-time
+        if risk and risk["level"] != "low":
+            recommendation["risk"] = {"score": risk["score"], "level": risk["level"], "flags": risk["flags"]}
+        return recommendation
+
+    def count_recommendations(self, choice):
+        """Accounts per recommendation for an evaluate_batch() result"""
+        counts = np.bincount(choice, minlength=len(self.rules))
+        totals = {}
+        for rule, count in zip(self.rules, counts):
+            name = rule.result["recommendation"]
+            totals[name] = totals.get(name, 0) + int(count)
+        return totals
+
+    def sweep(self, frame, threshold, values):
+        """Recommendation counts over a frame for each candidate value of one threshold"""
+        results = []
+        for value in values:
+            choice, _ = self.with_thresholds(**{threshold: value}).evaluate_batch(frame)
+            results.append({"value": value, "counts": self.count_recommendations(choice)})
+        return results
@@ -0,0 +1,206 @@
+"""Rendering of staking recommendations and transaction rows as markdown, plain text or JSON.
+
+Static sections (headers, the considerations block, the disclaimer) are built once per format at
+import, templates are bound `str.format` methods, and renderers write into a single `write` callable
+so a reply is joined from one buffer. Transaction rows are described once per batch, with each
+distinct minute formatted only once, and every format renders from the same rows, so plain text and
+JSON cost no more per row than markdown. JSON renders the recommendation as one object and
+transactions as one object per line, so streamed chunks concatenate into JSON Lines.
+"""
+import json
+from datetime import datetime
+from functools import lru_cache
+from json.encoder import encode_basestring_ascii as encode_string
+
+from amounts import format_near, json_default
+from log import get_logger
+
+logger = get_logger("rendering")
+
+FORMATS = ("markdown", "text", "json")
+NS_PER_SECOND = 10**9
+# Distinct minutes whose formatted prefix is kept; a page of history rarely spans more than a few
+TIMESTAMP_CACHE_MINUTES = 4096
+
+TITLES = {
+    "highly_recommended": ("✅", "Staking is Highly Recommended"),
+    "recommended": ("✅", "Staking is Recommended"),
+    "partial_stake": ("⚠️", "Partial Staking Recommended"),
+}
+NOT_RECOMMENDED = ("❌", "Staking is Not Recommended")
+CONSIDERATIONS = (
+    "Staking involves locking up your NEAR tokens",
+    "There is a waiting period when unstaking (typically 2-3 days)",
+    "APY rates vary by validator, typically ranging from 8-12%",
+    "Choose validators carefully - consider their track record and fees",
+)
+DISCLAIMER = ("This recommendation is provided based on your account's transaction history and balance. "
+              "Always do your own research before making financial decisions.")
+
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_MINUTES)
+def format_minute(minute):
+    return datetime.fromtimestamp(minute * 60).strftime("%Y-%m-%d %H:%M:")
+
+
+def format_timestamps(timestamps):
+    """Local "YYYY-MM-DD HH:MM:SS" for nanosecond timestamps ("Unknown" for None), formatting each minute once"""
+    formatted = []
+    for timestamp in timestamps:
+        if timestamp is None:
+            formatted.append("Unknown")
+            continue
+        minute, second = divmod(int(timestamp) // NS_PER_SECOND, 60)
+        formatted.append(format_minute(minute) + ("0" + str(second) if second < 10 else str(second)))
+    return formatted
+
+
+def describe_action(action):
+    kind = action.get("action", "Unknown")
+    args = action.get("args", {})
+    if kind == "TRANSFER":
+        # Convert yoctoNEAR to NEAR exactly
+        return f"Transfer: {format_near(args.get('deposit', '0'))} NEAR"
+    if kind == "FUNCTION_CALL":
+        return f"Function: {args.get('method_name', 'Unknown')}"
+    return kind
+
+
+def describe_transactions(transactions):
+    """(hash, actions, status, timestamp) per transaction, or None for one that cannot be read"""
+    rows = []
+    timestamps = []
+    for tx in transactions:
+        try:
+            tx_hash = tx.get("transaction_hash", tx.get("hash", "Unknown"))
+            block_timestamp = tx.get("block_timestamp", "Unknown")
+            timestamps.append(None if block_timestamp == "Unknown" else int(block_timestamp))
+            actions = []
+            for action in tx.get("actions", []):
+                try:
+                    actions.append(describe_action(action))
+                except Exception as e:
+                    logger.warning("Error processing action in %s: %s", tx_hash, e)
+                    actions.append("Error processing action")
+            rows.append((str(tx_hash), actions or ["Unknown action"], tx.get("outcomes", {}).get("status", "Unknown")))
+        except Exception as e:
+            logger.warning("Error processing transaction: %s", e)
+            if len(timestamps) > len(rows):
+                timestamps.pop()
+            rows.append(None)
+    formatted = iter(format_timestamps(timestamps))
+    return [row + (next(formatted),) if row is not None else None for row in rows]
+
+
+class MarkdownRenderer(object):
+    name = "markdown"
+    content_type = "text/markdown"
+    HEADERS = {rec_type: f"# {emoji} {title}\n\n" for rec_type, (emoji, title) in TITLES.items()}
+    DEFAULT_HEADER = "# {} {}\n\n".format(*NOT_RECOMMENDED)
+    BODY = "{0}**Account:** [{1}](https://nearblocks.io/address/{1})\n\n**Current Balance:** {2} NEAR\n\n" \
+           "**Recommendation:** {3}\n\n".format
+    SUGGESTED = "**Suggested Staking Amount:** {} NEAR\n\n".format
+    STAKED = "**Currently Staked:** {} NEAR across {} pool(s)".format
+    FEE = " (average fee {:.1f}%)".format
+    UNSTAKED = "**Unstaked (pending or withdrawable):** {} NEAR\n\n".format
+    RISK = "**Risk:** {} (score {:.2f}), {} recent unusual transaction(s) flagged\n\n".format
+    FOOTER = ("## Important Considerations\n\n" + "".join(f"- {line}\n" for line in CONSIDERATIONS) +
+              f"\n*{DISCLAIMER}*")
+    SECTION = "\n\n## Recent Transactions"
+    ROW = "\n- **[{0:.8}...](https://nearblocks.io/txns/{0})** | {1} | Status: {2} | {3}\n".format
+    ERROR_ROW = "\n- Error processing transaction\n"
+    NO_TRANSACTIONS = "\n\n**No recent transactions found**"
+
+    def write_recommendation(self, write, account_id, balance, recommendation):
+        write(self.BODY(self.HEADERS.get(recommendation.get("recommendation", ""), self.DEFAULT_HEADER), account_id,
+                        balance, recommendation.get("reason", "")))
+        suggested_amount = recommendation.get("suggested_amount")
+        if suggested_amount:
+            write(self.SUGGESTED(suggested_amount))
+        staking = recommendation.get("staking")
+        if staking and staking["pools"]:
+            write(self.STAKED(staking["total_staked"], staking["pools"]))
+            if staking["weighted_fee"] is not None:
+                write(self.FEE(staking["weighted_fee"] * 100))
+            write("\n\n")
+            if staking["total_unstaked"]:
+                write(self.UNSTAKED(staking["total_unstaked"]))
+        risk = recommendation.get("risk")
+        if risk:
+            write(self.RISK(risk["level"], risk["score"], len({flag["transaction_hash"] for flag in risk["flags"]})))
+        write(self.FOOTER)
+
+    def write_transactions(self, write, transactions):
+        rows = describe_transactions(transactions)
+        if not rows:
+            write(self.NO_TRANSACTIONS)
+            return
+        for row in rows:
+            write(self.ERROR_ROW if row is None else self.ROW(row[0], ", ".join(row[1]), row[2], row[3]))
+
+
+class TextRenderer(MarkdownRenderer):
+    name = "text"
+    content_type = "text/plain"
+    HEADERS = {rec_type: f"{title}\n\n" for rec_type, (_, title) in TITLES.items()}
+    DEFAULT_HEADER = NOT_RECOMMENDED[1] + "\n\n"
+    BODY = "{0}Account: {1}\nCurrent Balance: {2} NEAR\n\nRecommendation: {3}\n\n".format
+    SUGGESTED = "Suggested Staking Amount: {} NEAR\n\n".format
+    STAKED = "Currently Staked: {} NEAR across {} pool(s)".format
+    UNSTAKED = "Unstaked (pending or withdrawable): {} NEAR\n\n".format
+    RISK = "Risk: {} (score {:.2f}), {} recent unusual transaction(s) flagged\n\n".format
+    FOOTER = "Important Considerations:\n" + "".join(f"- {line}\n" for line in CONSIDERATIONS) + f"\n{DISCLAIMER}"
+    SECTION = "\n\nRecent Transactions:"
+    ROW = "\n{0} | {1} | Status: {2} | {3}".format
+    ERROR_ROW = "\nError processing transaction"
+    NO_TRANSACTIONS = "\n\nNo recent transactions found"
+
+
+class JsonRenderer(object):
+    name = "json"
+    content_type = "application/json"
+    SECTION = ""
+    NO_TRANSACTIONS = ""
+    ROW = '\n{{"hash": {}, "actions": [{}], "status": {}, "timestamp": "{}"}}'.format
+    ERROR_ROW = '\n{"error": "Error processing transaction"}'
+    STATUSES = {True: "true", False: "false", None: "null"}
+
+    def write_recommendation(self, write, account_id, balance, recommendation):
+        write(json.dumps({
+            "account_id": account_id,
+            "balance": balance,
+            "recommendation": recommendation,
+            "considerations": CONSIDERATIONS,
+            "disclaimer": DISCLAIMER
+        }, default=json_default))
+
+    def write_transactions(self, write, transactions):
+        # Rows are assembled from a template with C-escaped strings rather than a dict per row through json.dumps
+        for row in describe_transactions(transactions):
+            if row is None:
+                write(self.ERROR_ROW)
+                continue
+            status = self.STATUSES.get(row[2]) if isinstance(row[2], bool) or row[2] is None else json.dumps(row[2])
+            write(self.ROW(encode_string(row[0]), ", ".join(map(encode_string, row[1])), status, row[3]))
+
+
+RENDERERS = {renderer.name: renderer for renderer in (MarkdownRenderer(), TextRenderer(), JsonRenderer())}
+
+
+def get_renderer(fmt="markdown"):
+    try:
+        return RENDERERS[fmt]
+    except KeyError:
+        raise ValueError(f"Unknown output format {fmt!r}; expected one of {', '.join(FORMATS)}")
+
+
+def render_recommendation(account_id, balance, recommendation, fmt="markdown"):
+    parts = []
+    get_renderer(fmt).write_recommendation(parts.append, account_id, balance, recommendation)
+    return "".join(parts)
+
+
+def render_transactions(transactions, fmt="markdown"):
+    parts = []
+    get_renderer(fmt).write_transactions(parts.append, transactions)
+    return "".join(parts)
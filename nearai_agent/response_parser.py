@@ -0,0 +1,104 @@
+"""Linear-time extraction of a JSON object from free-form model output.
+
+A reply is parsed as-is if it is valid JSON. Otherwise the first fenced block (```json ... ```) is
+used, or, failing that, the first balanced {...} object. Brace matching is a single forward scan
+over the braces, quotes and backslashes, tracking whether it is inside a string literal and whether
+the next character is escaped, so nothing is rescanned and megabyte inputs parse in bounded time.
+"""
+import json
+import re
+
+FENCE = "```"
+# A fence's optional language tag, e.g. ```json
+FENCE_TAG = re.compile(r"[A-Za-z0-9_+-]*[ \t]*\r?\n")
+# The only characters that change brace-matching state
+BRACE_TOKEN = re.compile(r'[{}"\\]')
+
+# strict=False accepts raw newlines inside strings, which models often emit
+decoder = json.JSONDecoder(strict=False)
+
+PARSE_ERROR = {"message": "JSON decode error"}
+
+
+def find_balanced_object(text, start=0):
+    """Return the first balanced {...} at or after start, or None if the braces never close"""
+    begin = text.find("{", start)
+    if begin == -1:
+        return None
+    depth = 0
+    in_string = False
+    # Position of the character escaped by the last backslash inside a string
+    escaped = -1
+    for match in BRACE_TOKEN.finditer(text, begin):
+        position = match.start()
+        if position == escaped:
+            continue
+        token = match.group()
+        if in_string:
+            if token == "\\":
+                escaped = position + 1
+            elif token == '"':
+                in_string = False
+        elif token == '"':
+            in_string = True
+        elif token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return text[begin:position + 1]
+    return None
+
+
+def find_fenced_block(text):
+    """Return the body of the first closed ``` fence without its language tag, or None"""
+    start = text.find(FENCE)
+    if start == -1:
+        return None
+    end = text.find(FENCE, start + len(FENCE))
+    if end == -1:
+        return None
+    body = text[start + len(FENCE):end]
+    tag = FENCE_TAG.match(body)
+    if tag:
+        body = body[tag.end():]
+    return body.strip()
+
+
+def extract_json(text):
+    """Return the substring most likely to hold the reply's JSON object"""
+    block = find_fenced_block(text)
+    if block is not None:
+        if block[:1] in ("{", "["):
+            return block
+        return find_balanced_object(block) or block
+    obj = find_balanced_object(text)
+    if obj is not None:
+        return obj
+    begin = text.find("{")
+    return text[begin:] if begin != -1 else text
+
+
+def try_decode(text):
+    try:
+        return decoder.decode(text), True
+    except (ValueError, RecursionError):
+        # RecursionError: nesting deeper than the decoder's stack allows
+        return None, False
+
+
+def parse_response(text):
+    """Parse a model reply into JSON, returning {"message": "JSON decode error"} if nothing parses"""
+    value, ok = try_decode(text)
+    if ok:
+        return value
+    candidate = extract_json(text)
+    value, ok = try_decode(candidate)
+    if ok:
+        return value
+    # Models sometimes end statements with semicolons
+    if ";" in candidate:
+        value, ok = try_decode(candidate.replace(";", ""))
+        if ok:
+            return value
+    return dict(PARSE_ERROR)
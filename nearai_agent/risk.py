@@ -0,0 +1,226 @@
+"""Streaming risk scoring over synced transactions.
+
+Every account has a fixed-size RiskState that the transaction index updates as each page is stored,
+so scoring never rescans history:
+
+- outflows as a time-decayed sum (half-life RISK_HALF_LIFE_DAYS), which gives the same result
+  whatever order transactions arrive in, so older backfilled pages fold in correctly;
+- an exponentially weighted mean and variance of log deposit sizes, for z-scores of new deposits;
+- a Bloom filter of counterparties, to notice first-time recipients and contracts.
+
+Once the first page has trained the state, transactions newer than anything seen before are
+checked and may be flagged: unusually large deposits, outflow spikes, transfers to new recipients
+and calls to new contracts. Older pages from a backfill only train the state. Flags decay with the
+same half-life into a 0-1 risk score.
+"""
+import base64
+import hashlib
+import math
+import time
+
+from analytics import ACTION_CODES, NS_PER_SECOND, YOCTO_PER_NEAR, get_action_deposit
+from log import get_logger
+from metrics import RISK_FLAGS
+
+logger = get_logger("risk")
+
+RISK_HALF_LIFE_DAYS = 7
+# Weight of each new deposit in the moving mean and variance of log deposit sizes
+RISK_EW_ALPHA = 0.05
+# Deposits (for z-scores and spikes) or transactions (for novelty) seen before flags are trusted
+RISK_MIN_SAMPLES = 10
+RISK_Z_THRESHOLD = 3.0
+# Deposits below this (NEAR), such as the 1 yocto attached to most calls, carry no size signal
+RISK_MIN_DEPOSIT = 0.001
+# Floor on the log-size standard deviation, so an account that always sends the same amount is not
+# flagged for a slightly larger one
+RISK_MIN_LOG_STD = 0.5
+# A single outflow this many times the decayed recent outflow total is a spike
+RISK_SPIKE_MULTIPLE = 5.0
+RISK_MAX_FLAGS = 20
+# Flags older than this many half-lives (decayed below 1/16) are no longer reported as recent
+RISK_RECENT_HALF_LIVES = 4
+BLOOM_BITS = 8192
+BLOOM_HASHES = 4
+# Score added by each kind of flag before decay; the score is 1 - exp(-sum)
+FLAG_SEVERITY = {
+    "outflow_spike": 0.5,
+    "large_deposit": 0.4,
+    "new_recipient": 0.2,
+    "new_contract": 0.1,
+}
+RISK_LEVELS = ((0.6, "high"), (0.3, "elevated"), (0.0, "low"))
+
+HALF_LIFE_NS = RISK_HALF_LIFE_DAYS * 24 * 60 * 60 * NS_PER_SECOND
+TRANSFER = ACTION_CODES["TRANSFER"]
+
+
+def decay(elapsed_ns):
+    return 0.5 ** (elapsed_ns / HALF_LIFE_NS) if elapsed_ns > 0 else 1.0
+
+
+class BloomFilter(object):
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=None):
+        self.bits = bytearray(BLOOM_BITS // 8) if bits is None else bytearray(bits)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % BLOOM_BITS for i in range(BLOOM_HASHES)]
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(item))
+
+    def add(self, item):
+        """Add an item; True if it was (probably) not there before"""
+        new = False
+        for p in self.positions(item):
+            if not self.bits[p >> 3] & (1 << (p & 7)):
+                self.bits[p >> 3] |= 1 << (p & 7)
+                new = True
+        return new
+
+
+class RiskState(object):
+    """O(1)-size online statistics and recent flags for one account"""
+
+    __slots__ = ("watermark", "observed", "samples", "ew_mean", "ew_var", "outflow", "pressure", "ref_ns",
+                 "counterparties", "bloom", "flags", "flag_count")
+
+    def __init__(self):
+        # Newest block timestamp observed; only newer transactions are checked for anomalies
+        self.watermark = 0
+        self.observed = 0
+        self.samples = 0
+        self.ew_mean = 0.0
+        self.ew_var = 0.0
+        # Decayed outflow (NEAR) and decayed flag severity, both as of ref_ns
+        self.outflow = 0.0
+        self.pressure = 0.0
+        self.ref_ns = 0
+        self.counterparties = 0
+        self.bloom = BloomFilter()
+        self.flags = []
+        self.flag_count = 0
+
+    def add_decayed(self, field, value, timestamp):
+        """Add value at timestamp to a decayed sum, moving the reference time forward if needed"""
+        if timestamp > self.ref_ns:
+            factor = decay(timestamp - self.ref_ns)
+            self.outflow *= factor
+            self.pressure *= factor
+            self.ref_ns = timestamp
+            setattr(self, field, getattr(self, field) + value)
+        else:
+            setattr(self, field, getattr(self, field) + value * decay(self.ref_ns - timestamp))
+
+    def update_sizes(self, deposit):
+        x = math.log1p(deposit)
+        if self.samples == 0:
+            self.ew_mean = x
+        else:
+            delta = x - self.ew_mean
+            self.ew_mean += RISK_EW_ALPHA * delta
+            self.ew_var = (1 - RISK_EW_ALPHA) * (self.ew_var + RISK_EW_ALPHA * delta * delta)
+        self.samples += 1
+
+    def z_score(self, deposit):
+        return (math.log1p(deposit) - self.ew_mean) / max(math.sqrt(self.ew_var), RISK_MIN_LOG_STD)
+
+    def observe(self, tx, account_id, check=True, check_since=None):
+        """Fold one transaction into the state; returns the flags raised for it (none unless check)"""
+        timestamp = int(tx.get("block_timestamp", 0) or 0)
+        signer = tx.get("signer_account_id", tx.get("predecessor_account_id"))
+        outgoing = signer == account_id
+        counterparty = tx.get("receiver_account_id") if outgoing else signer
+        actions = tx.get("actions") or []
+        deposit = sum(get_action_deposit(action) for action in actions) / YOCTO_PER_NEAR
+        if deposit < RISK_MIN_DEPOSIT:
+            deposit = 0.0
+        kinds = {ACTION_CODES.get(action.get("action"), -1) for action in actions}
+        newer = timestamp > self.watermark
+        # A delta page stored after a newer one is still new if it is past the history it was synced against
+        live = check and (newer or (check_since is not None and timestamp > check_since))
+        established = self.samples >= RISK_MIN_SAMPLES
+
+        flags = []
+        if live and established and deposit > 0:
+            if self.z_score(deposit) > RISK_Z_THRESHOLD:
+                flags.append("large_deposit")
+            recent_outflow = decay(timestamp - self.ref_ns) * self.outflow
+            if outgoing and deposit > RISK_SPIKE_MULTIPLE * recent_outflow:
+                flags.append("outflow_spike")
+        if live and self.observed >= RISK_MIN_SAMPLES and outgoing and counterparty and counterparty not in self.bloom:
+            flags.append("new_recipient" if TRANSFER in kinds else "new_contract")
+        self.observed += 1
+
+        if counterparty and self.bloom.add(counterparty):
+            self.counterparties += 1
+        if outgoing and deposit > 0:
+            self.add_decayed("outflow", deposit, timestamp)
+        # Older, backfilled deposits only train the size statistics until they are established
+        if deposit > 0 and (live or not established):
+            self.update_sizes(deposit)
+        if newer:
+            self.watermark = timestamp
+
+        for kind in flags:
+            self.add_decayed("pressure", FLAG_SEVERITY[kind], timestamp)
+            self.flag_count += 1
+            RISK_FLAGS.inc(kind=kind)
+            self.flags.append({"kind": kind, "transaction_hash": tx.get("transaction_hash"), "timestamp": timestamp,
+                               "counterparty": counterparty, "deposit_near": round(deposit, 6)})
+            logger.info("Risk flag %s for %s: %s", kind, account_id, tx.get("transaction_hash"))
+        del self.flags[:-RISK_MAX_FLAGS]
+        return flags
+
+    def observe_page(self, transactions, account_id, check_since=None):
+        """Fold in a page of transactions oldest first, so flags see the history before them.
+
+        The first page stored for an account is its existing history and only trains the state.
+        Transactions newer than check_since are checked even when older than the watermark, as for
+        delta pages stored newest page first.
+        """
+        ordered = sorted(transactions, key=lambda tx: int(tx.get("block_timestamp", 0) or 0))
+        check = self.watermark > 0
+        return sum(len(self.observe(tx, account_id, check, check_since)) for tx in ordered)
+
+    def get_score(self, now_ns=None):
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        return 1.0 - math.exp(-self.pressure * decay(now_ns - self.ref_ns))
+
+    def summary(self, now_ns=None):
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        score = self.get_score(now_ns)
+        recent_since = now_ns - RISK_RECENT_HALF_LIVES * HALF_LIFE_NS
+        return {
+            "score": round(score, 4),
+            "level": next(level for bound, level in RISK_LEVELS if score >= bound),
+            "flags": [flag for flag in reversed(self.flags) if flag["timestamp"] >= recent_since],
+            "flag_count": self.flag_count,
+            "observed": self.observed,
+            "counterparties": self.counterparties
+        }
+
+    def to_dict(self):
+        state = {name: getattr(self, name) for name in self.__slots__ if name != "bloom"}
+        state["bloom"] = base64.b64encode(bytes(self.bloom.bits)).decode()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        risk = cls()
+        for name in cls.__slots__:
+            if name == "bloom":
+                risk.bloom = BloomFilter(base64.b64decode(state["bloom"]))
+            elif name in state:
+                setattr(risk, name, state[name])
+        return risk
+
+
+def empty_summary():
+    """Risk summary for an account with no synced history"""
+    return RiskState().summary()
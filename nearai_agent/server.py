@@ -0,0 +1,316 @@
+"""Long-lived DefiShield agent server.
+
+Usage:
+    python server.py --workers 4 --port 8080      # HTTP front end
+    python server.py --stdin < messages.jsonl     # JSONL front end, results on stdout
+
+HTTP: POST /message with {"message": "..."} answers {"ok": ..., "replies": [...], "elapsed_ms": ...};
+GET /stats reports the worker's requests per second and latency, GET /metrics the Prometheus metrics.
+JSONL: one {"id": ..., "message": ...} object per line in, one result per line out as each completes.
+Either may ask for a reply "format" of markdown (the default), text or json (see rendering.py).
+
+Unlike a NEAR AI run, which imports everything and builds AiUtils for every message, each worker
+process keeps one AiUtils, its pooled HTTP client and the in-memory caches across messages. The agent
+modules are imported once in the parent and shared with the forked workers; py_near and the signing
+libraries are only imported when first needed. Workers share the port (SO_REUSEPORT) so the kernel
+spreads connections across cores, and they share the disk cache and transaction index in
+DEFISHIELD_DATA_DIR. Each worker logs its requests per second every --report-seconds.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from log import get_logger
+
+logger = get_logger("server")
+
+SERVER_HOST = os.environ.get("DEFISHIELD_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("DEFISHIELD_SERVER_PORT", "8080"))
+SERVER_WORKERS = os.cpu_count() or 1
+# Messages handled at once per worker; later ones wait for a slot
+SERVER_CONCURRENCY = 64
+SERVER_REPORT_SECONDS = 10
+MAX_MESSAGE_BYTES = 16 * 1024
+
+
+class RequestEnvironment(object):
+    """The subset of the NEAR AI Environment the agent uses, for one served message"""
+
+    def __init__(self, message, temp_path):
+        self.messages = [{"role": "user", "content": message}]
+        self.replies = []
+        self.temp_path = temp_path
+
+    def get_last_message(self):
+        return self.messages[-1]
+
+    def list_messages(self):
+        return list(self.messages)
+
+    def add_reply(self, message):
+        self.replies.append(message)
+
+    def get_agent_temp_path(self):
+        return self.temp_path
+
+
+class ServerStats(object):
+    """Request counts and latencies, in total and for the current reporting window"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.reset_window()
+
+    def reset_window(self):
+        self.window_started_at = time.monotonic()
+        self.window_completed = 0
+        self.window_latencies_ms = []
+
+    def record(self, result):
+        self.completed += 1
+        self.window_completed += 1
+        if not result["ok"]:
+            self.failed += 1
+        self.window_latencies_ms.append(result["elapsed_ms"])
+
+    def snapshot(self, reset=False):
+        now = time.monotonic()
+        window = now - self.window_started_at
+        uptime = now - self.started_at
+        latencies = sorted(self.window_latencies_ms)
+        snapshot = {
+            "pid": os.getpid(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "uptime_s": round(uptime, 3),
+            "requests_per_s": round(self.window_completed / window, 2) if window else 0.0,
+            "avg_requests_per_s": round(self.completed / uptime, 2) if uptime else 0.0,
+            "p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else None
+        }
+        if reset:
+            self.reset_window()
+        return snapshot
+
+
+class AgentServer(object):
+    """Answers messages through agent.handle_message, reusing one AiUtils for the life of the process"""
+
+    def __init__(self, utils=None, concurrency=SERVER_CONCURRENCY):
+        import agent as agent_module
+
+        self.agent = agent_module
+        if utils is not None:
+            self.agent.utils = utils
+        elif self.agent.utils is None:
+            from utils import AiUtils
+            self.agent.utils = AiUtils(None, self.agent.agent)
+        self.utils = self.agent.utils
+        self.concurrency = concurrency
+        self.stats = ServerStats()
+        self._semaphore = None
+
+    async def handle(self, message, request_id=None, fmt=None):
+        """Run the agent on one message and return its replies as a JSON-serializable result"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        env = RequestEnvironment(message, self.utils.get_data_dir())
+        started_at = time.monotonic()
+        self.stats.in_flight += 1
+        try:
+            async with self._semaphore:
+                await self.agent.handle_message(env, fmt)
+            result = {"id": request_id, "ok": True, "replies": env.replies}
+        except Exception as e:
+            logger.exception("Failed to handle message %s", request_id)
+            result = {"id": request_id, "ok": False, "replies": env.replies, "error_type": type(e).__name__,
+                      "error": str(e)}
+        finally:
+            self.stats.in_flight -= 1
+        result["elapsed_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+        self.stats.record(result)
+        return result
+
+    async def report_forever(self, interval=SERVER_REPORT_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Server stats: %s", json.dumps(self.stats.snapshot(reset=True)))
+
+    async def close(self):
+        await self.utils.close()
+
+
+def make_app(server):
+    from aiohttp import web
+
+    import rendering
+    from amounts import json_default
+    from metrics import registry
+
+    dumps = lambda value: json.dumps(value, default=json_default)
+
+    async def post_message(request):
+        if request.content_length is not None and request.content_length > MAX_MESSAGE_BYTES:
+            raise web.HTTPRequestEntityTooLarge(MAX_MESSAGE_BYTES, request.content_length)
+        try:
+            body = await request.json()
+            message = body["message"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected a JSON object with a "message" string')
+        if not isinstance(message, str):
+            raise web.HTTPBadRequest(text='Expected a JSON object with a "message" string')
+        fmt = body.get("format")
+        if fmt is not None and fmt not in rendering.FORMATS:
+            raise web.HTTPBadRequest(text=f"format must be one of {', '.join(rendering.FORMATS)}")
+        result = await server.handle(message, body.get("id"), fmt)
+        return web.json_response(result, status=200 if result["ok"] else 500, dumps=dumps)
+
+    async def get_stats(request):
+        return web.json_response(server.stats.snapshot(), dumps=dumps)
+
+    async def get_metrics(request):
+        return web.Response(text=registry.to_prometheus(), content_type="text/plain")
+
+    async def get_health(request):
+        return web.Response(text="ok")
+
+    app = web.Application(client_max_size=MAX_MESSAGE_BYTES)
+    app.add_routes([
+        web.post("/message", post_message),
+        web.get("/stats", get_stats),
+        web.get("/metrics", get_metrics),
+        web.get("/healthz", get_health),
+    ])
+    return app
+
+
+async def serve_http(host, port, concurrency=SERVER_CONCURRENCY, report_seconds=SERVER_REPORT_SECONDS,
+                     reuse_port=False):
+    """Serve HTTP in this process until SIGINT or SIGTERM"""
+    from aiohttp import web
+
+    server = AgentServer(concurrency=concurrency)
+    runner = web.AppRunner(make_app(server), access_log=None)
+    await runner.setup()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    reporter = asyncio.create_task(server.report_forever(report_seconds))
+    try:
+        await web.TCPSite(runner, host, port, reuse_port=reuse_port).start()
+        logger.info("Worker %d serving on http://%s:%d", os.getpid(), host, port)
+        await stop.wait()
+    finally:
+        reporter.cancel()
+        await runner.cleanup()
+        await server.close()
+        logger.info("Worker %d stopped: %s", os.getpid(), json.dumps(server.stats.snapshot()))
+
+
+def run_worker(host, port, concurrency, report_seconds, reuse_port):
+    asyncio.run(serve_http(host, port, concurrency, report_seconds, reuse_port))
+
+
+def run_workers(workers, host, port, concurrency=SERVER_CONCURRENCY, report_seconds=SERVER_REPORT_SECONDS):
+    """Fork `workers` HTTP worker processes sharing one port and wait for them to exit"""
+    if workers <= 1:
+        run_worker(host, port, concurrency, report_seconds, False)
+        return 0
+    # Import the agent once so forked workers start warm and share the module pages
+    import agent  # noqa: F401
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=run_worker, args=(host, port, concurrency, report_seconds, True),
+                                 name=f"defishield-worker-{i}") for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for process in processes:
+        process.join()
+    return max((process.exitcode or 0 for process in processes), default=0)
+
+
+async def serve_jsonl(input_stream, output_stream, concurrency=SERVER_CONCURRENCY):
+    """Answer JSONL messages from input_stream, writing each result as soon as it completes"""
+    import rendering
+    from amounts import json_default
+
+    server = AgentServer(concurrency=concurrency)
+    pending = set()
+
+    def write(result):
+        output_stream.write(json.dumps(result, default=json_default) + "\n")
+        output_stream.flush()
+
+    async def handle_line(line_number, line):
+        try:
+            request = json.loads(line)
+            message = request["message"]
+            fmt = request.get("format")
+            if fmt is not None:
+                rendering.get_renderer(fmt)
+        except (ValueError, KeyError, TypeError) as e:
+            write({"id": line_number, "ok": False, "error_type": type(e).__name__, "error": str(e)})
+            return
+        write(await server.handle(message, request.get("id", line_number), fmt))
+
+    try:
+        line_number = 0
+        while True:
+            line = await asyncio.to_thread(input_stream.readline)
+            if not line:
+                break
+            line_number += 1
+            if not line.strip():
+                continue
+            # Read ahead of the workers by at most one batch, so memory stays flat on long inputs
+            if len(pending) >= concurrency * 2:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.create_task(handle_line(line_number, line)))
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        await server.close()
+    return server.stats.snapshot()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve DefiShield staking recommendations from long-lived workers")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("-p", "--port", type=int, default=SERVER_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=SERVER_WORKERS, help="HTTP worker processes")
+    parser.add_argument("-c", "--concurrency", type=int, default=SERVER_CONCURRENCY,
+                        help="messages handled at once per worker")
+    parser.add_argument("--report-seconds", type=float, default=SERVER_REPORT_SECONDS,
+                        help="how often each worker logs its requests per second")
+    parser.add_argument("--stdin", action="store_true", help="read JSONL messages from stdin instead of serving HTTP")
+    parser.add_argument("--data-dir", help="cache directory shared by the workers (default: DEFISHIELD_DATA_DIR)")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        os.environ["DEFISHIELD_DATA_DIR"] = args.data_dir
+    if args.stdin:
+        print(json.dumps(asyncio.run(serve_jsonl(sys.stdin, sys.stdout, args.concurrency))), file=sys.stderr)
+        return 0
+    return run_workers(args.workers, args.host, args.port, args.concurrency, args.report_seconds)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
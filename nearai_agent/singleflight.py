@@ -0,0 +1,40 @@
+import asyncio
+
+from metrics import COALESCED_CALLS
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls with the same key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it runs await the same task
+    and get the same result or exception. Nothing is remembered once the task finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # key -> running task
+        self.calls = {}
+
+    def __len__(self):
+        return len(self.calls)
+
+    async def do(self, key, fetch):
+        """Await fetch() (a coroutine function), sharing it with concurrent callers using the same key"""
+        loop = asyncio.get_running_loop()
+        task = self.calls.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(fetch())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            COALESCED_CALLS.inc(kind=self.name, result="leader")
+        else:
+            COALESCED_CALLS.inc(kind=self.name, result="shared")
+        # A cancelled caller must not cancel the work the other callers are waiting on
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Retrieve the exception so an unawaited failure is not reported as never retrieved
+        if not task.cancelled():
+            task.exception()
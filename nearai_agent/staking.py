@@ -0,0 +1,129 @@
+"""Staking positions aggregated across an account's staking pools.
+
+Pool state comes from on-chain view calls (`get_account`, `get_reward_fee_fraction`) made through
+py_near's Account, concurrently and bounded. Their results go through the shared response cache
+under `near-view://` keys, so they persist with it on disk: a fresh agent run reuses what earlier
+runs and prefetch.py fetched. Pool fees are cached for an hour and shared by every account;
+per-account pool balances for a minute (see cache.ENDPOINT_TTLS). Any object with an async
+`view_function(contract_id, method_name, args)` returning a result with a `.result` attribute can
+stand in for the RPC, e.g. benchmarks.fake_transport.FakeStakingRpc in tests.
+"""
+import asyncio
+import os
+
+from amounts import Amount
+from cache import make_cache_key, response_cache
+from log import get_logger
+from metrics import timed
+from singleflight import SingleFlight
+
+logger = get_logger("staking")
+
+NEAR_RPC_URL = os.environ.get("DEFISHIELD_RPC_URL", "https://rpc.mainnet.near.org")
+# Concurrent view calls against the RPC
+STAKING_RPC_CONCURRENCY = 8
+# Cache keys of view calls: near-view://<contract_id>/<method_name>?<args>
+VIEW_URL = "near-view://{contract_id}/{method_name}"
+
+
+class PoolPosition(object):
+    __slots__ = ("pool_id", "staked", "unstaked", "can_withdraw", "fee")
+
+    def __init__(self, pool_id, staked, unstaked, can_withdraw, fee):
+        self.pool_id = pool_id
+        self.staked = staked
+        self.unstaked = unstaked
+        self.can_withdraw = can_withdraw
+        self.fee = fee
+
+    def to_dict(self):
+        return {
+            "pool_id": self.pool_id,
+            "staked": self.staked,
+            "unstaked": self.unstaked,
+            "can_withdraw": self.can_withdraw,
+            "fee": self.fee
+        }
+
+
+class StakingAggregator(object):
+    def __init__(self, rpc=None, concurrency=STAKING_RPC_CONCURRENCY, cache=None):
+        self.rpc = rpc
+        self.concurrency = concurrency
+        self.cache = response_cache if cache is None else cache
+        self.flights = SingleFlight("staking")
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def get_rpc(self):
+        if self.rpc is None:
+            # py_near pulls in the signing stack, so it is only imported once a pool is actually queried
+            from py_near.account import Account
+            self.rpc = Account(rpc_addr=NEAR_RPC_URL)
+        return self.rpc
+
+    async def view(self, contract_id, method_name, args):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphore_loop = loop
+        async with self._semaphore:
+            result = await timed("staking_view", self.get_rpc().view_function(contract_id, method_name, args))
+        return result.result
+
+    async def cached_view(self, contract_id, method_name, args):
+        """A view call served from the response cache while fresh, shared by concurrent callers"""
+        url = VIEW_URL.format(contract_id=contract_id, method_name=method_name)
+        return await self.flights.do(
+            make_cache_key(url, args),
+            lambda: self.cache.get_or_fetch(url, args, lambda: self.view(contract_id, method_name, args))
+        )
+
+    async def get_pool_fee(self, pool_id):
+        """The pool's reward fee as a fraction, e.g. 0.05 for 5%"""
+        fraction = await self.cached_view(pool_id, "get_reward_fee_fraction", {})
+        return fraction["numerator"] / fraction["denominator"] if fraction.get("denominator") else 0.0
+
+    async def get_position(self, pool_id, account_id):
+        pool_account, fee = await asyncio.gather(
+            self.cached_view(pool_id, "get_account", {"account_id": account_id}),
+            self.get_pool_fee(pool_id)
+        )
+        return PoolPosition(pool_id, Amount(pool_account.get("staked_balance", 0)),
+                            Amount(pool_account.get("unstaked_balance", 0)),
+                            bool(pool_account.get("can_withdraw", False)), fee)
+
+    async def aggregate(self, account_id, pool_ids):
+        """Query every pool concurrently and total the account's staking positions"""
+        results = await asyncio.gather(*(self.get_position(pool_id, account_id) for pool_id in pool_ids),
+                                       return_exceptions=True)
+        positions = []
+        errors = {}
+        for pool_id, result in zip(pool_ids, results):
+            if isinstance(result, BaseException):
+                logger.warning("Staking pool %s query failed for %s: %s", pool_id, account_id, result)
+                errors[pool_id] = str(result)
+            else:
+                positions.append(result)
+        return summarize_positions(positions, errors)
+
+
+def summarize_positions(positions, errors=None):
+    total_staked = sum((position.staked for position in positions), Amount(0))
+    total_unstaked = sum((position.unstaked for position in positions), Amount(0))
+    withdrawable = sum((position.unstaked for position in positions if position.can_withdraw), Amount(0))
+    weighted_fee = None
+    if total_staked:
+        weighted_fee = sum(float(position.staked) * position.fee for position in positions) / float(total_staked)
+    return {
+        "pools": [position.to_dict() for position in positions if position.staked or position.unstaked],
+        "total_staked": total_staked,
+        "total_unstaked": total_unstaked,
+        "withdrawable": withdrawable,
+        "weighted_fee": weighted_fee,
+        "errors": errors or {}
+    }
+
+
+# Shared by every AiUtils instance in the process, so pool results are reused across accounts
+staking_aggregator = StakingAggregator()
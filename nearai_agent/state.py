@@ -0,0 +1,214 @@
+import enum
+import json
+import os
+
+from log import get_logger
+
+logger = get_logger("state")
+
+STATE_LOG_FILE = "state.log"
+# Full-snapshot file: the state persisted through the NEAR AI environment, and the legacy local
+# file read once when no log exists yet
+STATE_FILE = "state.json"
+# Rewrite the log as a single snapshot once it holds this many deltas
+STATE_COMPACT_DELTAS = 64
+
+
+class State(object):
+    """Conversation state; assignments are tracked so only changed fields are persisted.
+
+    version is None for a State built directly rather than loaded from a StateStore; saving one
+    replaces the stored state as a whole.
+    """
+
+    FIELDS = ("action", "amount", "receiver_id")
+    DEFAULTS = {"action": "", "amount": None, "receiver_id": None}
+
+    __slots__ = FIELDS + ("version", "_dirty")
+
+    def __init__(self, **entries):
+        object.__setattr__(self, "version", None)
+        object.__setattr__(self, "_dirty", set())
+        for key in self.FIELDS:
+            object.__setattr__(self, key, self.DEFAULTS[key])
+        for key, value in entries.items():
+            if key in self.FIELDS:
+                object.__setattr__(self, key, value)
+            else:
+                logger.debug("Ignoring unknown state field '%s'", key)
+
+    def __setattr__(self, key, value):
+        if key in self.FIELDS and getattr(self, key) != value:
+            self._dirty.add(key)
+        object.__setattr__(self, key, value)
+
+    def to_dict(self):
+        return {k: (v.name if isinstance(v, enum.Enum) else v) for k, v in ((k, getattr(self, k)) for k in self.FIELDS)}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def get_changes(self):
+        return {k: v for k, v in self.to_dict().items() if k in self._dirty}
+
+    def remove_attribute(self, key):
+        if key in self.FIELDS:
+            setattr(self, key, self.DEFAULTS[key])
+        else:
+            logger.warning("Attribute '%s' not found in State.", key)
+
+
+class StateStore(object):
+    """Append-only state log with a process-wide in-memory copy.
+
+    Each save appends one JSON line holding the version and only the fields that changed. Loads are
+    served from memory after a single stat of the log; when another writer appended, only the new
+    tail is read. The log is compacted into one snapshot line every STATE_COMPACT_DELTAS saves.
+
+    Given a NEAR AI environment, the state is instead read and written as STATE_FILE through the
+    environment's file API, so it persists with the thread. The file is read once per store and the
+    parsed values kept on it; a save writes the file only when it changes a stored value.
+    """
+
+    # path -> {"values", "version", "offset", "deltas", "mtime_ns", "inode"}, shared by every store in the process
+    _loaded = {}
+
+    def __init__(self, directory, compact_deltas=STATE_COMPACT_DELTAS, env=None):
+        self.directory = directory
+        self.path = os.path.join(directory, STATE_LOG_FILE)
+        self.compact_deltas = compact_deltas
+        self.env = env
+        # Values of STATE_FILE as last read or written through env
+        self._env_values = None
+
+    def _read_env(self):
+        if self._env_values is None:
+            # A missing file is empty state; there is no need to list the directory first
+            try:
+                content = self.env.read_file(STATE_FILE)
+            except (OSError, KeyError):
+                content = None
+            try:
+                values = json.loads(content) if content else {}
+            except ValueError:
+                logger.warning("Ignoring unreadable %s", STATE_FILE)
+                values = {}
+            self._env_values = values if isinstance(values, dict) else {}
+        return self._env_values
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns, st.st_ino
+
+    def _read(self, entry, offset):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # A partial last line from an interrupted write is ignored until it is complete
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping corrupt state log line in %s", self.path)
+                continue
+            entry["values"].update(record.get("set", {}))
+            entry["version"] = record.get("v", entry["version"] + 1)
+            entry["deltas"] += 1
+        entry["offset"] = offset + complete
+
+    def _load_legacy(self, entry):
+        legacy_path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path) as f:
+                legacy = json.load(f)
+            entry["values"].update((k, v) for k, v in legacy.items() if k in State.FIELDS)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read legacy state %s: %s", legacy_path, e)
+
+    def _refresh(self):
+        entry = self._loaded.get(self.path)
+        stat = self._stat()
+        if entry is not None and stat is not None and stat[1] == entry["mtime_ns"] and stat[0] == entry["offset"]:
+            return entry
+        if entry is None or stat is None or stat[0] < entry["offset"] or stat[2] != entry["inode"]:
+            # First load, or the log was compacted or removed by another writer: replay from the start
+            entry = {"values": {}, "version": 0, "offset": 0, "deltas": 0, "mtime_ns": None, "inode": None}
+            if stat is None:
+                self._load_legacy(entry)
+        if stat is not None:
+            self._read(entry, entry["offset"])
+            entry["mtime_ns"], entry["inode"] = stat[1], stat[2]
+        self._loaded[self.path] = entry
+        return entry
+
+    def load_values(self):
+        """The stored fields as a dict, empty when nothing was saved"""
+        if self.env is not None:
+            return dict(self._read_env())
+        return dict(self._refresh()["values"])
+
+    def load(self):
+        if self.env is not None:
+            state = State(**self._read_env())
+            object.__setattr__(state, "version", 0)
+            return state
+        entry = self._refresh()
+        state = State(**entry["values"])
+        object.__setattr__(state, "version", entry["version"])
+        return state
+
+    def save(self, state):
+        """Persist the fields changed since the state was loaded; a no-op when nothing changed"""
+        changes = state.get_changes()
+        if state.version is None:
+            changes = state.to_dict()
+        elif not changes:
+            return False
+        if self.env is not None:
+            return self._save_env(state, changes)
+        entry = self._refresh()
+        version = entry["version"] + 1
+        entry["values"].update(changes)
+        if entry["deltas"] + 1 >= self.compact_deltas:
+            self._write_snapshot(entry, version)
+        else:
+            line = (json.dumps({"v": version, "set": changes}, separators=(",", ":")) + "\n").encode()
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(line)
+            entry["offset"] += len(line)
+            entry["deltas"] += 1
+        entry["version"] = version
+        _, entry["mtime_ns"], entry["inode"] = self._stat()
+        object.__setattr__(state, "version", version)
+        state._dirty.clear()
+        logger.debug("Saved state v%d (%d changed fields)", version, len(changes))
+        return True
+
+    def _save_env(self, state, changes):
+        stored = self._read_env()
+        values = changes if state.version is None else dict(stored, **changes)
+        if values == stored:
+            state._dirty.clear()
+            return False
+        # Changes stay dirty until the write succeeds, so a failed save can be retried
+        self.env.write_file(STATE_FILE, json.dumps(values))
+        self._env_values = values
+        object.__setattr__(state, "version", (state.version or 0) + 1)
+        state._dirty.clear()
+        return True
+
+    def _write_snapshot(self, entry, version):
+        line = (json.dumps({"v": version, "set": entry["values"]}, separators=(",", ":")) + "\n").encode()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(line)
+        os.replace(tmp_path, self.path)
+        entry["offset"] = len(line)
+        entry["deltas"] = 1
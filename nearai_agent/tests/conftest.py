@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The agent modules import each other as top-level modules, as they do when NEAR AI runs agent.py
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "benchmarks"))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
@@ -0,0 +1,48 @@
+import pytest
+
+from account_ids import (InvalidAccountIdError, extract_account_id, extract_account_ids, is_valid_account_id,
+                         validate_account_id)
+
+IMPLICIT = "98793cd91a3f870fb126f66285808c7e094afcfc4eda8a970f6648cdf0dbd6de"
+
+
+@pytest.mark.parametrize("account_id", [
+    "alice.near", "app.alice.near", "a-b_c.near", "ab", "0x" + "ab" * 20, IMPLICIT, "a" * 64,
+])
+def test_valid_account_ids(account_id):
+    assert is_valid_account_id(account_id)
+    assert validate_account_id(account_id) == account_id
+
+
+@pytest.mark.parametrize("account_id", [
+    "a", "a" * 65, "a" * 60 + ".near", "", "Alice.near", ".alice.near", "alice.near.", "alice..near",
+    "alice-.near", "-alice.near", "al__ice.near", "alice@near", "alice near", None,
+])
+def test_invalid_account_ids(account_id):
+    assert not is_valid_account_id(account_id)
+    with pytest.raises(InvalidAccountIdError):
+        validate_account_id(account_id)
+
+
+def test_extract_named_and_implicit_accounts():
+    message = f"Compare alice.near with app.bob.near and {IMPLICIT}"
+    assert extract_account_ids(message) == ["alice.near", "app.bob.near", IMPLICIT]
+
+
+def test_extract_dedups_and_respects_limit():
+    message = "alice.near, ALICE.near and bob.near; account: alice.near, then carol.near"
+    assert extract_account_ids(message) == ["alice.near", "bob.near", "carol.near"]
+    assert extract_account_ids(message, limit=2) == ["alice.near", "bob.near"]
+    assert extract_account_id(message) == "alice.near"
+
+
+def test_extract_strips_trailing_punctuation():
+    assert extract_account_ids("Should I stake from alice.near?") == ["alice.near"]
+    assert extract_account_ids("My account is bob.near.") == ["bob.near"]
+    assert extract_account_ids("Check (carol.near), please!") == ["carol.near"]
+
+
+def test_extract_ignores_words_and_invalid_ids():
+    assert extract_account_ids("Can you check for me what staking is?") == []
+    assert extract_account_ids("account: " + "a" * 70 + ".near") == []
+    assert extract_account_id("hello there") is None
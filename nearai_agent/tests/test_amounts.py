@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+from amounts import Amount
+
+
+def test_comparing_with_non_numbers_is_not_an_error():
+    assert Amount(1) != "abc"
+    assert not Amount(1) == Decimal("NaN")
+    assert Amount(1) != None
+    assert "abc" not in {Amount(1)}
+
+
+def test_equal_amounts_hash_equal():
+    near = Amount(10**24)
+    assert near == 1 and hash(near) == hash(1)
+    assert near == Decimal("1") and hash(near) == hash(Decimal("1"))
+    assert near == Amount(10**6, decimals=6) and hash(near) == hash(Amount(10**6, decimals=6))
+    assert len({near, 1, Amount.from_units("1.0")}) == 1
+    assert Amount.from_units("0.5") in {0.5}
+
+
+def test_inexact_floats_compare_by_their_exact_value():
+    # 0.7 is not exactly representable, so no exact amount equals it; eq and hash agree either way
+    seven_tenths = Amount.from_units(0.7)
+    assert seven_tenths == Decimal("0.7") and seven_tenths in {Decimal("0.7")}
+    assert seven_tenths != 0.7 and seven_tenths not in {0.7}
+    assert seven_tenths > 0.7 - 1e-9 and seven_tenths < 0.7 + 1e-9
+    assert Amount(1) != "1"
+    assert Amount(1) < float("inf") and Amount(1) != float("nan")
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+from batch import analyze_accounts
+from fake_transport import FakeStakingRpc, FixtureHttpClient
+from utils import AiUtils
+
+
+class RecordingHttpClient(FixtureHttpClient):
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    async def get_json(self, url, params=None, deadline=None):
+        self.urls.append(url)
+        return await super().get_json(url, params, deadline)
+
+
+def test_batch_fetches_only_what_it_scores(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFISHIELD_DATA_DIR", str(tmp_path))
+    account_ids = ["bench-7.near", "bench-70.near", "bench-170.near"]
+    http = RecordingHttpClient()
+
+    async def run():
+        utils = AiUtils(None, None, http=http, staking_rpc=FakeStakingRpc())
+        try:
+            results = [result async for result in analyze_accounts(utils, account_ids, concurrency=2)]
+            expected = {result["account_id"]: utils.recommender.evaluate(
+                result["balance"], await utils.analyze_account(result["account_id"]), result["staking"])
+                for result in results}
+            return results, expected
+        finally:
+            await utils.close()
+
+    results, expected = asyncio.run(run())
+    assert sorted(result["account_id"] for result in results) == sorted(account_ids)
+    assert all(result["ok"] for result in results)
+    for result in results:
+        assert result["recommendation"] == expected[result["account_id"]]
+    assert not [url for url in http.urls if url.endswith(("/ft", "/staking")) and "nearblocks" in url]
+    assert not [url for url in http.urls if "list-token-price" in url]
+
+
+def test_slow_input_does_not_stall_running_accounts(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFISHIELD_DATA_DIR", str(tmp_path))
+    read_done = []
+
+    def slow_input():
+        yield "bench-7.near"
+        # A blocking read, like a line piped in slowly on stdin
+        time.sleep(0.5)
+        read_done.append(time.monotonic())
+        yield "bench-70.near"
+
+    async def run():
+        utils = AiUtils(None, None, http=FixtureHttpClient(), staking_rpc=FakeStakingRpc())
+        try:
+            return [(result["account_id"], time.monotonic())
+                    async for result in analyze_accounts(utils, slow_input(), concurrency=2)]
+        finally:
+            await utils.close()
+
+    results = asyncio.run(run())
+    assert [account_id for account_id, _ in results] == ["bench-7.near", "bench-70.near"]
+    # The first account finished while the second line was still being read
+    assert results[0][1] < read_done[0]
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from http_client import CircuitBreaker, HttpClient
+
+
+def open_breaker(client, host):
+    breaker = client.get_breaker(host)
+    breaker.state = CircuitBreaker.OPEN
+    breaker.opened_at = -breaker.reset_timeout
+    return breaker
+
+
+async def serve(handler):
+    app = web.Application()
+    app.router.add_get("/", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/"
+
+
+def test_cancelled_probe_releases_the_slot():
+    delays = [1.0, 0.0]
+
+    async def handler(request):
+        await asyncio.sleep(delays.pop(0))
+        return web.json_response({"ok": True})
+
+    async def run():
+        runner, url = await serve(handler)
+        client = HttpClient()
+        breaker = open_breaker(client, "127.0.0.1")
+        try:
+            probe = asyncio.create_task(client.get_json(url))
+            await asyncio.sleep(0.2)
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+            assert breaker.state == CircuitBreaker.HALF_OPEN
+            assert await client.get_json(url) == {"ok": True}
+            assert breaker.state == CircuitBreaker.CLOSED
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_rate_limit_timeout_does_not_take_the_probe_slot():
+    async def run():
+        client = HttpClient(host_policies={"example.invalid": {"rate": 0.01, "burst": 1}})
+        breaker = open_breaker(client, "example.invalid")
+        await client.get_session()
+        client.get_bucket("example.invalid").tokens = 0
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.get_json("http://example.invalid/", deadline=0.1)
+        finally:
+            await client.close()
+        breaker.check("example.invalid")
+        assert breaker.before_request("example.invalid") is True
+
+    asyncio.run(run())
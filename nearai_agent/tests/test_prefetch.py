@@ -0,0 +1,34 @@
+import asyncio
+
+from fake_transport import FakeEnvironment, FakeStakingRpc, FixtureHttpClient
+from prefetch import PrefetchScheduler
+from utils import AiUtils
+
+
+def test_prefetch_warms_later_agent_run(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFISHIELD_DATA_DIR", str(tmp_path / "shared"))
+    account_id = "bench-60.near"
+
+    async def prefetch():
+        utils = AiUtils(None, None, http=FixtureHttpClient(), staking_rpc=FakeStakingRpc())
+        utils.watchlist.watch(account_id)
+        utils.watchlist.save()
+        try:
+            return await PrefetchScheduler(utils, utils.watchlist).run_once()
+        finally:
+            await utils.close()
+
+    async def agent_run():
+        env = FakeEnvironment(account_id, temp_path=str(tmp_path / "agent"))
+        utils = AiUtils(env, None, http=FixtureHttpClient(), staking_rpc=FakeStakingRpc())
+        try:
+            indexed = utils.tx_sync.index.count(account_id)
+            return indexed, await utils.sync_account_transactions(account_id)
+        finally:
+            await utils.close()
+
+    assert asyncio.run(prefetch()) == 1
+    indexed, sync_stats = asyncio.run(agent_run())
+    assert indexed == 60
+    # The account is watched, so the agent answers from the prefetched index without syncing
+    assert sync_stats["pages"] == 0 and sync_stats["total"] == 60
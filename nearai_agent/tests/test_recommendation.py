@@ -0,0 +1,170 @@
+import json
+import random
+
+import pytest
+
+from amounts import Amount
+from recommendation import RecommendationEngine, RuleConfigError, load_rules_config
+
+QUIET = {"activity_level": "minimally active", "recent_activity": False, "stats": None}
+
+
+def make_staking(staked):
+    return {"total_staked": Amount.from_units(staked), "total_unstaked": Amount(0), "pools": [], "weighted_fee": None}
+
+
+def test_existing_stake_changes_the_recommendation():
+    engine = RecommendationEngine()
+    assert engine.evaluate(Amount.from_units(100), QUIET, make_staking(10))["recommendation"] == "recommended"
+
+    # 400 of 500 NEAR staked sits exactly on staked_share_high; both paths must agree
+    mostly_staked = engine.evaluate(Amount.from_units(100), QUIET, make_staking(400))
+    assert mostly_staked["recommendation"] == "not_recommended" and "suggested_amount" not in mostly_staked
+    many = engine.evaluate_many([Amount.from_units(100)] * 2, [QUIET] * 2, [make_staking(10), make_staking(400)])
+    assert [result["recommendation"] for result in many] == ["recommended", "not_recommended"]
+
+
+def make_analysis(activity, recent, outflow_30d=0, risk=0.0):
+    return {"activity_level": activity, "recent_activity": recent,
+            "stats": {"outflow_30d_yocto": Amount.from_units(outflow_30d).raw},
+            "risk": {"score": risk, "level": "high" if risk >= 0.6 else "low", "flags": []}}
+
+
+def test_reason_follows_configured_threshold():
+    engine = RecommendationEngine()
+    assert "minimum of 1 NEAR" in engine.evaluate(Amount.from_units("0.5"), QUIET)["reason"]
+
+    stricter = engine.with_thresholds(min_balance=5)
+    result = stricter.evaluate(Amount.from_units(3), QUIET)
+    assert result["recommendation"] == "not_recommended" and "minimum of 5 NEAR" in result["reason"]
+
+
+def test_rule_table_from_config_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "thresholds": {"min_balance": 50},
+        "rules": [
+            {"name": "small", "when": [["balance", "<", "min_balance"]], "recommendation": "not_recommended",
+             "reason": "Below {min_balance} NEAR; {{braces}} stay literal."},
+            {"name": "busy", "when": [["activity", "==", "highly active"], ["stake_amount", ">=", 1]],
+             "stake": {"fraction": 0.5, "keep_liquid": True}, "recommendation": "partial_stake"},
+            {"name": "rest", "stake": {"fraction": 0.5}, "recommendation": "recommended"},
+        ]
+    }))
+    thresholds, rules = load_rules_config(str(path))
+    assert thresholds["min_balance"] == 50 and thresholds["risk_high"] == 0.6
+    engine = RecommendationEngine(thresholds, rules)
+    assert engine.evaluate(Amount.from_units(20), QUIET)["reason"] == "Below 50 NEAR; {braces} stay literal."
+    assert engine.evaluate(Amount.from_units(101), QUIET)["suggested_amount"] == Amount.from_units("50.5")
+
+    # keep_liquid caps the stake at the balance minus the last 30 days of outflows
+    result = engine.evaluate(Amount.from_units(100), make_analysis("highly active", True, outflow_30d=80))
+    assert result["recommendation"] == "partial_stake" and result["suggested_amount"] == Amount.from_units(20)
+    result = engine.evaluate(Amount.from_units(100), make_analysis("highly active", True, outflow_30d="99.5"))
+    assert result["recommendation"] == "recommended"
+
+
+@pytest.mark.parametrize("rules", [
+    [{"when": [["nonsense", ">", 1]], "recommendation": "x"}, {"recommendation": "y"}],
+    [{"when": [["balance", "~", 1]], "recommendation": "x"}, {"recommendation": "y"}],
+    [{"when": [], "reason": "no recommendation"}],
+    [{"when": [], "recommendation": "x", "reason": "Needs {unknown_threshold}"}],
+    [{"when": [["balance", ">", 1]], "recommendation": "x"}],
+])
+def test_invalid_rule_tables_are_rejected(rules):
+    with pytest.raises(RuleConfigError):
+        RecommendationEngine({}, rules)
+
+
+def test_evaluate_is_exact_at_thresholds():
+    engine = RecommendationEngine()
+    one_near = Amount.from_units(1)
+    assert engine.evaluate(one_near - Amount(1), QUIET)["recommendation"] == "not_recommended"
+    assert engine.evaluate(one_near, QUIET)["recommendation"] == "recommended"
+
+    # Highly active accounts only stake part of a balance above 10 NEAR
+    busy = make_analysis("highly active", True, outflow_30d=15)
+    ten_near = Amount.from_units(10)
+    assert engine.evaluate(ten_near, busy)["recommendation"] == "not_recommended"
+    result = engine.evaluate(ten_near + Amount(1), busy)
+    assert result["recommendation"] == "partial_stake" and result["suggested_amount"] == Amount.from_units(7)
+
+    # Float thresholds mean the decimal they are written as, not their binary value
+    assert engine.with_thresholds(min_balance=0.1).evaluate(Amount.from_units("0.1"), QUIET)["recommendation"] == \
+        "recommended"
+
+    # The suggestion is rounded down to whole hundredths without going through floats
+    result = engine.evaluate(Amount.from_units("123456789.123456789"), QUIET)
+    assert result["suggested_amount"] == Amount.from_units("111111110.21")
+
+
+def test_evaluate_many_matches_evaluate_away_from_thresholds():
+    engine = RecommendationEngine()
+    rng = random.Random(7)
+    balances, analyses, stakings = [], [], []
+    while len(balances) < 500:
+        balance = round(rng.choice((rng.uniform(0, 2), rng.uniform(0, 30), rng.uniform(0, 10**6))), 6)
+        outflow = round(rng.uniform(0, balance * 1.2), 6)
+        staked = round(rng.choice((0, rng.uniform(0, balance * 8))), 6)
+        risk = rng.choice((0.0, 0.3, 0.9))
+        share = staked / (balance + staked) if balance + staked else 0
+        # Float and exact comparisons may only disagree within rounding of a threshold
+        if min(abs(balance - 1), abs(balance - 10), abs(share - 0.8)) < 1e-3:
+            continue
+        balances.append(Amount.from_units(str(balance)))
+        activity = rng.choice(("inactive", "minimally active", "moderately active", "highly active"))
+        analyses.append(make_analysis(activity, rng.random() < 0.5, outflow, risk))
+        stakings.append(make_staking(str(staked)) if staked else None)
+
+    many = engine.evaluate_many(balances, analyses, stakings)
+    for balance, analysis, staking, batch in zip(balances, analyses, stakings, many):
+        single = engine.evaluate(balance, analysis, staking)
+        assert batch["recommendation"] == single["recommendation"] and batch["reason"] == single["reason"]
+        if "suggested_amount" in single:
+            assert abs(float(batch["suggested_amount"]) - float(single["suggested_amount"])) <= 0.01
+
+
+def baseline_recommendation(balance, transaction_analysis):
+    """AiUtils.make_staking_recommendation as it was before the rule table, on float NEAR"""
+    if balance < 1:
+        return {"recommendation": "not_recommended", "confidence": "high",
+                "reason": "Insufficient balance for staking. A minimum of 1 NEAR is recommended."}
+    activity_level = transaction_analysis.get("activity_level", "inactive")
+    recent_activity = transaction_analysis.get("recent_activity", False)
+    if activity_level == "highly active" and recent_activity:
+        if balance > 10:
+            return {"recommendation": "partial_stake", "confidence": "medium",
+                    "reason": "Your account is very active with recent transactions. Consider staking only a portion of your balance to maintain liquidity for continued activity.",
+                    "suggested_amount": round(balance * 0.7, 2)}
+        return {"recommendation": "not_recommended", "confidence": "medium",
+                "reason": "Your account is very active with recent transactions, and your balance suggests you may need liquidity for continued activity."}
+    if activity_level in ["moderately active", "minimally active"] and not recent_activity:
+        return {"recommendation": "recommended", "confidence": "high",
+                "reason": "Your account shows some historical activity but has been quiet recently. Staking would be a good way to earn rewards on your idle NEAR.",
+                "suggested_amount": round(balance * 0.9, 2)}
+    if activity_level == "inactive" or (activity_level == "minimally active" and not recent_activity):
+        return {"recommendation": "highly_recommended", "confidence": "high",
+                "reason": "Your account shows minimal activity, making it an excellent candidate for staking to earn rewards on your NEAR.",
+                "suggested_amount": round(balance * 0.95, 2)}
+    return {"recommendation": "recommended", "confidence": "medium",
+            "reason": "Based on your balance and account activity, staking appears to be a reasonable option.",
+            "suggested_amount": round(balance * 0.8, 2)}
+
+
+@pytest.mark.parametrize("balance", ["0", "0.5", "0.999999", "1", "1.5", "9.99", "10", "10.01", "20", "123.456789",
+                                     "1000000"])
+def test_default_rules_match_baseline(balance):
+    engine = RecommendationEngine()
+    for activity in ("inactive", "minimally active", "moderately active", "highly active"):
+        for recent in (False, True):
+            for outflow in (0, 15, "19.5", 10**6):
+                analysis = make_analysis(activity, recent, outflow_30d=outflow)
+                expected = baseline_recommendation(float(balance), analysis)
+                for result in (engine.evaluate(Amount.from_units(balance), analysis),
+                               engine.evaluate_many([Amount.from_units(balance)], [analysis])[0]):
+                    assert {key: result[key] for key in ("recommendation", "reason", "confidence")} == \
+                        {key: expected[key] for key in ("recommendation", "reason", "confidence")}
+                    # Amounts round down to the cent where the baseline rounded floats to nearest
+                    assert ("suggested_amount" in result) == ("suggested_amount" in expected)
+                    if "suggested_amount" in expected:
+                        assert abs(float(result["suggested_amount"]) - expected["suggested_amount"]) < 0.01 + 1e-9
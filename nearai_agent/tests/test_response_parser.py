@@ -0,0 +1,19 @@
+import time
+
+from response_parser import PARSE_ERROR, find_balanced_object, parse_response
+
+
+def test_braces_inside_strings_are_ignored():
+    text = 'Here you go: {"message": "use {braces} and \\"quotes\\" freely", "amount": "1"} done }'
+    assert parse_response(text) == {"message": 'use {braces} and "quotes" freely', "amount": "1"}
+
+
+def test_escaped_backslash_ends_string():
+    assert find_balanced_object('x {"a": "\\\\"} }') == '{"a": "\\\\"}'
+
+
+def test_unterminated_escaped_quotes_parse_in_linear_time():
+    text = '{"' + '\\"' * (512 * 1024)
+    started_at = time.perf_counter()
+    assert parse_response(text) == PARSE_ERROR
+    assert time.perf_counter() - started_at < 5
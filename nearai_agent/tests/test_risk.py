@@ -0,0 +1,69 @@
+import asyncio
+import copy
+import os
+
+from fake_transport import SyntheticHistory
+from risk import RiskState, HALF_LIFE_NS
+from tx_sync import TransactionIndex, TransactionSync
+
+ACCOUNT_ID = "alice.near"
+NEAR = 10**24
+
+
+class ListTransport(object):
+    """NearBlocks-style txns endpoint over a newest-first list"""
+
+    def __init__(self, txns):
+        self.txns = txns
+
+    async def get_json(self, url, params=None):
+        start = int(params.get("cursor") or 0)
+        stop = start + params["per_page"]
+        return {"txns": self.txns[start:stop], "cursor": str(stop) if stop < len(self.txns) else None}
+
+
+def make_transfer(template, tx_hash, timestamp, receiver, deposit):
+    tx = copy.deepcopy(template)
+    tx.update(transaction_hash=tx_hash, block_timestamp=str(timestamp), signer_account_id=ACCOUNT_ID,
+              predecessor_account_id=ACCOUNT_ID, receiver_account_id=receiver)
+    tx["actions"] = [{"action": "TRANSFER", "deposit": str(deposit), "args": {"deposit": str(deposit)}}]
+    return tx
+
+
+def test_delta_pages_after_the_first_are_checked(tmp_path):
+    history = SyntheticHistory(ACCOUNT_ID, 100)
+    txns = history.get_transactions()
+    transport = ListTransport(txns)
+    tx_sync = TransactionSync(transport, TransactionIndex(os.path.join(tmp_path, "tx_index.sqlite3")), page_size=10)
+    asyncio.run(tx_sync.sync(ACCOUNT_ID))
+    assert tx_sync.index.get_risk_state(ACCOUNT_ID).flag_count == 0
+
+    # 25 new transactions arrive: the oldest, on delta page 3, is a huge transfer to a new recipient
+    newest = int(txns[0]["block_timestamp"])
+    new_txns = [make_transfer(txns[0], f"new{i}", newest + (25 - i) * 10**9, txns[0]["receiver_account_id"], NEAR)
+                for i in range(24)]
+    new_txns.append(make_transfer(txns[0], "drain", newest + 10**9 // 2, "thief.near", 10**6 * NEAR))
+    transport.txns = new_txns + txns
+    result = asyncio.run(tx_sync.sync(ACCOUNT_ID))
+    assert result["pages"] == 3 and result["added"] == 25
+
+    kinds = {flag["kind"] for flag in tx_sync.index.get_risk_state(ACCOUNT_ID).flags
+             if flag["transaction_hash"] == "drain"}
+    assert {"large_deposit", "new_recipient"} <= kinds
+
+
+def test_old_flags_are_not_reported():
+    risk = RiskState()
+    risk.flags.append({"kind": "new_recipient", "transaction_hash": "old", "timestamp": 0})
+    risk.flag_count = 1
+    summary = risk.summary(now_ns=10 * HALF_LIFE_NS)
+    assert summary["level"] == "low" and summary["flags"] == [] and summary["flag_count"] == 1
+
+
+def test_recommendation_omits_decayed_risk():
+    from amounts import Amount
+    from recommendation import RecommendationEngine
+
+    analysis = {"activity_level": "minimally active", "recent_activity": False, "stats": None,
+                "risk": {"score": 0.01, "level": "low", "flags": [], "flag_count": 3}}
+    assert "risk" not in RecommendationEngine().evaluate(Amount.from_units(100), analysis)
@@ -0,0 +1,26 @@
+import asyncio
+import os
+
+from fake_transport import FakeStakingRpc
+from cache import ResponseCache
+from disk_cache import DiskCache
+from staking import StakingAggregator
+
+ACCOUNT_ID = "alice.near"
+POOLS = ["a.poolv1.near", "b.poolv1.near"]
+
+
+def test_pool_views_persist_across_processes(tmp_path):
+    path = os.path.join(tmp_path, "response_cache.sqlite3")
+    rpc = FakeStakingRpc()
+    first = asyncio.run(StakingAggregator(rpc=rpc, cache=ResponseCache(store=DiskCache(path))).aggregate(ACCOUNT_ID, POOLS))
+    assert rpc.calls == 4
+
+    # A fresh process starts with an empty in-memory cache but the same disk store
+    second = asyncio.run(StakingAggregator(rpc=rpc, cache=ResponseCache(store=DiskCache(path))).aggregate(ACCOUNT_ID, POOLS))
+    assert rpc.calls == 4
+    assert second["total_staked"] == first["total_staked"] and second["weighted_fee"] == first["weighted_fee"]
+
+    # Fees are shared by every account; only the new account's balances are queried
+    asyncio.run(StakingAggregator(rpc=rpc, cache=ResponseCache(store=DiskCache(path))).aggregate("bob.near", POOLS))
+    assert rpc.calls == 6
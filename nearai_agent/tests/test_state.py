@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from fake_transport import FakeEnvironment
+from state import STATE_FILE, State, StateStore
+
+
+class CountingEnvironment(FakeEnvironment):
+    def __init__(self, temp_path):
+        super().__init__("", temp_path=temp_path)
+        self.writes = 0
+        self.reads = 0
+        self.fail_writes = False
+
+    def list_files(self, path):
+        raise AssertionError("state loads should not list the agent directory")
+
+    def read_file(self, filename):
+        self.reads += 1
+        return super().read_file(filename)
+
+    def write_file(self, filename, content):
+        self.writes += 1
+        if self.fail_writes:
+            raise OSError("write failed")
+        super().write_file(filename, content)
+
+
+def test_env_state_persists_through_env_files(tmp_path):
+    env = CountingEnvironment(str(tmp_path))
+    store = StateStore(str(tmp_path), env=env)
+    assert store.load_values() == {}
+
+    store.save(State(action="stake", amount="10"))
+    assert json.loads(env.files[STATE_FILE]) == {"action": "stake", "amount": "10", "receiver_id": None}
+    assert not (tmp_path / "state.log").exists()
+
+    state = store.load()
+    assert not store.save(state) and env.writes == 1
+    state.receiver_id = "alice.near"
+    assert store.save(state) and env.writes == 2
+    assert StateStore(str(tmp_path), env=env).load_values()["receiver_id"] == "alice.near"
+
+
+def test_env_state_is_read_once_and_unchanged_saves_skip_writes(tmp_path):
+    env = CountingEnvironment(str(tmp_path))
+    env.files[STATE_FILE] = json.dumps({"action": "stake", "amount": "10", "receiver_id": None})
+    store = StateStore(str(tmp_path), env=env)
+    for _ in range(3):
+        state = store.load()
+    assert env.reads == 1 and state.amount == "10"
+
+    # Values that match what is stored are not written again
+    state.amount = "10"
+    state.action = "unstake"
+    state.action = "stake"
+    assert not store.save(state)
+    assert not store.save(State(action="stake", amount="10"))
+    assert env.writes == 0 and env.reads == 1
+
+
+def test_local_state_log_round_trips_as_dict(tmp_path):
+    store = StateStore(str(tmp_path / "a"))
+    state = store.load()
+    state.amount = "5"
+    store.save(state)
+    assert store.load_values() == {"amount": "5"}
+
+    # A State built directly replaces what is stored
+    store.save(State(action="unstake"))
+    assert store.load_values() == {"action": "unstake", "amount": None, "receiver_id": None}
+
+
+def test_failed_env_write_keeps_changes_for_retry(tmp_path):
+    env = CountingEnvironment(str(tmp_path))
+    store = StateStore(str(tmp_path), env=env)
+    state = store.load()
+    state.amount = "7"
+
+    env.fail_writes = True
+    with pytest.raises(OSError):
+        store.save(state)
+    assert store.load_values() == {}
+
+    env.fail_writes = False
+    assert store.save(state)
+    assert json.loads(env.files[STATE_FILE]) == {"amount": "7"}
@@ -0,0 +1,140 @@
+import asyncio
+import os
+
+import pytest
+
+from fake_transport import FakeStakingRpc, FixtureHttpClient
+from tx_sync import TX_INTERACTIVE_BACKFILL_PAGES, TransactionIndex, TransactionSync
+from utils import AiUtils
+
+
+class PagedHistory(object):
+    """NearBlocks-style txns endpoint over a list that new transactions can be prepended to"""
+
+    def __init__(self, count, account_id="alice.near"):
+        self.account_id = account_id
+        self.txns = []
+        self.fail_on_page = None
+        self.calls = 0
+        for _ in range(count):
+            self.add()
+
+    def add(self):
+        timestamp = (len(self.txns) + 1) * 10**9
+        self.txns.insert(0, {"transaction_hash": f"tx{timestamp}", "block_timestamp": str(timestamp),
+                             "signer_account_id": self.account_id, "receiver_account_id": "bob.near",
+                             "actions": [{"action": "TRANSFER", "args": {"deposit": "1"}}]})
+
+    async def get_json(self, url, params=None):
+        self.calls += 1
+        start = int(params.get("cursor") or 0)
+        if self.fail_on_page is not None and start // params["per_page"] + 1 == self.fail_on_page:
+            raise RuntimeError("page unavailable")
+        stop = start + params["per_page"]
+        return {"txns": self.txns[start:stop], "cursor": str(stop) if stop < len(self.txns) else None}
+
+
+def make_sync(tmp_path, http, page_size=10, backfill_pages=3):
+    index = TransactionIndex(os.path.join(tmp_path, "tx_index.sqlite3"))
+    return TransactionSync(http, index, page_size=page_size, backfill_pages=backfill_pages)
+
+
+def test_repeated_syncs_complete_backfill(tmp_path):
+    tx_sync = make_sync(tmp_path, FixtureHttpClient())
+    # Only the backfill budget: this history is recent enough that covering 30 days would take it all
+    tx_sync.window_pages = 0
+    totals = [asyncio.run(tx_sync.sync("bench-100.near"))["total"] for _ in range(5)]
+    assert totals == [30, 60, 90, 100, 100]
+    assert tx_sync.index.get_sync_state("bench-100.near")["complete"]
+
+
+def test_failed_delta_page_is_resumed_from_gap_cursor(tmp_path):
+    history = PagedHistory(10)
+    tx_sync = make_sync(tmp_path, history)
+    asyncio.run(tx_sync.sync(history.account_id))
+    newest = tx_sync.index.get_sync_state(history.account_id)["newest_timestamp"]
+
+    for _ in range(25):
+        history.add()
+    history.fail_on_page = 2
+    with pytest.raises(RuntimeError):
+        asyncio.run(tx_sync.sync(history.account_id))
+    state = tx_sync.index.get_sync_state(history.account_id)
+    assert tx_sync.index.count(history.account_id) == 20
+    assert state["gap_cursor"] == "10" and state["gap_floor"] == newest
+
+    history.fail_on_page = None
+    result = asyncio.run(tx_sync.sync(history.account_id))
+    state = tx_sync.index.get_sync_state(history.account_id)
+    assert result["total"] == 35 and state["gap_cursor"] is None
+    assert state["newest_timestamp"] == int(history.txns[0]["block_timestamp"])
+
+
+def test_delta_pages_are_capped_per_sync(tmp_path):
+    history = PagedHistory(10)
+    tx_sync = make_sync(tmp_path, history)
+    tx_sync.delta_pages = 4
+    asyncio.run(tx_sync.sync(history.account_id))
+
+    for _ in range(100):
+        history.add()
+    history.calls = 0
+    result = asyncio.run(tx_sync.sync(history.account_id, backfill_pages=0))
+    assert history.calls == 4 and result["total"] == 50
+    assert tx_sync.index.get_sync_state(history.account_id)["gap_cursor"] == "40"
+
+    totals = [asyncio.run(tx_sync.sync(history.account_id, backfill_pages=0))["total"] for _ in range(3)]
+    assert totals == [80, 110, 110]
+    assert tx_sync.index.get_sync_state(history.account_id)["gap_cursor"] is None
+
+
+def test_thread_reads_do_not_see_open_write_transaction(tmp_path):
+    history = PagedHistory(5)
+    index = TransactionIndex(os.path.join(tmp_path, "tx_index.sqlite3"))
+    state = {"newest_timestamp": 0, "backfill_cursor": None, "complete": True}
+    index.save_page(history.account_id, history.txns, state)
+    try:
+        index.conn.execute("BEGIN IMMEDIATE")
+        index.conn.execute("DELETE FROM txns")
+        # The owner sees its own uncommitted delete; a worker thread reads the committed rows
+        assert index.count(history.account_id) == 0
+        rows = asyncio.run(asyncio.to_thread(index.get_transactions, history.account_id))
+        assert len(rows) == 5
+    finally:
+        index.conn.execute("ROLLBACK")
+        index.close()
+
+
+def test_interactive_recommendation_is_stable_across_syncs(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFISHIELD_DATA_DIR", str(tmp_path))
+    account_id = "bench-400.near"
+
+    async def query_repeatedly():
+        utils = AiUtils(None, None, http=FixtureHttpClient(), staking_rpc=FakeStakingRpc())
+        try:
+            balance = await utils.get_account_balance(account_id)
+            results = []
+            for _ in range(4):
+                sync_stats = await utils.sync_account_transactions(account_id,
+                                                                   backfill_pages=TX_INTERACTIVE_BACKFILL_PAGES)
+                analysis = await utils.analyze_account(account_id)
+                results.append((sync_stats, analysis, utils.make_staking_recommendation(balance, analysis)))
+            return results
+        finally:
+            await utils.close()
+            utils.tx_sync.index.close()
+
+    results = asyncio.run(query_repeatedly())
+    # The first reply already syncs past one page, far enough back to cover the 30-day window
+    assert results[0][0]["pages"] > TX_INTERACTIVE_BACKFILL_PAGES
+    assert all(sync_stats["window_complete"] and analysis["window_complete"] for sync_stats, analysis, _ in results)
+    assert results[-1][0]["total"] > results[0][0]["total"]
+    assert len({analysis["stats"]["windows"]["30d"] for _, analysis, _ in results}) == 1
+    assert all(recommendation == results[0][2] for _, _, recommendation in results)
+
+
+def test_window_stays_incomplete_within_page_cap(tmp_path):
+    tx_sync = make_sync(tmp_path, FixtureHttpClient(), backfill_pages=1)
+    tx_sync.window_pages = 2
+    result = asyncio.run(tx_sync.sync("bench-400.near"))
+    assert result["pages"] == 3 and not result["window_complete"]
@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+from log import get_logger
+
+logger = get_logger("token_registry")
+
+REF_TOKEN_PRICES_URL = "https://api.ref.finance/list-token-price"
+# How often prices are refreshed in the background once the registry is loaded
+TOKEN_REFRESH_SECONDS = 300
+
+
+class TokenInfo(object):
+    """Metadata for one fungible token contract"""
+
+    __slots__ = ("contract_id", "symbol", "decimals", "price")
+
+    def __init__(self, contract_id, symbol, decimals, price):
+        self.contract_id = contract_id
+        self.symbol = symbol
+        self.decimals = decimals
+        self.price = price
+
+    def to_dict(self):
+        # Same shape as a Ref list-token-price entry
+        return {"price": self.price, "symbol": self.symbol, "decimal": self.decimals}
+
+
+class TokenRegistry(object):
+    """Indexed Ref token list: loaded once per process, prices refreshed in the background"""
+
+    def __init__(self, refresh_interval=TOKEN_REFRESH_SECONDS):
+        self.refresh_interval = refresh_interval
+        # contract_id -> TokenInfo
+        self.tokens = {}
+        self.loaded_at = None
+        self.version = 0
+        self._price_map = None
+        self._price_map_version = -1
+        self._loading = None
+        self._refresh_task = None
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, contract_id):
+        return contract_id in self.tokens
+
+    def get(self, contract_id):
+        """Return the TokenInfo for a contract, or None if it is not listed"""
+        return self.tokens.get(contract_id)
+
+    def get_decimals(self, contract_id, default=None):
+        info = self.tokens.get(contract_id)
+        return info.decimals if info is not None and info.decimals is not None else default
+
+    def get_price(self, contract_id):
+        info = self.tokens.get(contract_id)
+        return info.price if info is not None else None
+
+    def update(self, price_list):
+        """Index a Ref list-token-price response; existing entries are updated in place"""
+        if not isinstance(price_list, dict):
+            return 0
+        for contract_id, entry in price_list.items():
+            if not isinstance(entry, dict):
+                continue
+            info = self.tokens.get(contract_id)
+            if info is None:
+                self.tokens[contract_id] = TokenInfo(contract_id, entry.get("symbol"), entry.get("decimal"),
+                                                     entry.get("price"))
+            else:
+                info.price = entry.get("price")
+                info.symbol = entry.get("symbol", info.symbol)
+                info.decimals = entry.get("decimal", info.decimals)
+        self.loaded_at = time.monotonic()
+        self.version += 1
+        return len(price_list)
+
+    def to_price_map(self):
+        """The registry in Ref list-token-price form, rebuilt only after an update"""
+        if self._price_map_version != self.version:
+            self._price_map = {contract_id: info.to_dict() for contract_id, info in self.tokens.items()}
+            self._price_map_version = self.version
+        return self._price_map
+
+    async def load(self, fetch):
+        """Fetch and index the token list unless it is already loaded.
+
+        `fetch` is a coroutine function returning the Ref price map (or None on failure). Concurrent
+        callers share a single in-flight load.
+        """
+        if self.loaded_at is not None:
+            return self
+        loop = asyncio.get_running_loop()
+        if self._loading is None or self._loading.done() or self._loading.get_loop() is not loop:
+            self._loading = loop.create_task(self._load(fetch))
+        await asyncio.shield(self._loading)
+        return self
+
+    async def _load(self, fetch):
+        count = self.update(await fetch())
+        if self.loaded_at is None:
+            logger.warning("Token list unavailable; FT balances fall back to NearBlocks metadata")
+        else:
+            logger.debug("Indexed %d tokens", count)
+
+    def start_refresh(self, fetch):
+        """Refresh prices every refresh_interval seconds on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._refresh_task is not None and not self._refresh_task.done() and self._refresh_task.get_loop() is loop:
+            return
+        self._refresh_task = loop.create_task(self._refresh_loop(fetch))
+
+    async def _refresh_loop(self, fetch):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                self.update(await fetch())
+            except Exception as e:
+                logger.warning("Token price refresh failed: %s", e)
+
+    async def stop(self):
+        """Cancel the background refresh"""
+        task, self._refresh_task = self._refresh_task, None
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+# Shared by every AiUtils instance in the process
+token_registry = TokenRegistry()
@@ -0,0 +1,359 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.request import pathname2url
+
+from analytics import ACTIVITY_WINDOWS, NS_PER_SECOND
+from risk import RiskState
+
+TX_INDEX_FILE = "tx_index.sqlite3"
+TX_PAGE_SIZE = 25
+# Older history is backfilled a bounded number of pages per background or batch sync
+TX_BACKFILL_PAGES = 20
+# A reply waits for at most one page of older history; deeper backfill is left to later syncs and prefetch.py
+TX_INTERACTIVE_BACKFILL_PAGES = 1
+# Backfill continues past the page budget, up to this many more pages, until the indexed history reaches
+# back over the 30-day activity window; beyond that a window this busy is highly active anyway
+TX_WINDOW_SECONDS = ACTIVITY_WINDOWS["30d"]
+TX_WINDOW_MAX_PAGES = 8
+# Newer pages fetched per sync; a longer gap since the last sync is resumed from its cursor by later syncs
+TX_DELTA_MAX_PAGES = 8
+
+
+def encode_transaction(tx):
+    return zlib.compress(json.dumps(tx, separators=(",", ":")).encode())
+
+
+def decode_transaction(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+class TransactionIndex(object):
+    """Local SQLite index of account transactions, clustered by account and block timestamp.
+
+    Writes go through the connection of the thread that created the index (the event loop's). Reads
+    of stored transactions from any other thread, such as analyses run with asyncio.to_thread, use a
+    read-only connection of their own, so they never share a connection with an open write transaction.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.owner_thread = threading.get_ident()
+        self._readers = threading.local()
+        self._reader_conns = []
+        self._reader_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS txns ("
+            "account_id TEXT NOT NULL, block_timestamp INTEGER NOT NULL, transaction_hash TEXT NOT NULL, "
+            "data BLOB NOT NULL, PRIMARY KEY (account_id, block_timestamp, transaction_hash)) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            "account_id TEXT PRIMARY KEY, newest_timestamp INTEGER NOT NULL, backfill_cursor TEXT, "
+            "complete INTEGER NOT NULL, synced_at REAL NOT NULL, gap_cursor TEXT, gap_floor INTEGER)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sync_state)")}
+        for column, kind in (("gap_cursor", "TEXT"), ("gap_floor", "INTEGER")):
+            if column not in columns:
+                # Indexes created before delta gaps were tracked
+                self.conn.execute(f"ALTER TABLE sync_state ADD COLUMN {column} {kind}")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS risk_state (account_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def get_reader(self):
+        """The connection to read through on the calling thread"""
+        if threading.get_ident() == self.owner_thread:
+            return self.conn
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            # WAL lets this read a consistent snapshot while the owner thread writes
+            uri = "file:" + pathname2url(os.path.abspath(self.path)) + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=5, isolation_level=None, check_same_thread=False)
+            self._readers.conn = conn
+            with self._reader_lock:
+                self._reader_conns.append(conn)
+        return conn
+
+    def get_sync_state(self, account_id):
+        """Return the stored sync cursor state for an account, or None if it was never synced"""
+        row = self.conn.execute(
+            "SELECT newest_timestamp, backfill_cursor, complete, synced_at, gap_cursor, gap_floor "
+            "FROM sync_state WHERE account_id = ?",
+            (account_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "newest_timestamp": row[0],
+            "backfill_cursor": row[1],
+            "complete": bool(row[2]),
+            "synced_at": row[3],
+            "gap_cursor": row[4],
+            "gap_floor": row[5]
+        }
+
+    def get_covered_since(self, account_id):
+        """Block timestamp (ns) from which the indexed history has no holes up to the newest transaction.
+
+        0 once the full history is indexed; None if nothing was indexed. Below a delta gap that a later
+        sync still has to walk, older rows do not count.
+        """
+        state = self.get_sync_state(account_id)
+        if state is None:
+            return None
+        if state["gap_cursor"]:
+            query, args = "SELECT MIN(block_timestamp) FROM txns WHERE account_id = ? AND block_timestamp > ?", \
+                (account_id, state["gap_floor"])
+        elif state["complete"]:
+            return 0
+        else:
+            query, args = "SELECT MIN(block_timestamp) FROM txns WHERE account_id = ?", (account_id,)
+        return self.get_reader().execute(query, args).fetchone()[0]
+
+    def covers(self, account_id, since):
+        """Whether the indexed history has no holes from block timestamp `since` (ns) to the newest transaction"""
+        covered_since = self.get_covered_since(account_id)
+        return covered_since is not None and covered_since <= since
+
+    def get_risk_state(self, account_id):
+        """The account's streaming risk state (see risk.py), or None if nothing was indexed yet"""
+        row = self.conn.execute("SELECT data FROM risk_state WHERE account_id = ?", (account_id,)).fetchone()
+        return RiskState.from_dict(json.loads(row[0])) if row else None
+
+    def save_page(self, account_id, transactions, state, check_since=None):
+        """Store a page of transactions, the updated sync state and risk state in one transaction; returns rows added.
+
+        New transactions newer than check_since are checked for anomalies even if a newer page was stored first.
+        """
+        rows = [
+            (account_id, int(tx.get("block_timestamp", 0)), tx.get("transaction_hash", ""), encode_transaction(tx))
+            for tx in transactions
+        ]
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            # Only rows not already indexed feed the risk state, so overlapping pages are not counted twice
+            existing = set()
+            if rows:
+                existing = set(self.conn.execute(
+                    "SELECT block_timestamp, transaction_hash FROM txns "
+                    "WHERE account_id = ? AND block_timestamp BETWEEN ? AND ?",
+                    (account_id, min(row[1] for row in rows), max(row[1] for row in rows))
+                ))
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO txns (account_id, block_timestamp, transaction_hash, data) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            added = self.conn.total_changes - before
+            new_transactions = [tx for tx, row in zip(transactions, rows) if (row[1], row[2]) not in existing]
+            if new_transactions:
+                risk = self.get_risk_state(account_id) or RiskState()
+                risk.observe_page(new_transactions, account_id, check_since)
+                self.conn.execute("INSERT OR REPLACE INTO risk_state (account_id, data) VALUES (?, ?)",
+                                  (account_id, json.dumps(risk.to_dict(), separators=(",", ":"))))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state "
+                "(account_id, newest_timestamp, backfill_cursor, complete, synced_at, gap_cursor, gap_floor) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (account_id, state["newest_timestamp"], state["backfill_cursor"], int(state["complete"]), time.time(),
+                 state.get("gap_cursor"), state.get("gap_floor"))
+            )
+        return added
+
+    def iter_transactions(self, account_id, limit=None, since=None, until=None):
+        """Yield stored transactions newest first, optionally bounded by block timestamp (ns)"""
+        query = "SELECT data FROM txns WHERE account_id = ?"
+        args = [account_id]
+        if since is not None:
+            query += " AND block_timestamp >= ?"
+            args.append(int(since))
+        if until is not None:
+            query += " AND block_timestamp < ?"
+            args.append(int(until))
+        query += " ORDER BY block_timestamp DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(int(limit))
+        for (data,) in self.get_reader().execute(query, args):
+            yield decode_transaction(data)
+
+    def get_transactions(self, account_id, limit=None, since=None, until=None):
+        return list(self.iter_transactions(account_id, limit=limit, since=since, until=until))
+
+    def get_snapshot(self, account_id):
+        """(row count, newest block timestamp) for an account: changes whenever its indexed history does"""
+        return tuple(self.conn.execute(
+            "SELECT COUNT(*), MAX(block_timestamp) FROM txns WHERE account_id = ?", (account_id,)
+        ).fetchone())
+
+    def count(self, account_id):
+        return self.conn.execute("SELECT COUNT(*) FROM txns WHERE account_id = ?", (account_id,)).fetchone()[0]
+
+    def close(self):
+        with self._reader_lock:
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns = []
+        self._readers = threading.local()
+        self.conn.close()
+
+
+class TransactionSync(object):
+    """Cursor-paginated NearBlocks transaction sync that only fetches what the index is missing.
+
+    The first sync walks history newest-first, TX_BACKFILL_PAGES pages at a time, remembering the
+    cursor where it stopped. Later syncs fetch only the pages newer than the newest stored
+    transaction, up to TX_DELTA_MAX_PAGES of them; if that does not reach stored history, the
+    cursor of the gap is kept and the following syncs walk it down first. Then the backfill
+    resumes until the full history has been indexed. Whatever the backfill budget, a sync keeps
+    going (up to TX_WINDOW_MAX_PAGES more pages) until the 30-day activity window is indexed, so
+    analyses see the same window on every query; `window_complete` in its result says whether it is.
+    """
+
+    def __init__(self, http, index, api_base_url="https://api.nearblocks.io", page_size=TX_PAGE_SIZE,
+                 backfill_pages=TX_BACKFILL_PAGES, delta_pages=TX_DELTA_MAX_PAGES, window_pages=TX_WINDOW_MAX_PAGES):
+        self.http = http
+        self.index = index
+        self.api_base_url = api_base_url
+        self.page_size = page_size
+        self.backfill_pages = backfill_pages
+        self.delta_pages = delta_pages
+        self.window_pages = window_pages
+        # account_id -> seconds a previous sync stays fresh enough to skip the delta pass (see prefetch.py)
+        self.fresh_for = {}
+
+    async def fetch_page(self, account_id, cursor=None):
+        url = f"{self.api_base_url}/v1/account/{account_id}/txns"
+        params = {"per_page": self.page_size, "order": "desc"}
+        if cursor:
+            params["cursor"] = cursor
+        content = await self.http.get_json(url, params=params)
+        return content.get("txns", []), content.get("cursor")
+
+    async def sync(self, account_id, backfill_pages=None, max_age=None, delta_pages=None):
+        """Bring the local index up to date for an account and return sync statistics.
+
+        Nothing is fetched if the account was synced less than max_age seconds ago; by default
+        max_age comes from fresh_for, which is zero for accounts nobody keeps warm.
+        """
+        state = self.index.get_sync_state(account_id)
+        if state is None:
+            state = {"newest_timestamp": 0, "backfill_cursor": None, "complete": False,
+                     "gap_cursor": None, "gap_floor": None}
+            started = False
+        else:
+            started = True
+        pages = 0
+        added = 0
+        if max_age is None:
+            max_age = self.fresh_for.get(account_id, 0)
+        fresh = started and time.time() - state["synced_at"] < max_age
+
+        # Delta: walk newest-first until we overlap with what is already stored. Each page is stored as
+        # it arrives, together with the cursor of the gap still below it, so a capped or failed walk is
+        # resumed by the next sync instead of skipped.
+        delta_budget = self.delta_pages if delta_pages is None else delta_pages
+        if started and not fresh and delta_budget > 0:
+            floor = state["newest_timestamp"]
+            pending = (state["gap_cursor"], state["gap_floor"])
+            cursor = None
+            while delta_budget > 0:
+                txns, cursor = await self.fetch_page(account_id, cursor)
+                pages += 1
+                delta_budget -= 1
+                reached = not txns or not cursor or min(int(tx.get("block_timestamp", 0)) for tx in txns) <= floor
+                if reached:
+                    state["gap_cursor"], state["gap_floor"] = pending
+                else:
+                    # An older unfinished gap is folded into this one: walking down to the lower floor covers both
+                    state["gap_cursor"] = cursor
+                    state["gap_floor"] = floor if pending[0] is None else min(floor, pending[1])
+                added += self._save_delta_page(account_id, txns, floor, state)
+                if reached:
+                    break
+
+            # Resume a gap left by an earlier sync with whatever budget is left
+            while delta_budget > 0 and state["gap_cursor"]:
+                floor = state["gap_floor"]
+                txns, cursor = await self.fetch_page(account_id, state["gap_cursor"])
+                pages += 1
+                delta_budget -= 1
+                if not txns or not cursor or min(int(tx.get("block_timestamp", 0)) for tx in txns) <= floor:
+                    state["gap_cursor"], state["gap_floor"] = None, None
+                else:
+                    state["gap_cursor"] = cursor
+                added += self._save_delta_page(account_id, txns, floor, state)
+
+        # Backfill: continue older history from where the previous sync stopped. A fresh account is
+        # being kept warm in the background, which also carries its backfill forward.
+        budget = self.backfill_pages if backfill_pages is None else backfill_pages
+        while not fresh and not state["complete"] and budget > 0 and (state["backfill_cursor"] or not started):
+            txns, page_added = await self._backfill_step(account_id, state)
+            pages += 1
+            budget -= 1
+            started = True
+            added += page_added
+
+        # Then cover the activity window; older history below a delta gap would not help until the gap is walked
+        window_start = time.time_ns() - TX_WINDOW_SECONDS * NS_PER_SECOND
+        window_budget = self.window_pages
+        while (not fresh and not state["complete"] and state["backfill_cursor"] and not state.get("gap_cursor")
+               and window_budget > 0 and not self.index.covers(account_id, window_start)):
+            _, page_added = await self._backfill_step(account_id, state)
+            pages += 1
+            window_budget -= 1
+            added += page_added
+
+        return {
+            "account_id": account_id,
+            "pages": pages,
+            "added": added,
+            "complete": state["complete"],
+            "window_complete": self.index.covers(account_id, window_start),
+            "total": self.index.count(account_id)
+        }
+
+    def _save_delta_page(self, account_id, txns, floor, state):
+        """Index the transactions of a delta page at or above floor, checking those newer than it for risk"""
+        new_txns = [tx for tx in txns if int(tx.get("block_timestamp", 0)) >= floor]
+        if new_txns:
+            newest = max(int(tx.get("block_timestamp", 0)) for tx in new_txns)
+            state["newest_timestamp"] = max(state["newest_timestamp"], newest)
+        return self.index.save_page(account_id, new_txns, state, check_since=floor)
+
+    async def _backfill_step(self, account_id, state):
+        """Fetch the next older page after state["backfill_cursor"] and index it"""
+        txns, cursor = await self.fetch_page(account_id, state["backfill_cursor"])
+        if txns:
+            newest = max(int(tx.get("block_timestamp", 0)) for tx in txns)
+            state["newest_timestamp"] = max(state["newest_timestamp"], newest)
+        state["backfill_cursor"] = cursor
+        state["complete"] = not txns or not cursor
+        return txns, self.index.save_page(account_id, txns, state)
+
+    async def iter_transactions(self, account_id, limit=None):
+        """Yield an account's transactions newest first: indexed rows, then older pages as they are fetched.
+
+        Nothing beyond the current page is held in memory, so callers can stream long histories.
+        """
+        count = 0
+        for tx in self.index.iter_transactions(account_id, limit=limit):
+            yield tx
+            count += 1
+        state = self.index.get_sync_state(account_id)
+        while state is not None and not state["complete"] and state["backfill_cursor"] and (
+                limit is None or count < limit):
+            txns, _ = await self._backfill_step(account_id, state)
+            for tx in txns:
+                if limit is not None and count >= limit:
+                    return
+                yield tx
+                count += 1
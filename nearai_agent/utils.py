@@ -1,58 +1,123 @@
-import enum
+import asyncio
 import json
-import re
-from decimal import Decimal, getcontext, ROUND_DOWN
-
-import base58
-import ed25519
-import requests
-from nearai.agents.environment import Environment
-from py_near.account import Account
-from py_near.dapps.core import NEAR
-from datetime import datetime
-
-STATE_FILE = "state.json"
-
-
-def convert_from_decimals_to_string(number: float, decimals: int, round_digits: int = 6) -> str:
-    getcontext().prec = decimals + 20
-    decimal_number = Decimal(number)
-    scaled_number = decimal_number / Decimal(10) ** decimals
-    rounded_number = scaled_number.quantize(Decimal('1.' + '0' * round_digits), rounding=ROUND_DOWN)
-
-    return str(rounded_number)
-
-
-class State:
-    def __init__(self, **entries):
-        self.action = ""
-        self.amount = None
-        self.receiver_id = None
-
-        self.all_available_tokens = None
+import os
+import tempfile
+import time
 
-        self.__dict__.update(entries)
-
-    def to_dict(self):
-        return {k: (v.name if isinstance(v, enum.Enum) else v) for k, v in self.__dict__.items()}
-
-    def to_json(self):
-        return json.dumps(self.to_dict())
-
-    def remove_attribute(self, key):
-        if key in self.__dict__:
-            del self.__dict__[key]  # Use del to remove the attribute
-        else:
-            print(f"Attribute '{key}' not found in State.")
+import aiohttp
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import analytics
+import rendering
+from account_ids import validate_account_id
+import response_parser
+from amounts import Amount, format_batch, format_units, parse_raw
+from cache import ResponseCache, make_cache_key, response_cache
+from disk_cache import DiskCache, DISK_CACHE_FILE
+from http_client import HttpClient, CircuitOpenError
+from log import get_logger
+from metrics import timed
+from recommendation import RecommendationEngine
+from risk import empty_summary
+from singleflight import SingleFlight
+from staking import StakingAggregator, staking_aggregator
+from state import State, StateStore
+from token_registry import token_registry, REF_TOKEN_PRICES_URL
+from tx_sync import TransactionIndex, TransactionSync, TX_INDEX_FILE, TX_WINDOW_SECONDS
+from watchlist import Watchlist
+
+if TYPE_CHECKING:
+    from nearai.agents.environment import Environment
+
+logger = get_logger("utils")
+
+# Activity level thresholds: transactions in the last 30 days
+HIGHLY_ACTIVE_30D = 10
+MODERATELY_ACTIVE_30D = 3
+RECENT_ACTIVITY_SECONDS = 7 * 24 * 60 * 60
+
+# Transaction rows per streamed reply chunk
+STREAM_CHUNK_ROWS = 25
+
+# Shared by every AiUtils instance in the process, so concurrent agent() runs coalesce identical work
+fetch_flights = SingleFlight("fetch")
+sync_flights = SingleFlight("sync")
+analysis_flights = SingleFlight("analysis")
+
+
+def convert_from_decimals_to_string(number, decimals: int, round_digits: int = 6) -> str:
+    return format_units(parse_raw(number), decimals, round_digits, trim=False)
+
+
+def classify_activity(stats, now_ns, window_complete=True):
+    """analyze_transactions() result for analytics stats computed as of now_ns.
+
+    window_complete=False marks the window counts and outflows as lower bounds over a partly synced 30 days.
+    """
+    # Determine if there was recent activity (within last 7 days)
+    recent_activity = (now_ns - stats["last_timestamp"]) < RECENT_ACTIVITY_SECONDS * 1000000000
+
+    # Determine activity level from the last 30 days of history
+    recent_count = stats["windows"]["30d"]
+    if recent_count >= HIGHLY_ACTIVE_30D:
+        activity_level = "highly active"
+    elif recent_count >= MODERATELY_ACTIVE_30D:
+        activity_level = "moderately active"
+    else:
+        activity_level = "minimally active"
+
+    return {
+        "activity_level": activity_level,
+        "transaction_types": stats["action_histogram"],
+        "recent_activity": recent_activity,
+        "window_complete": window_complete,
+        "stats": stats
+    }
 
 
 class AiUtils(object):
-    def __init__(self, _env: Environment, _agent):
+    def __init__(self, _env: "Environment", _agent, http=None, staking_rpc=None):
         self.env = _env
         self.agent = _agent
         self.api_base_url = "https://api.nearblocks.io"
+        # Anything with async get_json(url, params)/close() works, e.g. the benchmark fixture transport
+        self.http = http or HttpClient()
+        self.cache = response_cache
+        self.tokens = token_registry
+        # A stand-in view RPC (see staking.py) gets its own aggregator and cache so it never shares the process cache
+        self.staking = staking_aggregator if staking_rpc is None else StakingAggregator(rpc=staking_rpc,
+                                                                                       cache=ResponseCache())
+        self.state_store = StateStore(self.get_data_dir(), env=self.env)
+        self.recommender = RecommendationEngine()
+        if self.cache.store is None:
+            # Persist responses next to the agent state so warm restarts skip the network
+            self.cache.attach_store(DiskCache(os.path.join(self.get_data_dir(), DISK_CACHE_FILE)))
+        self.tx_sync = TransactionSync(self.http, TransactionIndex(os.path.join(self.get_data_dir(), TX_INDEX_FILE)),
+                                       api_base_url=self.api_base_url)
+        # Accounts kept warm by prefetch.py are served from cache between its refreshes
+        self.watchlist = Watchlist(self.get_data_dir())
+        self.watchlist.apply(self.cache, self.tx_sync)
+
+    def get_data_dir(self):
+        """Directory for persistent caches: DEFISHIELD_DATA_DIR when configured, so agent runs share what
+        prefetch.py keeps warm, else the agent temp path, or the default data dir outside an agent run"""
+        configured = os.environ.get("DEFISHIELD_DATA_DIR")
+        if configured:
+            return configured
+        if self.env is not None:
+            return self.env.get_agent_temp_path()
+        return self.get_default_data_dir()
+
+    @staticmethod
+    def get_default_data_dir():
+        return os.environ.get("DEFISHIELD_DATA_DIR") or os.path.join(tempfile.gettempdir(), "defishield")
 
     def get_public_key(self, extended_private_key):
+        # Imported on first use; long-lived workers should not pay for them on every start
+        import base58
+        import ed25519
+
         private_key_base58 = extended_private_key.replace("ed25519:", "")
 
         decoded = base58.b58decode(private_key_base58)
@@ -65,81 +130,131 @@ class AiUtils(object):
 
         return base58_public_key
 
+    async def close(self):
+        """Stop token price refreshes, finish background cache refreshes and close the pooled HTTP client"""
+        await self.tokens.stop()
+        await self.cache.drain()
+        await self.http.close()
+
+    async def get_json(self, url, params=None):
+        """GET a URL through the shared response cache and pooled HTTP client, decoding the JSON body.
+
+        Concurrent requests for the same URL and parameters share one in-flight fetch.
+        """
+        return await fetch_flights.do(
+            make_cache_key(url, params),
+            lambda: self.cache.get_or_fetch(url, params, lambda: self.http.get_json(url, params=params))
+        )
+
+    def get_cache_stats(self):
+        return self.cache.stats()
+
     async def get_account_balance(self, account_id):
         """Get account balance using NearBlocks API"""
         url = f"{self.api_base_url}/v1/account/{account_id}"
-        # print("URL", url)
-        response = requests.get(url)
-        # print("RESPONSE", response)
-        response.raise_for_status()
-        content = response.json()
-        # print("CONTENT", content)
+        content = await self.get_json(url)
         
         # Extract balance from the account data
         account_data = content.get("account", {})[0]
-        # print("ACCOUNT DATA", account_data)
         if account_data:
             amount = account_data.get("amount", "0")
-            # print("AMOUNT", amount)
-            # Convert yoctoNEAR to NEAR (1 NEAR = 10^24 yoctoNEAR)
-            balance = float(amount) / 10**24
-            return balance
-        return 0
+            # Exact yoctoNEAR amount (1 NEAR = 10^24 yoctoNEAR)
+            return Amount(amount)
+        return Amount(0)
 
     async def get_nearblocks_account_balance(self, account_id):
         """Get account balance using NearBlocks API"""
         url = f"https://api.nearblocks.io/v1/account/{account_id}/balance"
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.json()
-        balance = content.get("balance", 0) / NEAR
-        return balance
+        content = await self.get_json(url)
+        return Amount(content.get("balance", 0))
 
-    def get_nearblocks_account_fts(self, state, account_id):
+    async def get_nearblocks_account_fts(self, state, account_id):
         """Get fungible tokens using NearBlocks API"""
         url = f"https://api.nearblocks.io/v1/account/{account_id}/ft"
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.json()
+        # The token registry is only needed for decimals, so load it alongside the token balances
+        content, registry = await asyncio.gather(self.get_json(url), self.load_token_registry())
         tokens = content.get("tokens", [])
 
-        print("tokens", tokens)
-
-        if len((state.all_available_tokens or [])) == 0:
-            self.get_all_tokens(state)
+        logger.debug("Fetched %d fungible tokens for %s", len(tokens), account_id)
 
+        # Group balances by decimals so each group is formatted in one batch
+        by_decimals = {}
         for token in tokens:
-            token_contract_id = token["contract_id"]
-            token_decimals = state.all_available_tokens[token_contract_id]["decimal"] or 0
+            # Contracts missing from the Ref list fall back to the decimals NearBlocks reports
+            token_decimals = registry.get_decimals(token["contract_id"]) or (token.get("ft_meta") or {}).get("decimals")
             token_balance_full = token["balance"] or 0
             if token_decimals and token_balance_full:
-                token["balance_hr"] = convert_from_decimals_to_string(token_balance_full, token_decimals)
+                by_decimals.setdefault(token_decimals, []).append(token)
+        for token_decimals, group in by_decimals.items():
+            formatted = format_batch([token["balance"] for token in group], token_decimals, trim=False)
+            for token, balance_hr in zip(group, formatted):
+                token["balance_hr"] = balance_hr
 
         return tokens
 
-    def get_account_staking_pools(self, state, account_id):
+    async def get_account_staking_pools(self, state, account_id):
         url = f"https://api.fastnear.com/v1/account/{account_id}/staking"
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.json()
+        content = await self.get_json(url)
         pools = content.get("pools", [])
 
-        print("staking_pools", pools)
+        logger.debug("Fetched %d staking pools for %s", len(pools), account_id)
 
         return pools
 
-    def get_nearblocks_staking_info(self, account_id):
+    async def get_staking_positions(self, account_id):
+        """Staked, unstaked and withdrawable NEAR across the account's staking pools, queried on-chain"""
+        pools = await self.get_account_staking_pools(None, account_id)
+        return await self.staking.aggregate(account_id, [pool["pool_id"] for pool in pools if pool.get("pool_id")])
+
+    async def get_nearblocks_staking_info(self, account_id):
         """Get staking information using NearBlocks API"""
         url = f"https://api.nearblocks.io/v1/account/{account_id}/staking"
-        response = requests.get(url)
-        response.raise_for_status()
-        content = response.json()
+        content = await self.get_json(url)
         staking_info = content.get("staking_info", [])
         
-        print("staking_info", staking_info)
+        logger.debug("Fetched %d staking entries for %s", len(staking_info), account_id)
         
         return staking_info
 
+    async def fetch_account_overview(self, account_id, limit=5, backfill_pages=None, max_age=None):
+        """Fetch balance, synced transactions, FTs and staking data for an account concurrently"""
+        validate_account_id(account_id)
+        state = State()
+        balance, sync_stats, tokens, staking_info, staking_pools, staking = await asyncio.gather(
+            timed("balance_fetch", self.get_account_balance(account_id)),
+            timed("txn_sync", self.sync_account_transactions(account_id, backfill_pages=backfill_pages,
+                                                               max_age=max_age)),
+            timed("ft_fetch", self.get_nearblocks_account_fts(state, account_id)),
+            timed("staking_info_fetch", self.get_nearblocks_staking_info(account_id)),
+            timed("staking_pools_fetch", self.get_account_staking_pools(state, account_id)),
+            timed("staking_positions_fetch", self.get_staking_positions(account_id)),
+            return_exceptions=True
+        )
+
+        # Balance and transactions drive the recommendation, so their failures are fatal
+        for result in (balance, sync_stats):
+            if isinstance(result, BaseException):
+                raise result
+
+        overview = {
+            "balance": balance,
+            "transactions": self.get_account_history(account_id, limit=limit),
+            "sync": sync_stats,
+            "tokens": tokens,
+            "staking_info": staking_info,
+            "staking_pools": staking_pools,
+            "staking": staking
+        }
+        for key in ("tokens", "staking_info", "staking_pools"):
+            if isinstance(overview[key], BaseException):
+                logger.warning("Failed to fetch %s for %s: %s", key, account_id, overview[key])
+                overview[key] = []
+        if isinstance(staking, BaseException):
+            logger.warning("Failed to aggregate staking positions for %s: %s", account_id, staking)
+            overview["staking"] = None
+
+        return overview
+
     def get_user_message(self, state):
         last_message = self.env.get_last_message()["content"]
         reminder = "Always follow INSTRUCTIONS and produce valid JSON only as explained in OUTPUT format."
@@ -157,343 +272,163 @@ class AiUtils(object):
 
         messages = [{"role": "system", "content": system_prompt}] + list_messages
 
-        print("PROMPT messages:", messages)
+        logger.debug("Prompt has %d messages", len(messages))
 
         return messages
 
-    def fetch_url(self, url):
+    async def fetch_url(self, url):
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-
-            data = response.json()
+            data = await self.get_json(url)
 
             return data
 
-        except requests.exceptions.HTTPError as http_err:
-            print(f"HTTP error occurred: {http_err}")
-        except requests.exceptions.ConnectionError as conn_err:
-            print(f"Connection error occurred: {conn_err}")
-        except requests.exceptions.Timeout as timeout_err:
-            print(f"Timeout error occurred: {timeout_err}")
-        except requests.exceptions.RequestException as req_err:
-            print(f"An error occurred: {req_err}")
+        except aiohttp.ClientResponseError as http_err:
+            logger.error("HTTP error occurred: %s", http_err)
+        except CircuitOpenError as circuit_err:
+            logger.error("Circuit open: %s", circuit_err)
+        except aiohttp.ClientConnectionError as conn_err:
+            logger.error("Connection error occurred: %s", conn_err)
+        except asyncio.TimeoutError as timeout_err:
+            logger.error("Timeout error occurred: %s", timeout_err)
+        except aiohttp.ClientError as req_err:
+            logger.error("An error occurred: %s", req_err)
         except json.JSONDecodeError as json_err:
-            print(f"JSON decode error: {json_err}")
+            logger.error("JSON decode error: %s", json_err)
 
-    def get_all_tokens(self, state: State):
-        if not state.all_available_tokens:
-            state.all_available_tokens = self.fetch_url("https://api.ref.finance/list-token-price")
+    async def load_token_registry(self):
+        """Load the shared token registry once and keep its prices fresh in the background"""
+        fetch = lambda: self.fetch_url(REF_TOKEN_PRICES_URL)
+        await self.tokens.load(fetch)
+        if self.tokens.loaded_at is not None:
+            self.tokens.start_refresh(fetch)
+        return self.tokens
 
-        return state.all_available_tokens
+    async def get_all_tokens(self, state: State):
+        return (await self.load_token_registry()).to_price_map()
 
     def parse_response(self, response):
-        try:
-            print("Parsing response", response)
-            parsed_response = json.loads(response)
-            return parsed_response
-
-        except Exception as err:
-            markdown_json_match = re.match(r'```json\s*(\{.*?\})\s*```', response, re.DOTALL)
-            if markdown_json_match:
-                response = markdown_json_match.group(1)
-
-            else:
-                markdown_match = re.search(r'```(.*?)```', response, re.DOTALL)
-                if markdown_match:
-                    response = markdown_match.group(1).replace('\n', '').strip()
-                else:
-                    json_match = re.search(r'\{.*\}', response, re.DOTALL)
-                    if json_match:
-                        response = json_match.group(0).replace('\n', '').strip()
-            try:
-                print("Parsing response", response)
-                parsed_response = json.loads(response)
-                return parsed_response
-            except json.JSONDecodeError:
-                try:
-                    response = response.replace(";", "")
-                    print("Parsing response", response)
-                    parsed_response = json.loads(response)
-                    return parsed_response
-                except json.JSONDecodeError:
-                    print(f"JSON decode error: {response}")
-                    return {"message": "JSON decode error"}
+        logger.debug("Parsing response (%d chars)", len(response))
+        parsed_response = response_parser.parse_response(response)
+        if parsed_response == response_parser.PARSE_ERROR:
+            logger.warning("JSON decode error for response of %d chars", len(response))
+        return parsed_response
 
     def get_state(self):
-        all_files = self.env.list_files(self.env.get_agent_temp_path())
-        if STATE_FILE in all_files:
-            try:
-                _state = self.env.read_file(STATE_FILE)
-                parsed_dict = json.loads(_state)
-                return parsed_dict
-            except json.JSONDecodeError:
-                return {}
-        else:
-            return {}
+        """Load the conversation state as a dict of the saved fields (empty when nothing was saved)"""
+        return self.state_store.load_values()
+
+    def load_state(self):
+        """Load the conversation state as a State, whose changed fields save_state() persists"""
+        return self.state_store.load()
 
     def save_state(self, state):
-        state.remove_attribute('all_available_tokens')
-        print("Saving state", state.to_json())
-        self.env.write_file(STATE_FILE, state.to_json())
+        """Persist a State: through the NEAR AI environment's files in an agent run, else the local state log"""
+        self.state_store.save(state)
 
-    def get_list_token_prompt(self, state):
+    async def get_list_token_prompt(self, state):
         prompt = f"""Below you will find  a list of all available tokens. Format of every entry: 
         NEAR_CONTRACT_ID:{{"price":PRICE_IN_USD_STRING,"symbol":"TOKEN_TICKER","decimal":NUMBER}}
 
 
-        {self.get_all_tokens(state)}
+        {await self.get_all_tokens(state)}
 
         """
 
         return prompt
 
     
-    def get_account_transactions(self, account_id, limit=5):
+    async def get_account_transactions(self, account_id, limit=5):
         """Fetch recent transactions for an account using NearBlocks API"""
-        # print("Fetching transactions for account", account_id)
         url = f"{self.api_base_url}/v1/account/{account_id}/txns"
         params = {
             "limit": limit,
             "order": "desc"  # Get most recent transactions
         }
-        response = requests.get(url, params=params)
-        # print("RESPONSE", response)
-        response.raise_for_status()
-        content = response.json()
-        # print("CONTENT", content)
+        content = await self.get_json(url, params=params)
         
         transactions = content.get("txns", [])
-        # print("TRANSACTIONS", transactions)
         return transactions
 
-    def analyze_transactions(self, transactions):
-        """Analyze transaction history to determine patterns"""
+    async def sync_account_transactions(self, account_id, backfill_pages=None, max_age=None):
+        """Fetch only transactions newer than the local index, plus a bounded backfill of older history"""
+        validate_account_id(account_id)
+        key = (self.tx_sync.index.path, account_id, backfill_pages, max_age)
+        return await sync_flights.do(
+            key, lambda: self.tx_sync.sync(account_id, backfill_pages=backfill_pages, max_age=max_age))
+
+    def get_account_history(self, account_id, limit=None, since=None):
+        """Read synced transactions for an account from the local index, newest first"""
+        return self.tx_sync.index.get_transactions(account_id, limit=limit, since=since)
+
+    async def analyze_account(self, account_id):
+        """Analyze an account's indexed history off the event loop, with its streaming risk summary.
+
+        The worker thread reads the history through its own read-only index connection (see TransactionIndex).
+
+        Concurrent analyses of the same history snapshot (row count and newest transaction) share one run.
+        """
+        index = self.tx_sync.index
+        window_complete = index.covers(account_id, time.time_ns() - TX_WINDOW_SECONDS * analytics.NS_PER_SECOND)
+        if not window_complete:
+            logger.info("History of %s does not cover the activity window yet; window counts are lower bounds",
+                        account_id)
+        key = (index.path, account_id, window_complete) + index.get_snapshot(account_id)
+        analysis = await analysis_flights.do(key, lambda: asyncio.to_thread(
+            lambda: self.analyze_transactions(self.get_account_history(account_id), account_id=account_id,
+                                              window_complete=window_complete)))
+        return dict(analysis, risk=self.get_risk(account_id))
+
+    def get_risk(self, account_id):
+        """Risk score and recent flags, maintained incrementally as transactions are synced (see risk.py)"""
+        risk = self.tx_sync.index.get_risk_state(account_id)
+        return risk.summary() if risk is not None else empty_summary()
+
+    def analyze_transactions(self, transactions, account_id=None, now_ns=None, window_complete=True):
+        """Analyze transaction history to determine patterns, as of now_ns (default: now)"""
         if not transactions:
             return {
                 "activity_level": "inactive",
                 "transaction_types": {},
-                "recent_activity": False
+                "recent_activity": False,
+                "window_complete": window_complete,
+                "stats": None
             }
-        
-        # Count transaction types
-        tx_types = {}
-        recent_timestamp = 0
-        
-        print("Transactions", transactions)
-        for tx in transactions:
-            print("TX", tx)
-            # Analyze transaction types
-            actions = tx.get("actions", [])
-            print("Actions", actions)
-            for action in actions:
-                action_kind = action.get("action", "unknown")
-                print("Action Kind", action_kind)
-                tx_types[action_kind] = tx_types.get(action_kind, 0) + 1
-                print("TX Types", tx_types)
-            
-            # Check timestamp of most recent transaction
-            block_timestamp = int(tx.get("block_timestamp", 0))
-            if block_timestamp > recent_timestamp:
-                recent_timestamp = block_timestamp
-        
-        # Determine if there was recent activity (within last 7 days)
-        current_time = datetime.now().timestamp() * 1000000000  # Convert to nanoseconds
-        recent_activity = (current_time - recent_timestamp) < (7 * 24 * 60 * 60 * 1000000000)
-        print("Recent Activity", recent_activity)
-        
-        # Determine activity level
-        if len(transactions) >= 5:
-            activity_level = "highly active"
-        elif len(transactions) >= 3:
-            activity_level = "moderately active"
-        elif len(transactions) > 0:
-            activity_level = "minimally active"
-        else:
-            activity_level = "inactive"
-            
-        return {
-            "activity_level": activity_level,
-            "transaction_types": tx_types,
-            "recent_activity": recent_activity
-        }
+
+        # Columnar batch statistics over the whole history (see analytics.py)
+        if now_ns is None:
+            now_ns = datetime.now().timestamp() * 1000000000
+        stats = analytics.analyze(transactions, account_id=account_id, now_ns=int(now_ns))
+        return classify_activity(stats, now_ns, window_complete)
     
-    def make_staking_recommendation(self, balance, transaction_analysis):
-        """Determine if staking is recommended based on account activity and balance"""
-        # Check for minimum balance requirement (at least 1 NEAR)
-        if balance < 1:
-            return {
-                "recommendation": "not_recommended",
-                "reason": "Insufficient balance for staking. A minimum of 1 NEAR is recommended.",
-                "confidence": "high"
-            }
-        
-        # Check account activity
-        activity_level = transaction_analysis.get("activity_level", "inactive")
-        recent_activity = transaction_analysis.get("recent_activity", False)
-        tx_types = transaction_analysis.get("transaction_types", {})
-        
-        # If account is highly active with recent transactions, probably not a good idea to stake all funds
-        if activity_level == "highly active" and recent_activity:
-            # Check if they have enough balance to stake some and keep some liquid
-            if balance > 10:
-                return {
-                    "recommendation": "partial_stake",
-                    "reason": "Your account is very active with recent transactions. Consider staking only a portion of your balance to maintain liquidity for continued activity.",
-                    "confidence": "medium",
-                    "suggested_amount": round(balance * 0.7, 2)  # Stake 70% of balance
-                }
-            else:
-                return {
-                    "recommendation": "not_recommended",
-                    "reason": "Your account is very active with recent transactions, and your balance suggests you may need liquidity for continued activity.",
-                    "confidence": "medium"
-                }
-        
-        # If account has moderate activity but not recently, good candidate for staking
-        if activity_level in ["moderately active", "minimally active"] and not recent_activity:
-            return {
-                "recommendation": "recommended",
-                "reason": "Your account shows some historical activity but has been quiet recently. Staking would be a good way to earn rewards on your idle NEAR.",
-                "confidence": "high",
-                "suggested_amount": round(balance * 0.9, 2)  # Stake 90% of balance
-            }
-        
-        # If account is inactive or has very little activity, excellent staking candidate
-        if activity_level == "inactive" or (activity_level == "minimally active" and not recent_activity):
-            return {
-                "recommendation": "highly_recommended",
-                "reason": "Your account shows minimal activity, making it an excellent candidate for staking to earn rewards on your NEAR.",
-                "confidence": "high",
-                "suggested_amount": round(balance * 0.95, 2)  # Stake 95% of balance
-            }
-        
-        print("reached here at 371")
-        
-        # Default recommendation for cases not covered above
-        return {
-            "recommendation": "recommended",
-            "reason": "Based on your balance and account activity, staking appears to be a reasonable option.",
-            "confidence": "medium",
-            "suggested_amount": round(balance * 0.8, 2)  # Stake 80% of balance
-        }
+    def make_staking_recommendation(self, balance, transaction_analysis, staking=None):
+        """Determine if staking is recommended based on account activity, balance and existing stake"""
+        # Thresholds and rules live in the recommendation engine's rule table (see recommendation.py)
+        return self.recommender.evaluate(balance, transaction_analysis, staking)
     
     def format_transactions_as_markdown(self, transactions):
         """Format transactions as markdown for display"""
-        print("Starting format_transactions_as_markdown")
-        print(f"Transactions to format: {len(transactions) if transactions else 0}")
-        
-        if not transactions:
-            print("No transactions to format")
-            return "\n\n**No recent transactions found**"
-        
-        markdown_list = []
-        
-        for i, tx in enumerate(transactions):
-            print(f"Processing transaction {i+1}/{len(transactions)}")
-            try:
-                # Get transaction hash
-                tx_hash = tx.get("transaction_hash", tx.get("hash", "Unknown"))
-                print(f"Transaction hash: {tx_hash}")
-                
-                # Get block timestamp and format it
-                block_timestamp = tx.get("block_timestamp", "Unknown")
-                if block_timestamp != "Unknown":
-                    timestamp = datetime.fromtimestamp(int(block_timestamp) / 1000000000).strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    timestamp = "Unknown"
-                print(f"Transaction timestamp: {timestamp}")
-                
-                # Extract transaction details
-                actions = tx.get("actions", [])
-                print(f"Actions: {actions}")
-                action_details = []
-                
-                if not actions:
-                    action_details.append("Unknown action")
-                    print("No actions found in transaction")
-                
-                for action in actions:
-                    try:
-                        kind = action.get("action", "Unknown")
-                        print(f"Action kind: {kind}")
-                        args = action.get("args", {})
-                        
-                        if kind == "TRANSFER":
-                            deposit = args.get("deposit", "0")
-                            # Convert yoctoNEAR to NEAR
-                            amount = float(deposit) / 10**24
-                            action_details.append(f"Transfer: {amount} NEAR")
-                        elif kind == "FUNCTION_CALL":
-                            method_name = args.get("method_name", "Unknown")
-                            action_details.append(f"Function: {method_name}")
-                        else:
-                            action_details.append(kind)
-                    except Exception as e:
-                        print(f"Error processing action: {e}")
-                        action_details.append("Error processing action")
-                
-                actions_str = ", ".join(action_details) or "No actions"
-                print(f"Action string: {actions_str}")
-                
-                # Get status
-                status = tx.get("outcomes", {}).get("status", "Unknown")
-                print(f"Status: {status}")
-                
-                # Build markdown line
-                try:
-                    markdown_line = (
-                        f"- **[{tx_hash[:8]}...](https://nearblocks.io/txns/{tx_hash})** | "
-                        f"{actions_str} | "
-                        f"Status: {status} | {timestamp}\n"
-                    )
-                    print(f"Markdown line: {markdown_line}")
-                    markdown_list.append(markdown_line)
-                except Exception as e:
-                    print(f"Error creating markdown line: {e}")
-                    markdown_list.append(f"- Error formatting transaction {tx_hash[:8] if tx_hash != 'Unknown' else 'Unknown'}\n")
-            
-            except Exception as e:
-                print(f"Error processing transaction: {e}")
-                markdown_list.append("- Error processing transaction\n")
-        
-        result = "\n" + "\n".join(markdown_list)
-        print(f"Final markdown length: {len(result)}")
-        return result
-    
+        return self.render_transactions(transactions)
+
+    def render_transactions(self, transactions, fmt="markdown"):
+        """Render transaction rows in one of rendering.FORMATS"""
+        logger.debug("Rendering %d transactions as %s", len(transactions) if transactions else 0, fmt)
+        return rendering.render_transactions(transactions or [], fmt)
+
+    async def stream_transactions_markdown(self, account_id, limit=None, chunk_rows=STREAM_CHUNK_ROWS, fmt="markdown"):
+        """Yield rendered chunks of up to chunk_rows transaction rows as history is read or fetched"""
+        rows = []
+        async for tx in self.tx_sync.iter_transactions(account_id, limit=limit):
+            rows.append(tx)
+            if len(rows) >= chunk_rows:
+                yield rendering.render_transactions(rows, fmt)
+                rows = []
+        if rows:
+            yield rendering.render_transactions(rows, fmt)
+
     def format_recommendation_as_markdown(self, account_id, balance, recommendation):
         """Format the staking recommendation as markdown"""
-        print("starting at 433")
-        rec_type = recommendation.get("recommendation", "")
-        reason = recommendation.get("reason", "")
-        confidence = recommendation.get("confidence", "")
-        suggested_amount = recommendation.get("suggested_amount", None)
-        
-        # Create header with appropriate emoji
-        if rec_type == "highly_recommended":
-            header = "# ✅ Staking is Highly Recommended"
-        elif rec_type == "recommended":
-            header = "# ✅ Staking is Recommended"
-        elif rec_type == "partial_stake":
-            header = "# ⚠️ Partial Staking Recommended"
-        else:
-            header = "# ❌ Staking is Not Recommended"
-        
-        # Build the full recommendation message
-        markdown = f"{header}\n\n"
-        markdown += f"**Account:** [{account_id}](https://nearblocks.io/address/{account_id})\n\n"
-        markdown += f"**Current Balance:** {balance} NEAR\n\n"
-        markdown += f"**Recommendation:** {reason}\n\n"
-        
-        if suggested_amount:
-            markdown += f"**Suggested Staking Amount:** {suggested_amount} NEAR\n\n"
-        
-        markdown += "## Important Considerations\n\n"
-        markdown += "- Staking involves locking up your NEAR tokens\n"
-        markdown += "- There is a waiting period when unstaking (typically 2-3 days)\n"
-        markdown += "- APY rates vary by validator, typically ranging from 8-12%\n"
-        markdown += "- Choose validators carefully - consider their track record and fees\n\n"
-        
-        markdown += "*This recommendation is provided based on your account's transaction history and balance. Always do your own research before making financial decisions.*"
-        
-        return markdown
+        return self.render_recommendation(account_id, balance, recommendation)
+
+    def render_recommendation(self, account_id, balance, recommendation, fmt="markdown"):
+        """Render the staking recommendation in one of rendering.FORMATS"""
+        return rendering.render_recommendation(account_id, balance, recommendation, fmt)
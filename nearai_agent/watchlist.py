@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+from account_ids import validate_account_id
+from log import get_logger
+
+logger = get_logger("watchlist")
+
+WATCHLIST_FILE = "watchlist.json"
+# Refresh bounds in seconds; busier accounts refresh closer to the minimum
+WATCH_MIN_INTERVAL = 120
+WATCH_MAX_INTERVAL = 6 * 60 * 60
+# Watched accounts' cached data may be served stale (and refreshed in the background) for this many intervals
+WATCH_STALE_INTERVALS = 2
+
+
+def adaptive_interval(transactions_per_day, min_interval=WATCH_MIN_INTERVAL, max_interval=WATCH_MAX_INTERVAL):
+    """Refresh interval for an account: max_interval when idle, shrinking as activity grows"""
+    return int(min(max_interval, max(min_interval, max_interval / (1.0 + transactions_per_day))))
+
+
+class Watchlist(object):
+    """Accounts kept warm by the prefetch scheduler, persisted as JSON next to the caches"""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, WATCHLIST_FILE)
+        # account_id -> {"interval", "next_due", "last_refreshed", "failures"}
+        self.accounts = {}
+        self.mtime_ns = None
+        self.reload()
+
+    def __contains__(self, account_id):
+        return account_id in self.accounts
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def reload(self):
+        """Re-read the file if another process changed it"""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == self.mtime_ns:
+            return
+        try:
+            with open(self.path) as f:
+                self.accounts = json.load(f).get("accounts", {})
+            self.mtime_ns = mtime_ns
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read watchlist %s: %s", self.path, e)
+
+    def save(self):
+        """Write the watchlist; accounts another process watched or unwatched since our last read are kept that way"""
+        try:
+            changed = os.stat(self.path).st_mtime_ns != self.mtime_ns
+        except FileNotFoundError:
+            changed = False
+        if changed:
+            ours = self.accounts
+            self.mtime_ns = None
+            self.reload()
+            self.accounts = {account_id: ours.get(account_id, entry) for account_id, entry in self.accounts.items()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"accounts": self.accounts}, f)
+        os.replace(tmp_path, self.path)
+        self.mtime_ns = os.stat(self.path).st_mtime_ns
+
+    def watch(self, account_id):
+        validate_account_id(account_id)
+        if account_id not in self.accounts:
+            self.accounts[account_id] = {"interval": WATCH_MIN_INTERVAL, "next_due": 0, "last_refreshed": None,
+                                         "failures": 0}
+        return self.accounts[account_id]
+
+    def unwatch(self, account_id):
+        return self.accounts.pop(account_id, None) is not None
+
+    def get_due(self, now=None):
+        """Watched accounts whose refresh is due, most overdue first"""
+        now = time.time() if now is None else now
+        due = [(entry["next_due"], account_id) for account_id, entry in self.accounts.items() if entry["next_due"] <= now]
+        return [account_id for _, account_id in sorted(due)]
+
+    def get_next_due(self):
+        return min((entry["next_due"] for entry in self.accounts.values()), default=None)
+
+    def record_refresh(self, account_id, interval, now=None):
+        now = time.time() if now is None else now
+        entry = self.watch(account_id)
+        entry.update(interval=interval, next_due=now + interval, last_refreshed=now, failures=0)
+
+    def record_failure(self, account_id, now=None):
+        """Back off exponentially after failed refreshes"""
+        now = time.time() if now is None else now
+        entry = self.watch(account_id)
+        entry["failures"] += 1
+        entry["next_due"] = now + min(WATCH_MAX_INTERVAL, entry["interval"] * 2 ** entry["failures"])
+
+    def get_stale_window(self, account_id):
+        entry = self.accounts.get(account_id)
+        return entry["interval"] * WATCH_STALE_INTERVALS if entry else 0
+
+    def apply(self, cache, tx_sync):
+        """Let the response cache and transaction sync treat watched accounts' data as fresh between refreshes"""
+        cache.account_stale = {account_id: self.get_stale_window(account_id) for account_id in self.accounts}
+        tx_sync.fresh_for = dict(cache.account_stale)